@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import os
+import pymongo
+from contextlib import asynccontextmanager
+from datetime import datetime
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from domain.account import Account
+from domain.atomic_change import AtomicChange
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.transaction import Transaction
+from . import consistency, queries
+from .db_monitor import monitor, pool_options
+from .logs import redacted
+from typing import List
+
+# the asyncio counterpart of Db - same methods, same documents, but every call is awaited on the event loop rather than
+# blocking a threadpool thread. selected with DB_BACKEND=async. see db.py for notes on the connection string
+
+log = logging.getLogger(__name__)
+
+
+class AsyncDb:
+    def __init__(self, snapshot_interval: int = None) -> None:
+        self.__snapshot_interval = int(os.environ.get('SNAPSHOT_INTERVAL', 1000)) if snapshot_interval is None else snapshot_interval
+        # motor ties a client to the event loop it is made on, so the client is made on first use from the running loop
+        # rather than here at import time, where there is no loop yet or not the one asyncio.run will start
+        self.__client = None
+        self.__loop = None
+
+
+    async def get_user(self, name: str, secondary_ok=False):
+        async with self.__reading(secondary_ok) as (db, session):
+            users = db.get_collection("users")
+            return await users.find_one({ "username": name }, session=session)
+
+
+    async def insert_user(self, user) -> str:
+        users = self.__database().get_collection("users")
+        async with self.__session() as session:
+            result = await users.insert_one(user.__dict__, session=session)
+        id: str = (result.inserted_id)
+        return id
+
+
+    async def update_password_hash(self, user_id, hashed_password):
+        users = self.__database().get_collection("users")
+        result = await users.update_one({ '_id': ObjectId(user_id) }, { '$set': { 'hashed_password': hashed_password } })
+        return result.modified_count > 0
+
+
+    async def get_revoked_users(self, since):
+        users = self.__database().get_collection("users")
+        return await users.find(queries.revoked_users(since), { 'disabled': 1, 'tokens_revoked_at': 1 }).to_list(length=None)
+
+
+    async def revoke_user_tokens(self, user_id, when):
+        users = self.__database().get_collection("users")
+        result = await users.update_one({ '_id': ObjectId(user_id) }, { '$set': { 'tokens_revoked_at': when } })
+        return result.modified_count > 0
+
+
+    async def get_account(self, owner_id, account_id, projection=None, secondary_ok=False):
+        async with self.__reading(secondary_ok) as (db, session):
+            accounts = db.get_collection("accounts")
+            return await accounts.find_one({ '_id': ObjectId(account_id), 'owner_id': owner_id}, projection, session=session)
+
+
+    async def list_transactions(self, owner_id, account_id, before_tx_id, take, secondary_ok=False):
+        query = queries.tx_before(owner_id, account_id, before_tx_id)
+        async with self.__reading(secondary_ok) as (db, session):
+            transactions = db.get_collection("transactions")
+            return await transactions.find(query, { '_id': 0 }, session=session).sort('tx_id', direction=pymongo.DESCENDING).limit(take).to_list(length=take)
+
+
+    # the original page/size listing, oldest first, sought to from page*take as tx ids are sequential from 0
+    async def get_transactions(self, owner_id, account_id, page, take, secondary_ok=False):
+        query = queries.tx_page(owner_id, account_id, page, take)
+        async with self.__reading(secondary_ok) as (db, session):
+            transactions = db.get_collection("transactions")
+            return await transactions.find(query, { '_id': 0 }, session=session).sort('tx_id', direction=pymongo.ASCENDING).limit(take).to_list(length=take)
+
+
+    async def iter_transactions(self, owner_id, account_id, batch_size, after_tx_id=None, until_tx_id=None, secondary_ok=False):
+        async with self.__reading(secondary_ok) as (db, session):
+            transactions = db.get_collection("transactions")
+            cursor = transactions.find(queries.tx_range(owner_id, account_id, after_tx_id, until_tx_id), { '_id': 0 }, batch_size=batch_size, session=session).sort('tx_id', direction=pymongo.ASCENDING)
+            while True:
+                docs = await cursor.to_list(length=batch_size)
+                if not docs: return
+                yield docs
+
+
+    async def get_import_checkpoint(self, import_id):
+        imports = self.__database().get_collection("imports")
+        doc = await imports.find_one({ '_id': import_id })
+        return doc["row"] if doc else -1
+
+
+    # the statement references out of refs that the account's transactions already carry
+    async def get_references(self, owner_id, account_id, refs):
+        transactions = self.__database().get_collection("transactions")
+        return await transactions.distinct('reference', queries.references(owner_id, account_id, refs))
+
+
+    async def get_transaction(self, owner_id, account_id, tx_id):
+        transactions = self.__database().get_collection("transactions")
+        return await transactions.find_one({'account_id': account_id, 'owner_id': owner_id, 'tx_id': tx_id})
+
+
+    async def get_last_transaction(self, owner_id, account_id, secondary_ok=False):
+        async with self.__reading(secondary_ok) as (db, session):
+            transactions = db.get_collection("transactions")
+            docs = await transactions.find({ 'account_id': account_id, 'owner_id': owner_id}, session=session).sort('tx_id', direction=pymongo.DESCENDING).limit(1).to_list(length=1)
+            return docs[0] if docs else None
+
+
+    # the newest transaction made at or before a date
+    async def get_transaction_at(self, owner_id, account_id, when):
+        transactions = self.__database().get_collection("transactions")
+        return await transactions.find_one({ 'account_id': account_id, 'owner_id': owner_id, 'date': { '$lte': when } }, sort=[('tx_id', pymongo.DESCENDING)])
+
+
+    # the latest snapshot of an account, or the latest taken at or before until_tx_id
+    async def get_snapshot(self, account_id, until_tx_id=None):
+        snapshots = self.__database().get_collection("snapshots")
+        query = { 'account_id': account_id }
+        if until_tx_id is not None: query['tx_id'] = { '$lte': until_tx_id }
+        return await snapshots.find_one(query, sort=[('tx_id', pymongo.DESCENDING)])
+
+
+    async def save_snapshot(self, account: Account):
+        snapshots = self.__database().get_collection("snapshots")
+        result = await snapshots.replace_one(*queries.snapshot(account), upsert=True)
+        return result.acknowledged
+
+
+    async def create_account(self, account: Account):
+        accounts = self.__database().get_collection("accounts")
+        async with self.__session() as session:
+            result = await accounts.insert_one(account.to_doc(), session=session)
+        return result.inserted_id
+
+
+    async def open_account(self, account: Account):
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                txs = self.__database().get_collection("transactions")
+                result = await accounts.replace_one({'_id': ObjectId(account.id)}, account.to_doc(), session=session)
+                await txs.insert_one(account.last_tx.to_doc(), session=session)
+                return result.modified_count > 0
+
+
+    async def add_payment_source(self, account_id, payment_source: PaymentSource):
+        accounts = self.__database().get_collection("accounts")
+        async with self.__session() as session:
+            result = await accounts.update_one({ '_id': ObjectId(account_id)}, { '$push': {'payment_sources': payment_source.to_doc() }}, session=session)
+        return result.modified_count > 0
+
+
+    async def replace_payment_source(self, account_id, payment_source_id, payment_source: PaymentSource):
+        accounts = self.__database().get_collection("accounts")
+        async with self.__session() as session:
+            result = await accounts.update_one({ '_id': ObjectId(account_id)}, { '$set': { f'payment_sources.{payment_source_id}': payment_source.to_doc() }}, session=session)
+        return result.modified_count > 0
+
+
+    async def add_envelope(self, account_id, envelope):
+        accounts = self.__database().get_collection("accounts")
+        async with self.__session() as session:
+            result = await accounts.update_one({ '_id': ObjectId(account_id)}, { '$push': {'envelopes': envelope.to_doc() }}, session=session)
+        return result.modified_count > 0
+
+
+    async def add_envelopes(self, account_id, envelopes):
+        docs = list(map(lambda b: b.to_doc(), envelopes))
+        accounts = self.__database().get_collection("accounts")
+        async with self.__session() as session:
+            result = await accounts.update_one({ '_id': ObjectId(account_id)}, { '$push': {'envelopes': { '$each':  docs } }}, session=session)
+        return result.modified_count > 0
+
+
+    async def rename_envelope(self, account_id, envelope_id, new_name):
+        accounts = self.__database().get_collection("accounts")
+        async with self.__session() as session:
+            result = await accounts.update_one({ '_id': ObjectId(account_id)}, { '$set': { f"envelopes.{envelope_id}.name": new_name } }, session=session)
+        return result.modified_count > 0
+
+
+    async def save_envelope_change(self, account: Account, envelope: Envelope):
+        # wrap two updates in an auto-commited transaction (auto-rollback on error)
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                transactions = self.__database().get_collection("transactions")
+                result1 = await accounts.update_one(queries.versioned(account), queries.account_save(account, [envelope], [account.last_tx]), session=session)
+                queries.check_version(result1)
+                result2 = await transactions.insert_one(account.last_tx.to_doc(), session=session)
+                if queries.snapshot_due(account.version, account.last_tx_id, self.__snapshot_interval): await self.__snapshot(account, session)
+                return result1.modified_count == 1 and result2.acknowledged
+
+
+    async def save_envelope_changes(self, account: Account, from_envelope: Envelope, to_envelope: Envelope):
+        # wrap two updates in an auto-commited transaction (auto-rollback on error)
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                transactions = self.__database().get_collection("transactions")
+                result1 = await accounts.update_one(queries.versioned(account), queries.account_save(account, [from_envelope, to_envelope], [account.last_tx]), session=session)
+                queries.check_version(result1)
+                result2 = await transactions.insert_one(account.last_tx.to_doc(), session=session)
+                if queries.snapshot_due(account.version, account.last_tx_id, self.__snapshot_interval): await self.__snapshot(account, session)
+                return result1.modified_count == 1 and result2.acknowledged
+
+
+    async def save_all_envelopes(self, account: Account, envelopes: List[Envelope]):
+        # wrap two updates in an auto-commited transaction (auto-rollback on error)
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                transactions = self.__database().get_collection("transactions")
+                result1 = await accounts.update_one(queries.versioned(account), queries.account_save(account, envelopes, [account.last_tx]), session=session)
+                queries.check_version(result1)
+                result2 = await transactions.insert_one(account.last_tx.to_doc(), session=session)
+                if queries.snapshot_due(account.version, account.last_tx_id, self.__snapshot_interval): await self.__snapshot(account, session)
+                return result1.modified_count == 1 and result2.acknowledged
+
+
+    async def save_batch(self, account: Account, envelopes: List[Envelope], txs: List[Transaction], checkpoint: dict = None):
+        # wrap two updates in an auto-commited transaction (auto-rollback on error)
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                transactions = self.__database().get_collection("transactions")
+                result1 = await accounts.update_one(queries.versioned(account), queries.account_save(account, envelopes, txs), session=session)
+                queries.check_version(result1)
+                result2 = await transactions.insert_many([t.to_doc() for t in txs], session=session)
+                if queries.snapshot_due(account.version, account.last_tx_id, self.__snapshot_interval): await self.__snapshot(account, session)
+                if checkpoint:
+                    imports = self.__database().get_collection("imports")
+                    await imports.update_one({ '_id': checkpoint["import_id"] }, { '$set': { "account_id": str(account.id), "row": checkpoint["row"], "updated": datetime.utcnow() } }, upsert=True, session=session)
+                return result1.modified_count == 1 and len(result2.inserted_ids) == len(txs)
+
+
+    async def save_all_changes_after_undo(self, account: Account, envelopes: List[Envelope]):
+        # wrap two updates in an auto-commited transaction (auto-rollback on error)
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                transactions = self.__database().get_collection("transactions")
+                snapshots = self.__database().get_collection("snapshots")
+                result1 = await accounts.update_one(queries.versioned(account), { '$set': queries.balance_changes(account, envelopes), '$pop': { 'recent_txs': 1 } }, session=session)
+                queries.check_version(result1)
+                result2 = await transactions.delete_one({'account_id': str(account.id), 'tx_id': account.last_tx_id+1}, session=session)
+                # a snapshot taken at or after the undone transaction no longer matches the history
+                await snapshots.delete_many({'account_id': str(account.id), 'tx_id': { '$gte': account.last_tx_id+1 }}, session=session)
+                return result1.modified_count == 1 and result2.deleted_count == 1
+
+
+    # overwrite an account's balances and transaction state with those rebuilt from its history. version is the last_tx_id
+    # of the stored document so a write made while the history was being replayed fails the save rather than being lost
+    async def repair_account(self, account: Account, version):
+        accounts = self.__database().get_collection("accounts")
+        changes = queries.balance_changes(account, account.list_envelopes())
+        changes["recent_txs"] = account.to_doc()["recent_txs"]
+        result = await accounts.update_one({ '_id': ObjectId(account.id), 'last_tx_id': version }, { '$set': changes })
+        queries.check_version(result)
+        return result.modified_count == 1
+
+
+    # the client for the running loop. a CLI that runs more than one loop gets a new client on each
+    def __connect(self):
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            if self.__client is not None: self.__client.close()
+            log.info("creating async database", extra={ "connection": redacted(os.environ['DB_CONNECTION_STRING']) })
+            self.__client = AsyncIOMotorClient(os.environ['DB_CONNECTION_STRING'], event_listeners=[monitor], **pool_options())
+            self.__loop = loop
+        return self.__client
+
+
+    # the connection string pins reads to the primary. reads made with secondary_ok go through DB_READ_PREFERENCE instead
+    def __database(self, secondary_ok=False):
+        client = self.__connect()
+        return client.get_database("nvelopes", read_preference=consistency.read_preference()) if secondary_ok else client["nvelopes"]
+
+
+    # saves that pass a multiple of SNAPSHOT_INTERVAL snapshot the account in the same transaction, see
+    # queries.snapshot_due, so an undo that removes the snapshot can never run in between
+    async def __snapshot(self, account: Account, session):
+        snapshots = self.__database().get_collection("snapshots")
+        await snapshots.replace_one(*queries.snapshot(account), upsert=True, session=session)
+
+
+    # a session for writes that records the operation time they were given, see consistency.py
+    @asynccontextmanager
+    async def __session(self):
+        async with await self.__connect().start_session() as session:
+            yield session
+            consistency.wrote(session.operation_time)
+
+
+    # the database to read from and the session to read in, see Db.__reading
+    @asynccontextmanager
+    async def __reading(self, secondary_ok):
+        after = consistency.read_after() if secondary_ok else None
+        if after is None:
+            yield self.__database(secondary_ok), None
+            return
+        async with await self.__connect().start_session(causal_consistency=True) as session:
+            session.advance_operation_time(after)
+            yield self.__database(True), session
+
+
+    # check and apply a deposit, debit or move in the database in one conditional update without loading the account first.
+    # returns the appended transaction, or None if the account, an envelope or the guard didn't match
+    async def apply_change(self, owner_id, account_id, change: AtomicChange):
+        async with self.__session() as session:
+            async with session.start_transaction():
+                accounts = self.__database().get_collection("accounts")
+                transactions = self.__database().get_collection("transactions")
+                query = queries.change_filter(owner_id, account_id, change)
+                doc = await accounts.find_one_and_update(query, change.to_update(), projection=change.projection(), return_document=pymongo.ReturnDocument.AFTER, session=session)
+                if doc is None: return None
+                tx = change.transaction(doc)
+                # an update can't copy the values it produces into what it pushes, so the transaction, which is only known
+                # once the update has returned, is appended to the recent ones by a second small update
+                await accounts.update_one({ '_id': doc['_id'] }, { '$push': queries.recent([tx]) }, session=session)
+                await transactions.insert_one(tx.to_doc(), session=session)
+                if queries.snapshot_due(tx.id - 1, tx.id, self.__snapshot_interval):
+                    await self.__snapshot(Account.from_doc(await accounts.find_one({ '_id': doc['_id'] }, session=session)), session)
+                return tx
+
@@ -1,34 +1,48 @@
+import logging
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from .models import TokenData, User, UserInDB
+from .models import TokenData, TokenUser, User, UserInDB
 from .db import db
+from .hashing import HashingPool
+from .revocation import RevocationList
+
+log = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# users who are disabled or have logged out - checked for every token regardless of the auth mode
+revocations = RevocationList(db, float(os.environ.get('AUTH_REVOCATION_REFRESH', 30)), timedelta(minutes=float(os.environ.get('JWT_EXPIRES', 15))))
+
+# bcrypt runs in its own process pool. HASH_POOL_QUEUE_LIMIT is how many requests may wait for a free process before new ones are rejected
+hasher = HashingPool(int(os.environ.get('HASH_POOL_SIZE', os.cpu_count() or 1)), int(os.environ.get('HASH_POOL_QUEUE_LIMIT', 32)), int(os.environ.get('BCRYPT_ROUNDS', 12)))
 
 # generate a secret key using openssl rand -hex 32
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    valid, _ = await hasher.verify(plain_password, hashed_password)
+    return valid
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await hasher.hash(password)
 
 
-def authenticate_user(db, username: str, password: str):
-    print("authenticate_user")
-    user = __get_user(db, username)
+async def authenticate_user(db, username: str, password: str):
+    log.debug("authenticate user", extra={ "username": username })
+    user = await __get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await hasher.verify(password, user.hashed_password)
+    if not valid:
         return False
+    # the password was hashed with a different cost to the one now configured so take the chance to rehash it
+    if new_hash:
+        await db.update_password_hash(user.user_id, new_hash)
     return user
 
 
@@ -38,13 +52,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # iat keeps the fractions of a second so a token issued just after a logout is told apart from one issued just before
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, os.environ['JWT_SECRET_KEY'], algorithm=os.environ['JWT_ALGORITHM'])
     return encoded_jwt
 
 
-def __get_current_user(token: str = Depends(oauth2_scheme)):
-    print("get_current_user")
+# the claims signed into a user's access token. in stateless mode these are trusted instead of looking the user up on every request
+def token_claims(user: UserInDB) -> dict:
+    return { "sub": user.username, "uid": user.user_id, "name": user.full_name, "email": user.email, "disabled": bool(user.disabled) }
+
+
+# AUTH_MODE=lookup loads the user from the database for every request, AUTH_MODE=stateless trusts the signed token claims
+def __stateless() -> bool:
+    return os.environ.get('AUTH_MODE', 'lookup') == 'stateless'
+
+
+async def __get_current_user(token: str = Depends(oauth2_scheme)):
+    log.debug("get current user")
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -55,16 +80,21 @@ def __get_current_user(token: str = Depends(oauth2_scheme)):
         username: str = payload.get("sub")
         if username is None: raise credentials_exception
         token_data = TokenData(username=username)
-        user = __get_user(db, username=token_data.username)
+        # tokens issued before stateless mode was enabled carry no user id so fall back to the lookup
+        if __stateless() and "uid" in payload:
+            user = TokenUser(username=token_data.username, user_id=payload["uid"], full_name=payload.get("name"), email=payload.get("email"), disabled=payload.get("disabled"))
+        else:
+            user = await __get_user(db, username=token_data.username)
         if user is None: raise credentials_exception
+        if revocations.is_revoked(user.user_id, payload.get("iat")): raise credentials_exception
         return user
     except JWTError:
         raise credentials_exception
 
 
-def __get_user(db, username: str):
-    print("get_user: " + username)
-    match = db.get_user(username)    
+async def __get_user(db, username: str):
+    log.debug("get user", extra={ "username": username })
+    match = await db.get_user(username)
     user = UserInDB(**match) if match else None
     if user:
         user.user_id = str(match["_id"])
@@ -72,8 +102,16 @@ def __get_user(db, username: str):
 
 
 async def get_current_active_user(current_user: User = Depends(__get_current_user)):
-    print("get_current_active_user")
+    log.debug("get current active user", extra={ "username": current_user.username })
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+
+# reject every token issued to the user up until now
+async def revoke_tokens(user: TokenUser):
+    when = datetime.utcnow()
+    # the database keeps milliseconds, so round up to one to have the revocation mean the same after a refresh
+    when += timedelta(microseconds=-when.microsecond % 1000)
+    await db.revoke_user_tokens(user.user_id, when)
+    revocations.revoke(user.user_id, when)
@@ -0,0 +1,56 @@
+import asyncio
+import random
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# optimistic concurrency for account documents. an account's last_tx_id is its version: every save filters on the value
+# that was read and fails with ConcurrencyError if another request has written to the account in the meantime, rather
+# than silently overwriting its balances and reusing its tx_id
+
+
+# raised by a save when the account has changed since it was loaded
+class ConcurrencyError(Exception):
+    pass
+
+
+# the server reports two transactions writing the same account as a transient write conflict and a reused tx_id as a
+# duplicate key, both of which mean the same as a failed version check
+def is_conflict(e: Exception) -> bool:
+    if isinstance(e, (ConcurrencyError, DuplicateKeyError)): return True
+    return isinstance(e, PyMongoError) and e.has_error_label("TransientTransactionError")
+
+
+# runs a load, apply, save operation again from the start when it loses a race, waiting a random (full jitter) and
+# exponentially growing time between attempts so that competing writers spread out instead of colliding again
+class ConflictRetry:
+
+    def __init__(self, retries: int, backoff_ms: float) -> None:
+        self.__retries = retries
+        self.__backoff_ms = backoff_ms
+        self.__attempts = 0
+        self.__conflicts = 0
+        self.__exhausted = 0
+
+
+    # operation is a coroutine function that must reload the account each time it is called
+    async def run(self, operation):
+        for attempt in range(self.__retries + 1):
+            self.__attempts += 1
+            try:
+                return await operation()
+            except Exception as e:
+                if not is_conflict(e): raise
+                self.__conflicts += 1
+            if attempt < self.__retries:
+                await asyncio.sleep(random.uniform(0, self.__backoff_ms * 2 ** attempt) / 1000)
+        self.__exhausted += 1
+        raise ConcurrencyError(f"the account is being changed by other requests, gave up after {self.__retries + 1} attempts")
+
+
+    def stats(self) -> dict:
+        return {
+            "max_retries": self.__retries,
+            "backoff_ms": self.__backoff_ms,
+            "attempts": self.__attempts,
+            "conflicts": self.__conflicts,
+            "exhausted": self.__exhausted
+        }
@@ -0,0 +1,102 @@
+import base64
+import json
+import os
+from contextvars import ContextVar
+from bson.timestamp import Timestamp
+from pymongo.read_preferences import Nearest, PrimaryPreferred, ReadPreference, Secondary, SecondaryPreferred
+
+# read-your-writes when GET endpoints read from secondaries. every write records the operation time the server gave it
+# and the response carries the latest in an X-Read-After header. a client that sends it back on its next requests has
+# them read in a causally consistent session, which makes the secondary wait until it has applied that write, so a
+# deposit never disappears from the balance the client reads next. a request without one reads whatever the secondary
+# has, at most DB_MAX_STALENESS seconds behind the primary
+
+HEADER = "X-Read-After"
+MODES = { "primaryPreferred": PrimaryPreferred, "secondaryPreferred": SecondaryPreferred, "secondary": Secondary, "nearest": Nearest }
+
+
+# DB_READ_PREFERENCE=primary (the default) keeps every read on the primary
+def routed() -> bool:
+    return os.environ.get('DB_READ_PREFERENCE', 'primary') != 'primary'
+
+
+# the read preference for reads made with secondary_ok. the server's minimum max staleness is 90 seconds
+def read_preference():
+    mode = os.environ.get('DB_READ_PREFERENCE', 'primary')
+    if mode == 'primary': return ReadPreference.PRIMARY
+    if mode not in MODES: raise ValueError(f"unknown DB_READ_PREFERENCE '{mode}', expected primary or one of {list(MODES)}")
+    return MODES[mode](max_staleness=int(os.environ.get('DB_MAX_STALENESS', 90)))
+
+
+# tokens are opaque to clients, like paging cursors
+def encode_token(op_time: Timestamp) -> str:
+    raw = json.dumps({ "t": op_time.time, "i": op_time.inc }, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token: str) -> Timestamp:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return Timestamp(raw["t"], raw["i"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid read token")
+
+
+# what one request has to read after and the latest write it made
+class ReadAfter:
+    def __init__(self, after: Timestamp = None) -> None:
+        self.after = after
+        self.wrote = None
+
+
+__current = ContextVar("read_after", default=None)
+
+
+# the operation time a read in this request has to wait for, if any
+def read_after():
+    state = __current.get()
+    return state.after if state else None
+
+
+# called by the database with each write's operation time. reads later in the same request wait for it too
+def wrote(op_time: Timestamp) -> None:
+    state = __current.get()
+    if state is None or op_time is None: return
+    if state.wrote is None or op_time > state.wrote: state.wrote = op_time
+    if state.after is None or op_time > state.after: state.after = op_time
+
+
+# start a request's state from the token it sent, ignoring one that can't be read as the request can still be served
+def begin(token: str):
+    try:
+        state = ReadAfter(decode_token(token) if token else None)
+    except ValueError:
+        state = ReadAfter()
+    return state, __current.set(state)
+
+
+def end(reset) -> None:
+    __current.reset(reset)
+
+
+# asgi middleware that reads the token from each request and adds one to the response when the request wrote anything.
+# the state is shared with the threadpool threads the blocking driver runs on, which get a copy of the context
+class ReadAfterMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        token = dict(scope["headers"]).get(HEADER.lower().encode())
+        state, reset = begin(token.decode() if token else None)
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and state.wrote is not None:
+                message = dict(message, headers=list(message.get("headers", [])) + [(HEADER.lower().encode(), encode_token(state.wrote).encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            end(reset)
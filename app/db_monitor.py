@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from pymongo import monitoring
+
+# what the mongo client is doing, to tell whether slow requests are waiting for a pooled connection, for the server or
+# for a transaction to commit. the client reports every pool and command event to one DbMonitor, which keeps running
+# counts and times that metrics.DatabaseCollector reports on GET /metrics. latencies are in seconds
+
+
+# DB_MAX_POOL_SIZE, DB_MIN_POOL_SIZE, DB_WAIT_QUEUE_TIMEOUT_MS and DB_MAX_IDLE_TIME_MS tune the connection pool of each
+# server. any that aren't set keep the driver's defaults
+def pool_options() -> dict:
+    names = { 'maxPoolSize': 'DB_MAX_POOL_SIZE', 'minPoolSize': 'DB_MIN_POOL_SIZE', 'waitQueueTimeoutMS': 'DB_WAIT_QUEUE_TIMEOUT_MS', 'maxIdleTimeMS': 'DB_MAX_IDLE_TIME_MS' }
+    return { option: int(os.environ[name]) for option, name in names.items() if os.environ.get(name) }
+
+
+# count, total and max of a latency
+class Timing:
+    def __init__(self) -> None:
+        self.count = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.seconds_max = 0.0
+
+
+    def record(self, seconds: float, ok: bool = True) -> None:
+        self.count += 1
+        if not ok: self.failures += 1
+        self.seconds += seconds
+        self.seconds_max = max(self.seconds_max, seconds)
+
+
+    def to_doc(self) -> dict:
+        return { "count": self.count, "failures": self.failures, "seconds_avg": self.seconds / self.count if self.count else 0.0, "seconds_max": self.seconds_max }
+
+
+class DbMonitor(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        # a connection is checked out on the thread that asked for it, so the wait is timed per thread
+        self.__waiting = threading.local()
+        self.__checkout = Timing()
+        self.__checkout_failures = {}
+        # per server address: connections open and checked out
+        self.__open = {}
+        self.__in_use = {}
+        self.__in_use_max = 0
+        # commands by request id while they run, then timings by "command collection" e.g. "find accounts"
+        self.__running = {}
+        self.__commands = {}
+        # the transaction number of the last commit sent on each session, to spot the driver retrying one
+        self.__commits = {}
+        self.__transactions = { "started": 0, "committed": 0, "commit_failures": 0, "commit_retries": 0, "aborted": 0 }
+
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "pool": {
+                    "options": pool_options(),
+                    "open": sum(self.__open.values()),
+                    "in_use": sum(self.__in_use.values()),
+                    "in_use_max": self.__in_use_max,
+                    "servers": { f"{host}:{port}": { "open": self.__open.get((host, port), 0), "in_use": self.__in_use.get((host, port), 0) } for host, port in self.__open },
+                    "checkout_wait": self.__checkout.to_doc(),
+                    "checkout_failures": dict(self.__checkout_failures)
+                },
+                "commands": { name: t.to_doc() for name, t in sorted(self.__commands.items()) },
+                "transactions": dict(self.__transactions)
+            }
+
+
+    # pool events
+
+    def connection_check_out_started(self, event) -> None:
+        self.__waiting.start = time.perf_counter()
+
+
+    def connection_checked_out(self, event) -> None:
+        waited = time.perf_counter() - getattr(self.__waiting, "start", time.perf_counter())
+        with self.__lock:
+            self.__checkout.record(waited)
+            self.__in_use[event.address] = self.__in_use.get(event.address, 0) + 1
+            self.__in_use_max = max(self.__in_use_max, sum(self.__in_use.values()))
+
+
+    # reason is timeout when DB_WAIT_QUEUE_TIMEOUT_MS passed without a connection coming free
+    def connection_check_out_failed(self, event) -> None:
+        waited = time.perf_counter() - getattr(self.__waiting, "start", time.perf_counter())
+        with self.__lock:
+            self.__checkout.record(waited, ok=False)
+            self.__checkout_failures[event.reason] = self.__checkout_failures.get(event.reason, 0) + 1
+
+
+    def connection_checked_in(self, event) -> None:
+        with self.__lock:
+            self.__in_use[event.address] = self.__in_use.get(event.address, 0) - 1
+
+
+    def connection_created(self, event) -> None:
+        with self.__lock:
+            self.__open[event.address] = self.__open.get(event.address, 0) + 1
+
+
+    def connection_closed(self, event) -> None:
+        with self.__lock:
+            self.__open[event.address] = self.__open.get(event.address, 0) - 1
+
+
+    def connection_ready(self, event) -> None:
+        pass
+
+
+    def pool_created(self, event) -> None:
+        pass
+
+
+    def pool_ready(self, event) -> None:
+        pass
+
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+
+    def pool_closed(self, event) -> None:
+        pass
+
+
+    # command events
+
+    def started(self, event) -> None:
+        command = event.command
+        # most commands name their collection, getMore names it separately and commitTransaction etc. have none
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore": collection = command.get("collection")
+        name = f"{event.command_name} {collection}" if isinstance(collection, str) else event.command_name
+        with self.__lock:
+            self.__running[event.request_id] = name
+            if command.get("startTransaction"): self.__transactions["started"] += 1
+            if event.command_name == "commitTransaction" and "lsid" in command:
+                session = command["lsid"]["id"]
+                if self.__commits.get(session) == command.get("txnNumber"): self.__transactions["commit_retries"] += 1
+                self.__commits[session] = command.get("txnNumber")
+
+
+    def succeeded(self, event) -> None:
+        self.__finished(event, True)
+
+
+    def failed(self, event) -> None:
+        self.__finished(event, False)
+
+
+    def __finished(self, event, ok: bool) -> None:
+        with self.__lock:
+            name = self.__running.pop(event.request_id, event.command_name)
+            self.__commands.setdefault(name, Timing()).record(event.duration_micros / 1_000_000, ok)
+            if event.command_name == "commitTransaction": self.__transactions["committed" if ok else "commit_failures"] += 1
+            if event.command_name == "abortTransaction": self.__transactions["aborted"] += 1
+
+
+# the one monitor every client reports to
+monitor = DbMonitor()
@@ -0,0 +1,41 @@
+import csv
+import io
+import orjson
+from datetime import datetime
+from . import views
+
+# encoders for the transaction export. each batch of raw documents from the cursor is turned into one chunk of the response
+# body without building Transaction objects, so the response is written to the wire as the cursor is read. amounts are
+# written in major units like every other response
+
+CSV_COLUMNS = ["tx_id", "date", "op", "description", "envelope", "envelope_id_src", "envelope_id_dest", "amount", "account_balance", "pay_envelopes"]
+
+
+# orjson writes datetimes as ISO 8601 itself, anything else it doesn't know is written as a string
+def __default(value):
+    return str(value)
+
+
+async def ndjson(batches):
+    async for docs in batches:
+        yield b"".join(orjson.dumps(views.transaction(d), default=__default) + b"\n" for d in docs)
+
+
+async def csv_rows(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    async for docs in batches:
+        for d in map(views.transaction, docs):
+            writer.writerow([__cell(d.get(c)) for c in CSV_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # an empty history still gets its header row
+    if buffer.tell(): yield buffer.getvalue()
+
+
+def __cell(value):
+    if isinstance(value, datetime): return value.isoformat()
+    if isinstance(value, list): return orjson.dumps(value, default=__default).decode()
+    return "" if value is None else value
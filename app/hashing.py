@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+
+
+# raised when the pool already has as much hashing work as it is allowed to queue
+class HashingPoolFull(Exception):
+    pass
+
+
+# the functions below run inside the pool's worker processes so must be module level for pickling.
+# each process keeps one CryptContext per cost. pinning min/max rounds to the cost means hashes made at any other cost need updating
+__contexts = {}
+
+def __context(rounds: int) -> CryptContext:
+    if rounds not in __contexts:
+        __contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+    return __contexts[rounds]
+
+
+def _verify(password: str, hashed: str, rounds: int):
+    start = time.perf_counter()
+    valid, new_hash = __context(rounds).verify_and_update(password, hashed)
+    return (valid, new_hash), time.perf_counter() - start
+
+
+def _hash(password: str, rounds: int):
+    start = time.perf_counter()
+    hashed = __context(rounds).hash(password)
+    return hashed, time.perf_counter() - start
+
+
+# a bounded process pool dedicated to bcrypt so that login storms can't starve the threads serving every other endpoint
+class HashingPool:
+
+    def __init__(self, size: int, queue_limit: int, rounds: int) -> None:
+        self.__size = size
+        self.__queue_limit = queue_limit
+        self.__rounds = rounds
+        self.__executor = None
+        self.__lock = threading.Lock()
+        self.__pending = 0
+        self.__completed = 0
+        self.__failed = 0
+        self.__rejected = 0
+        self.__hash_seconds = 0.0
+        self.__hash_seconds_max = 0.0
+        self.__total_seconds = 0.0
+        self.__total_seconds_max = 0.0
+
+
+    # returns (valid, new_hash). new_hash is only set when the stored hash was made with a different cost than the one configured
+    async def verify(self, password: str, hashed: str):
+        return await self.__submit(_verify, password, hashed, self.__rounds)
+
+
+    async def hash(self, password: str) -> str:
+        return await self.__submit(_hash, password, self.__rounds)
+
+
+    def shutdown(self) -> None:
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor: executor.shutdown(wait=False)
+
+
+    # queue depth is the work waiting for a free process, latencies are in seconds
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "pool_size": self.__size,
+                "queue_limit": self.__queue_limit,
+                "bcrypt_rounds": self.__rounds,
+                "in_flight": self.__pending,
+                "queue_depth": max(0, self.__pending - self.__size),
+                "completed": self.__completed,
+                "failed": self.__failed,
+                "rejected": self.__rejected,
+                "hash_seconds_avg": self.__hash_seconds / self.__completed if self.__completed else 0.0,
+                "hash_seconds_max": self.__hash_seconds_max,
+                "total_seconds_avg": self.__total_seconds / self.__completed if self.__completed else 0.0,
+                "total_seconds_max": self.__total_seconds_max
+            }
+
+
+    async def __submit(self, fn, *args):
+        with self.__lock:
+            if self.__pending >= self.__size + self.__queue_limit:
+                self.__rejected += 1
+                raise HashingPoolFull()
+            self.__pending += 1
+            # spawn rather than fork so the workers don't inherit the parent's threads e.g. the mongo client's monitors
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(max_workers=self.__size, mp_context=multiprocessing.get_context("spawn"))
+            executor = self.__executor
+        start = time.perf_counter()
+        try:
+            result, hash_seconds = await asyncio.wrap_future(executor.submit(fn, *args))
+        except BaseException:
+            # a hash that raised or was cancelled has no latency to record, so it is only counted
+            with self.__lock:
+                self.__pending -= 1
+                self.__failed += 1
+            raise
+        self.__record(hash_seconds, time.perf_counter() - start)
+        return result
+
+
+    def __record(self, hash_seconds: float, total_seconds: float) -> None:
+        with self.__lock:
+            self.__pending -= 1
+            self.__completed += 1
+            self.__hash_seconds += hash_seconds
+            self.__hash_seconds_max = max(self.__hash_seconds_max, hash_seconds)
+            self.__total_seconds += total_seconds
+            self.__total_seconds_max = max(self.__total_seconds_max, total_seconds)
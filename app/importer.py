@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from itertools import islice
+from domain.account import Account
+from .concurrency import ConflictRetry
+from .statements import Rules, StatementLine, read_csv, read_ofx
+
+# imports a bank statement into an account. lines are streamed from the file, mapped to envelopes by the payee rules and
+# applied through Account.debit/Account.deposit in chunks. each chunk is written with one bulk insert and one account update
+# in the same database transaction as the import's checkpoint so an interrupted import can simply be run again. the
+# transactions keep the statement's dates, and lines whose reference is already on the account are skipped
+#
+#   python -m app.importer --owner <user id> --account <account id> --rules rules.json statement.csv
+#   python -m app.importer --owner <user id> --account <account id> --rules rules.json --format ofx statement.ofx
+
+
+def __chunks(lines, size):
+    iterator = iter(lines)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk: return
+        yield chunk
+
+
+# identifies a statement by its content so importing the same file twice resumes rather than duplicates
+def statement_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def import_statement(db, owner_id: str, account_id: str, lines, rules: Rules, import_id: str, chunk_size: int = 500, progress=None) -> dict:
+    conflicts = ConflictRetry(int(os.environ.get('CAS_MAX_RETRIES', 5)), float(os.environ.get('CAS_BACKOFF_MS', 5)))
+    checkpoint = await db.get_import_checkpoint(import_id)
+    start = time.perf_counter()
+    imported = 0
+    skipped = 0
+    for chunk in __chunks(lines, chunk_size):
+        pending = [line for line in chunk if line.number > checkpoint]
+        skipped += len(chunk) - len(pending)
+        if not pending: continue
+        # the chunk is reapplied to a freshly loaded account if the app writes to it while the import is running
+        async def attempt():
+            doc = await db.get_account(owner_id, account_id)
+            if not doc: raise ValueError(f"account {account_id} not found")
+            acc = Account.from_doc(doc)
+            # a line whose reference (an OFX FITID) the account already holds came in before, from this or another statement
+            references = [line.reference for line in pending if line.reference]
+            known = set(await db.get_references(owner_id, account_id, references)) if references else set()
+            txs = []
+            for line in pending:
+                if line.reference:
+                    if line.reference in known: continue
+                    known.add(line.reference)
+                __apply_line(acc, line, rules)
+                txs.append(acc.last_tx)
+            if txs: await db.save_batch(acc, acc.dirty_envelopes, txs, { "import_id": import_id, "row": pending[-1].number })
+            return len(txs)
+        applied = await conflicts.run(attempt)
+        imported += applied
+        skipped += len(pending) - applied
+        if progress: progress(imported, skipped, time.perf_counter() - start)
+    seconds = time.perf_counter() - start
+    return { "imported": imported, "skipped": skipped, "seconds": seconds, "rows_per_second": imported / seconds if seconds else 0.0 }
+
+
+def __apply_line(acc: Account, line: StatementLine, rules: Rules):
+    envelope_id = rules.match(line.payee)
+    try:
+        if line.amount < 0: return acc.debit(envelope_id, line.payee, -line.amount, line.date, line.reference or None)
+        return acc.deposit(envelope_id, line.payee, line.amount, line.date, line.reference or None)
+    except IndexError:
+        raise ValueError(f"statement line {line.number} ({line.payee}): rules map it to envelope {envelope_id} which doesn't exist")
+    except ValueError as e:
+        raise ValueError(f"statement line {line.number} ({line.payee}): {e}")
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.importer", description="import a csv or ofx bank statement into an account")
+    parser.add_argument("file")
+    parser.add_argument("--owner", required=True, help="user id of the account owner")
+    parser.add_argument("--account", required=True)
+    parser.add_argument("--rules", required=True, help="json file mapping payee patterns to envelope ids")
+    parser.add_argument("--format", choices=["csv", "ofx"], default=None, help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--import-id", default=None, help="defaults to a digest of the file so re-running the same file resumes it")
+    parser.add_argument("--date-column", default="Date")
+    parser.add_argument("--payee-column", default="Description")
+    parser.add_argument("--amount-column", default="Amount")
+    parser.add_argument("--debit-column", default=None)
+    parser.add_argument("--credit-column", default=None)
+    parser.add_argument("--reference-column", default=None, help="the bank's id for each line, lines already imported with it are skipped")
+    parser.add_argument("--date-format", default="%d/%m/%Y")
+    args = parser.parse_args(argv[1:])
+
+    from .db import db
+    rules = Rules.load(args.rules)
+    statement_format = args.format or ("ofx" if args.file.lower().endswith((".ofx", ".qfx")) else "csv")
+    import_id = f"{args.account}:{args.import_id or statement_digest(args.file)}"
+
+    def progress(imported, skipped, seconds):
+        print(f"imported {imported} rows ({skipped} already imported) {imported / seconds:.0f} rows/s", flush=True)
+
+    with open(args.file, newline="", encoding="utf-8-sig", errors="replace") as f:
+        if statement_format == "ofx":
+            lines = read_ofx(f)
+        else:
+            lines = read_csv(f, args.date_column, args.payee_column, args.amount_column, args.debit_column, args.credit_column, args.reference_column, date_format=args.date_format)
+        try:
+            result = asyncio.run(import_statement(db, args.owner, args.account, lines, rules, import_id, args.chunk_size, progress))
+        except ValueError as e:
+            print(f"import stopped: {e}. rows before this chunk are committed, fix the problem and run the import again to resume")
+            return 1
+    print(f"done: {result['imported']} rows imported, {result['skipped']} skipped as already imported, {result['rows_per_second']:.0f} rows/s")
+    return 0
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main(sys.argv))
@@ -0,0 +1,148 @@
+import logging
+import os
+import queue
+import re
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+
+# structured logging. records are put on a queue by the thread that logs them and written to stdout as one json object
+# per line by a background thread, so a request never waits on stdout. each record carries the id of the request it
+# was logged in - taken from an X-Request-ID header or made up, and returned in the response - so the lines of one
+# request can be found together. extra={...} fields are written alongside the message.
+#
+# LOG_LEVEL sets the level of every logger and LOG_LEVELS overrides it per logger e.g. app.auth=DEBUG,app.db=WARNING.
+# LOG_DEBUG_SAMPLING keeps the debug records of only a share of requests per logger e.g. app.auth=0.01, so that
+# tracing can be left on under load
+
+HEADER = "X-Request-ID"
+
+# the attributes every LogRecord has, and the copy of the message uvicorn colours for terminals. anything else was
+# passed in extra
+STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | { "message", "request_id", "color_message" }
+
+__request_id = ContextVar("request_id", default=None)
+__listener = None
+
+
+def request_id():
+    return __request_id.get()
+
+
+def begin(value: str):
+    return __request_id.set(value or uuid.uuid4().hex)
+
+
+def end(reset) -> None:
+    __request_id.reset(reset)
+
+
+# a connection string without its password
+def redacted(connection: str) -> str:
+    return re.sub(r"//([^:/@]+):[^@]*@", r"//\1:***@", connection)
+
+
+# a comma separated list of logger=value pairs
+def __pairs(value: str) -> dict:
+    pairs = [p.split("=", 1) for p in value.split(",") if "=" in p]
+    return { name.strip(): setting.strip() for name, setting in pairs }
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc = { "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(), "level": record.levelname, "logger": record.name, "message": record.getMessage() }
+        if getattr(record, "request_id", None): doc["request_id"] = record.request_id
+        doc.update({ k: v for k, v in vars(record).items() if k not in STANDARD })
+        if record.exc_info: doc["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text: doc["exception"] = record.exc_text
+        return orjson.dumps(doc, default=str).decode()
+
+
+# stamps each record with the request it was logged in, on the thread that logs it as that's where the request is known
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id()
+        return True
+
+
+# keeps a logger's debug records for a share of requests. the choice follows from the request id, so a request's
+# records are all kept or all dropped
+class DebugSampler(logging.Filter):
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.__threshold = rate * 2 ** 32
+
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG: return True
+        current = request_id()
+        return current is not None and zlib.crc32(current.encode()) < self.__threshold
+
+
+# the record is formatted by the listener thread, so only the message and any exception text are made here before the
+# record is queued, as the arguments and traceback may not outlive the call
+class BackgroundHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure() -> None:
+    global __listener
+    if __listener: return
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    handler = BackgroundHandler(records)
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    # the servers' own loggers, e.g. the access log, go through the queue as json too
+    for name in ("uvicorn", "uvicorn.access", "uvicorn.error", "gunicorn.access", "gunicorn.error"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    for name, level in __pairs(os.environ.get('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in __pairs(os.environ.get('LOG_DEBUG_SAMPLING', '')).items():
+        logging.getLogger(name).addFilter(DebugSampler(float(rate)))
+    __listener = QueueListener(records, output)
+    __listener.start()
+
+
+# writes out whatever is still queued
+def stop() -> None:
+    global __listener
+    if __listener: __listener.stop()
+    __listener = None
+
+
+# asgi middleware giving every request an id for its log records, returned in the X-Request-ID response header
+class RequestIdMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        given = dict(scope["headers"]).get(HEADER.lower().encode())
+        reset = begin(given.decode("latin-1")[:64] if given else None)
+        current = request_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [(HEADER.lower().encode(), current.encode("latin-1"))])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            end(reset)
@@ -0,0 +1,399 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from domain.account import Account
+from domain.atomic_change import AtomicChange
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.transaction import Transaction
+from .concurrency import ConcurrencyError
+from .queries import snapshot, snapshot_due
+from typing import List
+
+# an in-memory counterpart of Db - same methods, same documents, same errors - for load testing and profiling the whole
+# application in-process without a replica set. selected with DB_BACKEND=memory. nothing is persisted.
+#
+# one lock guards every collection. the writes Db wraps in a session transaction record how to reverse each change as
+# they make it and, if anything raises before the end, reverse them in the opposite order so none of it is kept. as the
+# lock is held throughout, no other request sees a transaction half applied. documents are copied in and out so callers
+# can no more change what is stored than they could with the real database. there is only the one copy so reads made
+# with secondary_ok read it like any other
+
+log = logging.getLogger(__name__)
+
+
+class MemoryDb:
+    def __init__(self, snapshot_interval: int = None) -> None:
+        log.info("creating in-memory database")
+        self.__snapshot_interval = int(os.environ.get('SNAPSHOT_INTERVAL', 1000)) if snapshot_interval is None else snapshot_interval
+        self.__lock = threading.RLock()
+        self.__users = {}
+        self.__usernames = {}
+        self.__accounts = {}
+        # per account id: tx ids in ascending order and the documents by tx id
+        self.__tx_ids = {}
+        self.__txs = {}
+        # per account id: snapshot documents by tx id
+        self.__snapshots = {}
+        self.__imports = {}
+
+
+    def get_user(self, name: str, secondary_ok=False):
+        with self.__lock:
+            id = self.__usernames.get(name)
+            return self.__copy(self.__users[id]) if id is not None else None
+
+
+    def insert_user(self, user) -> str:
+        with self.__lock:
+            if user.username in self.__usernames: raise DuplicateKeyError(f"duplicate key: username {user.username}")
+            doc = self.__copy(user.__dict__)
+            doc["_id"] = ObjectId()
+            self.__users[doc["_id"]] = doc
+            self.__usernames[doc["username"]] = doc["_id"]
+            return doc["_id"]
+
+
+    def update_password_hash(self, user_id, hashed_password):
+        return self.__set_user_field(user_id, 'hashed_password', hashed_password)
+
+
+    def get_revoked_users(self, since):
+        with self.__lock:
+            revoked = [u for u in self.__users.values() if u.get('disabled') is True or ('tokens_revoked_at' in u and u['tokens_revoked_at'] >= since)]
+            return [{ k: u[k] for k in ('_id', 'disabled', 'tokens_revoked_at') if k in u } for u in revoked]
+
+
+    def revoke_user_tokens(self, user_id, when):
+        return self.__set_user_field(user_id, 'tokens_revoked_at', when)
+
+
+    # projection limits the fields returned, as a find_one projection of top level fields does
+    def get_account(self, owner_id, account_id, projection=None, secondary_ok=False):
+        with self.__lock:
+            doc = self.__accounts.get(ObjectId(account_id))
+            if doc is None or doc['owner_id'] != owner_id: return None
+            if not projection: return self.__copy(doc)
+            fields = ['_id'] + [f for f, include in projection.items() if include and f in doc]
+            return { f: self.__copy(doc[f]) for f in fields }
+
+
+    # keyset listing newest first, without _id. before_tx_id is exclusive so pages stay stable while new transactions are appended
+    def list_transactions(self, owner_id, account_id, before_tx_id, take, secondary_ok=False):
+        with self.__lock:
+            ids = self.__tx_ids.get(account_id, [])
+            end = len(ids) if before_tx_id is None else bisect_left(ids, before_tx_id)
+            docs = (self.__txs[account_id][id] for id in reversed(ids[:end]))
+            return [self.__without_id(d) for d in self.__owned(docs, owner_id, take)]
+
+
+    # the original page/size listing, oldest first from page*take
+    def get_transactions(self, owner_id, account_id, page, take, secondary_ok=False):
+        with self.__lock:
+            ids = self.__tx_ids.get(account_id, [])
+            docs = (self.__txs[account_id][id] for id in ids[bisect_left(ids, page*take):])
+            return [self.__without_id(d) for d in self.__owned(docs, owner_id, take)]
+
+
+    # the full history oldest first, a batch at a time. the lock is only held while each batch is copied out
+    def iter_transactions(self, owner_id, account_id, batch_size, after_tx_id=None, until_tx_id=None, secondary_ok=False):
+        after = after_tx_id
+        while True:
+            with self.__lock:
+                ids = self.__tx_ids.get(account_id, [])
+                start = 0 if after is None else bisect_right(ids, after)
+                end = len(ids) if until_tx_id is None else bisect_right(ids, until_tx_id)
+                docs = (self.__txs[account_id][id] for id in ids[start:end])
+                batch = [self.__without_id(d) for d in self.__owned(docs, owner_id, batch_size)]
+            if not batch: return
+            after = batch[-1]['tx_id']
+            yield batch
+
+
+    # the last statement row committed by an import, -1 if it hasn't started
+    def get_import_checkpoint(self, import_id):
+        with self.__lock:
+            doc = self.__imports.get(import_id)
+            return doc["row"] if doc else -1
+
+
+    # the statement references out of refs that the account's transactions already carry
+    def get_references(self, owner_id, account_id, refs):
+        with self.__lock:
+            wanted = set(refs)
+            return list({ d['reference'] for d in self.__owned(self.__txs.get(account_id, {}).values(), owner_id, None) if d.get('reference') in wanted })
+
+
+    def get_transaction(self, owner_id, account_id, tx_id):
+        with self.__lock:
+            doc = self.__txs.get(account_id, {}).get(tx_id)
+            return self.__copy(doc) if doc is not None and doc['owner_id'] == owner_id else None
+
+
+    def get_last_transaction(self, owner_id, account_id, secondary_ok=False):
+        with self.__lock:
+            docs = (self.__txs[account_id][id] for id in reversed(self.__tx_ids.get(account_id, [])))
+            return next((self.__copy(d) for d in self.__owned(docs, owner_id, 1)), None)
+
+
+    # the newest transaction made at or before a date
+    def get_transaction_at(self, owner_id, account_id, when):
+        with self.__lock:
+            docs = (self.__txs[account_id][id] for id in reversed(self.__tx_ids.get(account_id, [])))
+            return next((self.__copy(d) for d in self.__owned(docs, owner_id, None) if d['date'] <= when), None)
+
+
+    # the latest snapshot of an account, or the latest taken at or before until_tx_id
+    def get_snapshot(self, account_id, until_tx_id=None):
+        with self.__lock:
+            snapshots = self.__snapshots.get(account_id, {})
+            ids = [id for id in snapshots if until_tx_id is None or id <= until_tx_id]
+            return self.__copy(snapshots[max(ids)]) if ids else None
+
+
+    def save_snapshot(self, account: Account):
+        with self.__transaction() as undo:
+            self.__snapshot(account, undo)
+            return True
+
+
+    def create_account(self, account: Account):
+        with self.__lock:
+            doc = account.to_doc()
+            doc['_id'] = ObjectId()
+            self.__accounts[doc['_id']] = doc
+            return doc['_id']
+
+
+    def open_account(self, account: Account):
+        with self.__transaction() as undo:
+            id = ObjectId(account.id)
+            existing = self.__accounts.get(id)
+            self.__put_account(id, dict(account.to_doc(), _id=id), undo)
+            self.__insert_tx(account.last_tx.to_doc(), undo)
+            return existing is not None
+
+
+    def add_payment_source(self, account_id, payment_source: PaymentSource):
+        return self.__update_account(account_id, lambda doc: doc['payment_sources'].append(payment_source.to_doc()))
+
+
+    def replace_payment_source(self, account_id, payment_source_id, payment_source: PaymentSource):
+        def replace(doc):
+            doc['payment_sources'][payment_source_id] = payment_source.to_doc()
+        return self.__update_account(account_id, replace)
+
+
+    def add_envelope(self, account_id, envelope):
+        return self.__update_account(account_id, lambda doc: doc['envelopes'].append(envelope.to_doc()))
+
+
+    def add_envelopes(self, account_id, envelopes):
+        return self.__update_account(account_id, lambda doc: doc['envelopes'].extend(e.to_doc() for e in envelopes))
+
+
+    def rename_envelope(self, account_id, envelope_id, new_name):
+        def rename(doc):
+            doc['envelopes'][envelope_id]['name'] = new_name
+        return self.__update_account(account_id, rename)
+
+
+    def save_envelope_change(self, account: Account, envelope: Envelope):
+        return self.save_all_envelopes(account, [envelope])
+
+
+    def save_envelope_changes(self, account: Account, from_envelope: Envelope, to_envelope: Envelope):
+        return self.save_all_envelopes(account, [from_envelope, to_envelope])
+
+
+    def save_all_envelopes(self, account: Account, envelopes: List[Envelope]):
+        return self.save_batch(account, envelopes, [account.last_tx])
+
+
+    # persist many transactions applied to one in-memory account with a single account update and a single insert
+    def save_batch(self, account: Account, envelopes: List[Envelope], txs: List[Transaction], checkpoint: dict = None):
+        with self.__transaction() as undo:
+            doc = self.__versioned(account, account.version)
+            self.__save_balances(doc, account, envelopes, undo)
+            self.__push_recent(doc, txs, undo)
+            for tx in txs: self.__insert_tx(tx.to_doc(), undo)
+            if snapshot_due(account.version, account.last_tx_id, self.__snapshot_interval): self.__snapshot(account, undo)
+            # an import records how far it got in the same transaction so a re-run can never apply a row twice
+            if checkpoint:
+                previous = self.__imports.get(checkpoint["import_id"])
+                self.__imports[checkpoint["import_id"]] = { '_id': checkpoint["import_id"], "account_id": str(account.id), "row": checkpoint["row"], "updated": datetime.utcnow() }
+                undo.append(lambda: self.__restore(self.__imports, checkpoint["import_id"], previous))
+            return True
+
+
+    def save_all_changes_after_undo(self, account: Account, envelopes: List[Envelope]):
+        with self.__transaction() as undo:
+            doc = self.__versioned(account, account.version)
+            self.__save_balances(doc, account, envelopes, undo)
+            recent = doc['recent_txs']
+            if recent:
+                popped = recent.pop()
+                undo.append(lambda: recent.append(popped))
+            account_id = str(account.id)
+            deleted = self.__delete_tx(account_id, account.last_tx_id + 1, undo)
+            # a snapshot taken at or after the undone transaction no longer matches the history
+            snapshots = self.__snapshots.get(account_id, {})
+            for tx_id in [id for id in snapshots if id >= account.last_tx_id + 1]:
+                removed = snapshots.pop(tx_id)
+                undo.append(lambda tx_id=tx_id, removed=removed: snapshots.__setitem__(tx_id, removed))
+            return deleted
+
+
+    # overwrite an account's balances and transaction state with those rebuilt from its history. version is the last_tx_id
+    # of the stored document so a write made while the history was being replayed fails the save rather than being lost
+    def repair_account(self, account: Account, version):
+        with self.__transaction() as undo:
+            doc = self.__versioned(account, version)
+            self.__save_balances(doc, account, account.list_envelopes(), undo)
+            previous = doc['recent_txs']
+            doc['recent_txs'] = account.to_doc()["recent_txs"]
+            undo.append(lambda: doc.__setitem__('recent_txs', previous))
+            return True
+
+
+    # check and apply a deposit, debit or move without loading the account first, as Db does with find_one_and_update.
+    # returns the appended transaction, or None if the account, an envelope or the guard didn't match
+    def apply_change(self, owner_id, account_id, change: AtomicChange):
+        with self.__transaction() as undo:
+            doc = self.__accounts.get(ObjectId(account_id))
+            if doc is None or doc['owner_id'] != owner_id or not change.matches(doc): return None
+            before = self.__copy(doc)
+            undo.append(lambda: self.__accounts.__setitem__(doc['_id'], before))
+            change.apply_to(doc)
+            tx = change.transaction(doc)
+            self.__push_recent(doc, [tx], undo)
+            self.__insert_tx(tx.to_doc(), undo)
+            if snapshot_due(tx.id - 1, tx.id, self.__snapshot_interval): self.__snapshot(Account.from_doc(self.__copy(doc)), undo)
+            return tx
+
+
+    # reverse every change made in the block if it raises. the lock is held until it ends, committed or not
+    @contextmanager
+    def __transaction(self):
+        with self.__lock:
+            undo = []
+            try:
+                yield undo
+            except BaseException:
+                for reverse in reversed(undo): reverse()
+                raise
+
+
+    # the stored account if it is still at the version that was read, otherwise the account has moved on since
+    def __versioned(self, account: Account, version):
+        doc = self.__accounts.get(ObjectId(account.id))
+        if doc is None or doc['last_tx_id'] != version: raise ConcurrencyError("account has changed since it was loaded")
+        return doc
+
+
+    # only the balances that changed are written, addressed by envelope id, as Db does
+    def __save_balances(self, doc: dict, account: Account, envelopes: List[Envelope], undo: list) -> None:
+        previous = (doc['last_tx_id'], doc['balance'], [(e.id, doc['envelopes'][e.id]['balance']) for e in envelopes])
+        def restore():
+            doc['last_tx_id'], doc['balance'] = previous[0], previous[1]
+            for id, balance in previous[2]: doc['envelopes'][id]['balance'] = balance
+        undo.append(restore)
+        doc['last_tx_id'], doc['balance'] = account.last_tx_id, account.balance
+        for e in envelopes: doc['envelopes'][e.id]['balance'] = e.balance
+
+
+    # append to the account's recent transactions, dropping the oldest beyond Account.RECENT_TX_LIMIT
+    def __push_recent(self, doc: dict, txs: List[Transaction], undo: list) -> None:
+        previous = list(doc.get('recent_txs', []))
+        undo.append(lambda: doc.__setitem__('recent_txs', previous))
+        doc['recent_txs'] = (previous + [t.to_doc() for t in txs])[-Account.RECENT_TX_LIMIT:]
+
+
+    # snapshots are unique on account_id and tx_id, a second one taken after the same transaction replaces the first
+    def __snapshot(self, account: Account, undo: list) -> None:
+        key, doc = snapshot(account)
+        snapshots = self.__snapshots.setdefault(key['account_id'], {})
+        previous = snapshots.get(key['tx_id'])
+        snapshots[key['tx_id']] = dict(self.__copy(doc), _id=ObjectId())
+        undo.append(lambda: self.__restore(snapshots, key['tx_id'], previous))
+
+
+    # transactions are unique on account_id and tx_id, as the account_tx_unique index makes them in the database
+    def __insert_tx(self, doc: dict, undo: list) -> None:
+        account_id, tx_id = doc['account_id'], doc['tx_id']
+        txs = self.__txs.setdefault(account_id, {})
+        if tx_id in txs: raise DuplicateKeyError(f"duplicate key: account_id {account_id} tx_id {tx_id}")
+        txs[tx_id] = dict(self.__copy(doc), _id=ObjectId())
+        insort(self.__tx_ids.setdefault(account_id, []), tx_id)
+        undo.append(lambda: self.__delete_tx(account_id, tx_id, []))
+
+
+    def __delete_tx(self, account_id, tx_id, undo: list) -> bool:
+        txs = self.__txs.get(account_id, {})
+        if tx_id not in txs: return False
+        removed = txs.pop(tx_id)
+        ids = self.__tx_ids[account_id]
+        del ids[bisect_left(ids, tx_id)]
+        def reinsert():
+            txs[tx_id] = removed
+            insort(ids, tx_id)
+        undo.append(reinsert)
+        return True
+
+
+    def __put_account(self, id, doc: dict, undo: list) -> None:
+        previous = self.__accounts.get(id)
+        self.__accounts[id] = doc
+        undo.append(lambda: self.__restore(self.__accounts, id, previous))
+
+
+    # apply a change to a copy of the account and swap it in, so a change that raises part way leaves nothing behind
+    def __update_account(self, account_id, change) -> bool:
+        with self.__lock:
+            id = ObjectId(account_id)
+            if id not in self.__accounts: return False
+            doc = self.__copy(self.__accounts[id])
+            change(doc)
+            self.__accounts[id] = doc
+            return True
+
+
+    def __set_user_field(self, user_id, field, value) -> bool:
+        with self.__lock:
+            user = self.__users.get(ObjectId(user_id))
+            if user is None or user.get(field) == value: return False
+            user[field] = value
+            return True
+
+
+    # the documents belonging to owner_id, at most take of them
+    def __owned(self, docs, owner_id, take):
+        found = 0
+        for d in docs:
+            if take is not None and found == take: return
+            if d['owner_id'] != owner_id: continue
+            found += 1
+            yield d
+
+
+    def __restore(self, collection: dict, key, previous) -> None:
+        if previous is None: collection.pop(key, None)
+        else: collection[key] = previous
+
+
+    def __without_id(self, doc: dict) -> dict:
+        copy = self.__copy(doc)
+        del copy['_id']
+        return copy
+
+
+    # documents only hold dicts, lists and immutable values so this is all a deep copy needs to do
+    def __copy(self, value):
+        if isinstance(value, dict): return { k: self.__copy(v) for k, v in value.items() }
+        if isinstance(value, list): return [self.__copy(v) for v in value]
+        return value
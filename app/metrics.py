@@ -0,0 +1,133 @@
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+
+# prometheus metrics served on GET /metrics. every request is counted and timed by the route it matched, e.g.
+# /accounts/{account_id} rather than each account's own path, so there is one series per endpoint. account operations
+# are counted as they are applied or refused by the domain. the password hashing pool, the mongo client and the retries
+# of writes that lost a race keep their own counts, which collectors read when /metrics is scraped. each worker process
+# keeps its own
+
+REQUESTS = Counter("http_requests_total", "Requests handled", ["method", "route", "status"])
+LATENCY = Histogram("http_request_duration_seconds", "Time to handle a request", ["method", "route"], buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled")
+OPERATIONS = Counter("account_operations_total", "Deposits, debits, moves, pays and undos applied to accounts", ["op"])
+REJECTED = Counter("account_operations_rejected_total", "Operations the domain refused e.g. not enough money in an envelope", ["op"])
+
+# requests that didn't match a route e.g. 404s are counted together so unknown paths can't create new series
+UNMATCHED = "unmatched"
+
+
+def applied(op: str, count: int = 1) -> None:
+    OPERATIONS.labels(op).inc(count)
+
+
+# the operations of a batch, counted once per kind
+def applied_all(ops: list) -> None:
+    counts = {}
+    for op in ops: counts[op] = counts.get(op, 0) + 1
+    for op, count in counts.items(): applied(op, count)
+
+
+def rejected(op: str) -> None:
+    REJECTED.labels(op).inc()
+
+
+# asgi middleware timing every http request. the router leaves the matched endpoint in the scope, which is looked up in
+# a map from endpoint to route template built from the app's routes on the first request, once they are all added. the
+# labelled series are kept as well so that each request costs two dictionary lookups rather than the client's labelling
+class MetricsMiddleware:
+    def __init__(self, app, routes) -> None:
+        self.app = app
+        self.__routes = routes
+        self.__templates = None
+        self.__series = {}
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start": status[0] = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_PROGRESS.dec()
+            if self.__templates is None: self.__templates = { r.endpoint: r.path for r in self.__routes if hasattr(r, "endpoint") }
+            count, latency = self.__children(scope["method"], self.__templates.get(scope.get("endpoint"), UNMATCHED), status[0])
+            count.inc()
+            latency.observe(elapsed)
+
+
+    def __children(self, method: str, route: str, status: int):
+        key = (method, route, status)
+        if key not in self.__series:
+            self.__series[key] = (REQUESTS.labels(method, route, str(status)), LATENCY.labels(method, route))
+        return self.__series[key]
+
+
+# a summary of a latency kept as a count and an average, as the stats() of the pools are
+def latency_summary(name: str, documentation: str, count: int, seconds_avg: float) -> SummaryMetricFamily:
+    return SummaryMetricFamily(name, documentation, count_value=count, sum_value=seconds_avg * count)
+
+
+# the password hashing pool's stats, see HashingPool.stats. the latencies leave out the hashes that failed
+class HashingCollector:
+    def __init__(self, stats) -> None:
+        self.__stats = stats
+
+
+    def collect(self):
+        s = self.__stats()
+        yield GaugeMetricFamily("password_hash_pool_size", "Processes hashing passwords", value=s["pool_size"])
+        yield GaugeMetricFamily("password_hash_queue_limit", "Hashes that may wait for a process before further ones are rejected", value=s["queue_limit"])
+        yield GaugeMetricFamily("password_hash_bcrypt_rounds", "The bcrypt cost new hashes are made with", value=s["bcrypt_rounds"])
+        yield GaugeMetricFamily("password_hash_in_flight", "Hashes running or waiting for a process", value=s["in_flight"])
+        yield GaugeMetricFamily("password_hash_queue_depth", "Hashes waiting for a process", value=s["queue_depth"])
+        yield CounterMetricFamily("password_hash_failed", "Hashes that raised", value=s["failed"])
+        yield CounterMetricFamily("password_hash_rejected", "Hashes refused with a 429 as the queue was full", value=s["rejected"])
+        yield latency_summary("password_hash_seconds", "Time to hash a password in a pool process", s["completed"], s["hash_seconds_avg"])
+        yield GaugeMetricFamily("password_hash_seconds_max", "Longest time to hash a password in a pool process", value=s["hash_seconds_max"])
+        yield latency_summary("password_hash_total_seconds", "Time to hash a password including waiting for a process", s["completed"], s["total_seconds_avg"])
+        yield GaugeMetricFamily("password_hash_total_seconds_max", "Longest time to hash a password including waiting for a process", value=s["total_seconds_max"])
+
+
+# the mongo client's pool, commands and transactions, see DbMonitor.stats, and the saves retried after losing a race for
+# an account, see ConflictRetry.stats. the pool is reported in total rather than per server so no addresses are exposed
+class DatabaseCollector:
+    def __init__(self, stats, conflicts) -> None:
+        self.__stats = stats
+        self.__conflicts = conflicts
+
+
+    def collect(self):
+        s, c = self.__stats(), self.__conflicts()
+        pool = s["pool"]
+        yield GaugeMetricFamily("mongo_pool_connections_open", "Connections open to the servers", value=pool["open"])
+        yield GaugeMetricFamily("mongo_pool_connections_in_use", "Connections checked out", value=pool["in_use"])
+        yield GaugeMetricFamily("mongo_pool_connections_in_use_max", "Most connections checked out at once", value=pool["in_use_max"])
+        wait = pool["checkout_wait"]
+        yield latency_summary("mongo_pool_checkout_wait_seconds", "Time waited to check out a connection", wait["count"], wait["seconds_avg"])
+        yield GaugeMetricFamily("mongo_pool_checkout_wait_seconds_max", "Longest time waited to check out a connection", value=wait["seconds_max"])
+        failures = CounterMetricFamily("mongo_pool_checkout_failures", "Checkouts that failed e.g. timed out waiting for a connection", labels=["reason"])
+        for reason, count in pool["checkout_failures"].items(): failures.add_metric([str(reason)], count)
+        yield failures
+        commands = SummaryMetricFamily("mongo_command_seconds", "Time taken by commands by name and collection e.g. update accounts", labels=["command"])
+        command_failures = CounterMetricFamily("mongo_command_failures", "Commands that failed by name and collection", labels=["command"])
+        for name, t in s["commands"].items():
+            commands.add_metric([name], count_value=t["count"], sum_value=t["seconds_avg"] * t["count"])
+            command_failures.add_metric([name], t["failures"])
+        yield commands
+        yield command_failures
+        transactions = CounterMetricFamily("mongo_transactions", "Transactions started, committed, aborted, failed to commit and commits retried", labels=["event"])
+        for event, count in s["transactions"].items(): transactions.add_metric([event], count)
+        yield transactions
+        yield CounterMetricFamily("account_save_attempts", "Account saves attempted, retries included", value=c["attempts"])
+        yield CounterMetricFamily("account_save_conflicts", "Account saves that lost a race for the account and were retried", value=c["conflicts"])
+        yield CounterMetricFamily("account_save_retries_exhausted", "Account saves that gave up with a 409 after CAS_MAX_RETRIES", value=c["exhausted"])
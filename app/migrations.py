@@ -0,0 +1,220 @@
+import os
+import sys
+import pymongo
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+# versioned schema migrations. each migration runs once, in order, and the highest applied version is recorded in the
+# schema_versions collection. migrations must be idempotent as several workers may start up and apply them at the same time.
+#
+#   python -m app.migrations apply     apply any pending migrations
+#   python -m app.migrations status    show the current and latest schema versions
+#   python -m app.migrations report    list missing indexes and indexes that have not been used since the server started
+
+# the indexes the application's queries rely on. accounts are always fetched by _id (plus owner_id) which the default _id index serves
+INDEXES = {
+    "users": [
+        # users.find_one({username}) on every login and lookup-mode request, unique to stop duplicate signups
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        # users.find({disabled: true} or {tokens_revoked_at >= n}) on every revocation list refresh, each side of the $or
+        # served by an index holding only the users it can match
+        IndexModel([("disabled", ASCENDING)], name="disabled", partialFilterExpression={ "disabled": True }),
+        IndexModel([("tokens_revoked_at", ASCENDING)], name="tokens_revoked_at", sparse=True)
+    ],
+    "transactions": [
+        # transactions.find({account_id, owner_id}).sort(tx_id) for listing, paging, undo and replay
+        IndexModel([("account_id", ASCENDING), ("owner_id", ASCENDING), ("tx_id", DESCENDING)], name="account_owner_tx"),
+        # transactions.delete_one({account_id, tx_id}) on undo, unique so concurrent writers can never record the same tx id twice
+        IndexModel([("account_id", ASCENDING), ("tx_id", ASCENDING)], name="account_tx_unique", unique=True),
+        # transactions.distinct(reference, {account_id, owner_id, reference in [...]}) as a statement import skips lines already imported
+        IndexModel([("account_id", ASCENDING), ("reference", ASCENDING)], name="account_reference")
+    ],
+    "snapshots": [
+        # snapshots.find_one({account_id, tx_id <= n}).sort(tx_id) to find where a rebuild starts, unique so each is saved once
+        IndexModel([("account_id", ASCENDING), ("tx_id", DESCENDING)], name="account_tx_unique", unique=True)
+    ]
+}
+
+
+class MigrationError(Exception):
+    pass
+
+
+# create any declared index whose key pattern doesn't already exist, whatever it happens to be named
+def ensure_indexes(database, indexes: dict) -> list:
+    created = []
+    for collection_name, models in indexes.items():
+        collection = database.get_collection(collection_name)
+        existing = [(list(info["key"]), bool(info.get("unique"))) for info in collection.index_information().values()]
+        for model in models:
+            spec = model.document
+            if (list(spec["key"].items()), bool(spec.get("unique"))) in existing: continue
+            try:
+                collection.create_indexes([model])
+            except (DuplicateKeyError, OperationFailure) as e:
+                if spec.get("unique") and (isinstance(e, DuplicateKeyError) or e.code == 11000):
+                    raise MigrationError(f"cannot create unique index {spec['name']} on {collection_name}, duplicates exist: {__duplicates(collection, spec)}")
+                raise
+            created.append(f"{collection_name}.{spec['name']}")
+    return created
+
+
+def __duplicates(collection, spec) -> list:
+    group = { k: f"${k}" for k in spec["key"].keys() }
+    pipeline = [{ "$group": { "_id": group, "count": { "$sum": 1 } } }, { "$match": { "count": { "$gt": 1 } } }, { "$limit": 10 }]
+    return [d["_id"] for d in collection.aggregate(pipeline, allowDiskUse=True)]
+
+
+def __initial_indexes(database) -> None:
+    ensure_indexes(database, INDEXES)
+
+
+# seed the recent transactions embedded in each account from the transactions collection. accounts that already have
+# them, including any written to since the application started embedding them, are left alone
+def __recent_transactions(database) -> None:
+    from domain.account import Account
+    accounts = database.get_collection("accounts")
+    transactions = database.get_collection("transactions")
+    for acc in accounts.find({ "recent_txs": { "$exists": False } }, { "owner_id": 1 }):
+        cursor = transactions.find({ "account_id": str(acc["_id"]), "owner_id": acc["owner_id"] }, { "_id": 0 }).sort("tx_id", DESCENDING).limit(Account.RECENT_TX_LIMIT)
+        accounts.update_one({ "_id": acc["_id"], "recent_txs": { "$exists": False } }, { "$set": { "recent_txs": list(cursor)[::-1] } })
+
+
+def __snapshot_indexes(database) -> None:
+    ensure_indexes(database, { "snapshots": INDEXES["snapshots"] })
+
+
+def __revocation_indexes(database) -> None:
+    ensure_indexes(database, { "users": INDEXES["users"] })
+
+
+def __reference_indexes(database) -> None:
+    ensure_indexes(database, { "transactions": INDEXES["transactions"] })
+
+
+# money stored as a double in major units becomes a whole number of minor units. values that are already integers are left
+# alone so running this again, or while the application is writing integers, changes nothing
+def __minor(value: str) -> dict:
+    return { "$cond": [{ "$eq": [{ "$type": value }, "double"] }, { "$toLong": { "$round": [{ "$multiply": [value, 100] }, 0] } }, value] }
+
+
+# the same for fields of every subdocument in an array, and for the fields of arrays nested inside those
+def __minor_each(array: str, fields: list, nested: dict = None, depth: int = 0) -> dict:
+    item = f"$$item{depth}"
+    changes = { f: __minor(f"{item}.{f}") for f in fields }
+    changes.update({ a: __minor_each(f"{item}.{a}", fs, None, depth + 1) for a, fs in (nested or {}).items() })
+    return { "$cond": [{ "$isArray": array }, { "$map": { "input": array, "as": f"item{depth}", "in": { "$mergeObjects": [item, changes] } } }, array] }
+
+
+def __money_in_minor_units(database) -> None:
+    transactions = { "amount": __minor("$amount"), "account_balance": __minor("$account_balance"), "pay_envelopes": __minor_each("$pay_envelopes", ["amount"]) }
+    database.get_collection("transactions").update_many({ "$or": [{ "amount": { "$type": "double" } }, { "account_balance": { "$type": "double" } }, { "pay_envelopes.amount": { "$type": "double" } }] }, [{ "$set": transactions }])
+    accounts = {
+        "balance": __minor("$balance"),
+        "envelopes": __minor_each("$envelopes", ["balance"]),
+        "payment_sources": __minor_each("$payment_sources", ["amount"], { "envelopes": ["amount"] }),
+        "recent_txs": __minor_each("$recent_txs", ["amount", "account_balance"], { "pay_envelopes": ["amount"] })
+    }
+    money = ["balance", "envelopes.balance", "payment_sources.amount", "payment_sources.envelopes.amount", "recent_txs.amount", "recent_txs.account_balance", "recent_txs.pay_envelopes.amount"]
+    database.get_collection("accounts").update_many({ "$or": [{ path: { "$type": "double" } } for path in money] }, [{ "$set": accounts }])
+    # snapshots are only a shortcut for replay so they are dropped rather than converted and are saved again by the next rebuild
+    database.get_collection("snapshots").delete_many({})
+
+
+# (version, description, migration) - append new migrations to the end, never reorder or renumber
+MIGRATIONS = [
+    (1, "indexes for users and transactions", __initial_indexes),
+    (2, "embed recent transactions in accounts", __recent_transactions),
+    (3, "index for account snapshots", __snapshot_indexes),
+    (4, "money in integer minor units", __money_in_minor_units),
+    (5, "indexes for the token revocation list", __revocation_indexes),
+    (6, "index for statement references", __reference_indexes),
+]
+
+
+def current_version(database) -> int:
+    doc = database.get_collection("schema_versions").find_one({ "_id": "schema" })
+    return doc["version"] if doc else 0
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0]
+
+
+# apply every migration newer than the recorded version and return the versions applied
+def apply(database) -> list:
+    applied = []
+    versions = database.get_collection("schema_versions")
+    for version, description, migration in MIGRATIONS:
+        if version <= current_version(database): continue
+        migration(database)
+        versions.update_one({ "_id": "schema" }, { "$max": { "version": version }, "$set": { "updated": datetime.utcnow() } }, upsert=True)
+        versions.insert_one({ "version": version, "description": description, "applied": datetime.utcnow() })
+        applied.append(version)
+    return applied
+
+
+# declared indexes that don't exist, and existing indexes with no recorded use since the server last started
+def report(database) -> dict:
+    missing = []
+    unused = []
+    for collection_name, models in INDEXES.items():
+        collection = database.get_collection(collection_name)
+        existing = [list(info["key"]) for info in collection.index_information().values()]
+        missing += [f"{collection_name}.{m.document['name']}" for m in models if list(m.document["key"].items()) not in existing]
+    for collection_name in database.list_collection_names():
+        if collection_name.startswith("system."): continue
+        for stats in database.get_collection(collection_name).aggregate([{ "$indexStats": {} }]):
+            if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                unused.append({ "index": f"{collection_name}.{stats['name']}", "since": stats["accesses"]["since"] })
+    return { "missing": missing, "unused": unused }
+
+
+def connect():
+    client = pymongo.MongoClient(os.environ['DB_CONNECTION_STRING'])
+    return client, client["nvelopes"]
+
+
+# used at application startup when DB_MIGRATE_ON_STARTUP is enabled
+def apply_from_environment() -> list:
+    client, database = connect()
+    try:
+        return apply(database)
+    finally:
+        client.close()
+
+
+def main(argv) -> int:
+    command = argv[1] if len(argv) > 1 else "status"
+    client, database = connect()
+    try:
+        if command == "apply":
+            applied = apply(database)
+            print(f"applied: {applied}" if applied else "schema is up to date")
+        elif command == "status":
+            print(f"current version: {current_version(database)}, latest version: {latest_version()}")
+            for version, description, _ in MIGRATIONS:
+                print(f"  {version:>3} {'applied' if version <= current_version(database) else 'pending':<8} {description}")
+        elif command == "report":
+            result = report(database)
+            print("missing indexes:")
+            for name in result["missing"]: print(f"  {name}")
+            print("unused indexes:")
+            for u in result["unused"]: print(f"  {u['index']} (no operations since {u['since']})")
+            return 1 if result["missing"] else 0
+        else:
+            print(f"unknown command '{command}', expected apply, status or report")
+            return 2
+    except MigrationError as e:
+        print(str(e))
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main(sys.argv))
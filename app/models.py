@@ -14,6 +14,9 @@ class User(BaseModel):
     full_name: Optional[str] = None
     disabled: Optional[bool] = None
 
+class TokenUser(User):
+    user_id: str = ""
+
 class UserInDB(User):
     user_id: str = ""
     hashed_password: str
\ No newline at end of file
@@ -0,0 +1,19 @@
+import base64
+import json
+
+
+# cursors are opaque to clients - a urlsafe encoding of the position to continue from so the format can change without breaking them
+
+def encode_cursor(tx_id: int) -> str:
+    raw = json.dumps({ "tx": tx_id }, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        tx_id = json.loads(raw)["tx"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(tx_id, int): raise ValueError("invalid cursor")
+    return tx_id
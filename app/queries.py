@@ -0,0 +1,86 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from domain.account import Account
+from domain.atomic_change import AtomicChange
+from domain.envelope import Envelope
+from domain.transaction import Transaction
+from .concurrency import ConcurrencyError
+from typing import List
+
+# the filters and updates Db and AsyncDb send, built once here so the blocking and asyncio backends can't drift apart.
+# each backend only decides how to send them
+
+
+# disabled users, and users who logged out at or after since. every token issued before an older logout has expired
+def revoked_users(since):
+    return { '$or': [{ 'disabled': True }, { 'tokens_revoked_at': { '$gte': since } }] }
+
+
+def tx_range(owner_id, account_id, after_tx_id=None, until_tx_id=None):
+    query = {'account_id': account_id, 'owner_id': owner_id}
+    if after_tx_id is not None: query['tx_id'] = { '$gt': after_tx_id }
+    if until_tx_id is not None: query.setdefault('tx_id', {})['$lte'] = until_tx_id
+    return query
+
+
+# keyset listing newest first. before_tx_id is exclusive so pages stay stable while new transactions are appended
+def tx_before(owner_id, account_id, before_tx_id):
+    query = {'account_id': account_id, 'owner_id': owner_id}
+    if before_tx_id is not None: query['tx_id'] = { '$lt': before_tx_id }
+    return query
+
+
+# the original page/size listing. tx ids are sequential from 0 so a page starts at page*take and is sought to rather than skipped to
+def tx_page(owner_id, account_id, page, take):
+    return {'account_id': account_id, 'owner_id': owner_id, 'tx_id': { '$gte': page*take }}
+
+
+# the transactions of an account that carry one of the given statement references
+def references(owner_id, account_id, refs: List[str]):
+    return {'account_id': account_id, 'owner_id': owner_id, 'reference': { '$in': refs }}
+
+
+# only the balances that changed are written, addressed by envelope id, rather than whole envelopes or the whole array
+def balance_changes(account: Account, envelopes: List[Envelope]):
+    changes = { "last_tx_id": account.last_tx_id, "balance": account.balance }
+    changes.update({ f"envelopes.{e.id}.balance": e.balance for e in envelopes })
+    return changes
+
+
+# append to the account's recent transactions, dropping the oldest beyond Account.RECENT_TX_LIMIT in the same update
+def recent(txs: List[Transaction]):
+    return { 'recent_txs': { '$each': [t.to_doc() for t in txs[-Account.RECENT_TX_LIMIT:]], '$slice': -Account.RECENT_TX_LIMIT } }
+
+
+# the account save: the balances that changed plus the transactions made, see versioned for the filter it goes with
+def account_save(account: Account, envelopes: List[Envelope], txs: List[Transaction]):
+    return { '$set': balance_changes(account, envelopes), '$push': recent(txs) }
+
+
+# filter an account save on the version that was read so a concurrent change is detected rather than overwritten
+def versioned(account: Account):
+    return { '_id': ObjectId(account.id), 'last_tx_id': account.version }
+
+
+# nothing matched so the account has moved on since it was loaded. raising aborts the surrounding transaction
+def check_version(result):
+    if result.matched_count == 0: raise ConcurrencyError("account has changed since it was loaded")
+
+
+# the account the fast path changes, narrowed to the envelopes existing and the guard holding
+def change_filter(owner_id, account_id, change: AtomicChange):
+    query = { '_id': ObjectId(account_id), 'owner_id': owner_id }
+    query.update(change.to_filter())
+    return query
+
+
+# a save that takes the account past a multiple of interval snapshots it too, so rebuilding it as it was never replays
+# more than interval transactions. a batch may pass the multiple, then the snapshot is taken at the end of it
+def snapshot_due(version, last_tx_id, interval):
+    return interval > 0 and last_tx_id // interval > version // interval
+
+
+# the snapshot key, the account and the tx id it was taken after, and the document stored under it
+def snapshot(account: Account):
+    key = { 'account_id': str(account.id), 'tx_id': account.last_tx_id }
+    return key, dict(key, created=datetime.utcnow(), account=account.to_doc())
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+from domain import money
+from domain.account import Account
+from domain.transaction import Transaction
+from .concurrency import ConflictRetry
+
+# rebuilds an account from its transaction history. replay starts from the nearest snapshot at or before the point wanted
+# and applies the transactions after it through Account.replay, reading them from the cursor a batch at a time. the
+# saves that write the account take a snapshot every SNAPSHOT_INTERVAL transactions; verify and repair also save one as
+# replay passes them, for history written before that. asof only reads, like the endpoint, so looking at an account
+# never writes to it
+#
+#   python -m app.replay verify --owner <user id> --account <account id>
+#   python -m app.replay repair --owner <user id> --account <account id>
+#   python -m app.replay asof --owner <user id> --account <account id> --tx-id 1234
+#   python -m app.replay asof --owner <user id> --account <account id> --date 2026-01-31T23:59:59
+
+
+class ReplayError(Exception):
+    pass
+
+
+# envelope names and payment sources aren't recorded in the history so they always come from the current document.
+# balances and transaction state come from the snapshot, or start from nothing without one
+def starting_point(account_doc: dict, snapshot: dict = None) -> Account:
+    state = snapshot["account"] if snapshot else { "balance": 0, "last_tx_id": -1, "recent_txs": [], "envelopes": [] }
+    balances = { e["id"]: e["balance"] for e in state["envelopes"] }
+    envelopes = [dict(e, balance=balances.get(e["id"], 0)) for e in account_doc["envelopes"]]
+    return Account.from_doc(dict(account_doc, balance=state["balance"], last_tx_id=state["last_tx_id"], recent_txs=state["recent_txs"], envelopes=envelopes))
+
+
+# the account as it was after until_tx_id, or as it is now without one. returns None if the account doesn't exist
+async def rebuild(db, owner_id: str, account_id: str, until_tx_id: int = None, batch_size: int = 1000, snapshot_interval: int = 1000) -> Account:
+    doc = await db.get_account(owner_id, account_id)
+    if not doc: return None
+    acc = starting_point(doc, await db.get_snapshot(account_id, until_tx_id))
+    async for docs in db.iter_transactions(owner_id, account_id, batch_size, acc.last_tx_id, until_tx_id):
+        for d in docs:
+            tx = Transaction.from_doc(d)
+            if tx.id != acc.last_tx_id + 1: raise ReplayError(f"transaction {acc.last_tx_id + 1} is missing from the history of account {account_id}")
+            try:
+                acc.replay(tx)
+            except IndexError:
+                raise ReplayError(f"transaction {tx.id} refers to an envelope account {account_id} doesn't have")
+            if snapshot_interval and tx.id % snapshot_interval == 0: await db.save_snapshot(acc)
+    return acc
+
+
+# the account as it was at a date i.e. after the last transaction made at or before it
+async def rebuild_at(db, owner_id: str, account_id: str, when: datetime, batch_size: int = 1000, snapshot_interval: int = 1000) -> Account:
+    tx = await db.get_transaction_at(owner_id, account_id, when)
+    if not tx: raise ReplayError(f"account {account_id} had no transactions at {when.isoformat()}")
+    return await rebuild(db, owner_id, account_id, tx["tx_id"], batch_size, snapshot_interval)
+
+
+# where the stored document disagrees with the account rebuilt from its history
+def differences(stored: dict, rebuilt: Account) -> list:
+    found = []
+    if stored["last_tx_id"] != rebuilt.last_tx_id: found.append(f"last_tx_id is {stored['last_tx_id']}, history says {rebuilt.last_tx_id}")
+    if stored["balance"] != rebuilt.balance: found.append(f"balance is {money.format(stored['balance'])}, history says {money.format(rebuilt.balance)}")
+    for e, r in zip(stored["envelopes"], rebuilt.list_envelopes()):
+        if e["balance"] != r.balance: found.append(f"envelope {e['id']} ({e['name']}) is {money.format(e['balance'])}, history says {money.format(r.balance)}")
+    return found
+
+
+async def verify(db, owner_id: str, account_id: str, batch_size: int = 1000, snapshot_interval: int = 1000) -> list:
+    stored = await db.get_account(owner_id, account_id)
+    if not stored: raise ReplayError(f"account {account_id} not found")
+    return differences(stored, await rebuild(db, owner_id, account_id, None, batch_size, snapshot_interval))
+
+
+# rebuild the account from its history and overwrite the stored balances if they disagree. returns the differences found
+async def repair(db, owner_id: str, account_id: str, batch_size: int = 1000, snapshot_interval: int = 1000) -> list:
+    conflicts = ConflictRetry(int(os.environ.get('CAS_MAX_RETRIES', 5)), float(os.environ.get('CAS_BACKOFF_MS', 5)))
+    # replayed again from the start if the app writes to the account while it is being repaired
+    async def attempt():
+        stored = await db.get_account(owner_id, account_id)
+        if not stored: raise ReplayError(f"account {account_id} not found")
+        acc = await rebuild(db, owner_id, account_id, None, batch_size, snapshot_interval)
+        found = differences(stored, acc)
+        if found: await db.repair_account(acc, stored["last_tx_id"])
+        return found
+    return await conflicts.run(attempt)
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.replay", description="rebuild an account from its transaction history")
+    parser.add_argument("command", choices=["verify", "repair", "asof"])
+    parser.add_argument("--owner", required=True, help="user id of the account owner")
+    parser.add_argument("--account", required=True)
+    parser.add_argument("--tx-id", type=int, default=None, help="asof: the state after this transaction")
+    parser.add_argument("--date", type=datetime.fromisoformat, default=None, help="asof: the state at this date")
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get('REPLAY_BATCH_SIZE', 1000)))
+    parser.add_argument("--snapshot-interval", type=int, default=int(os.environ.get('SNAPSHOT_INTERVAL', 1000)), help="verify and repair: transactions between the snapshots saved while replaying")
+    args = parser.parse_args(argv[1:])
+
+    from .db import db
+    start = time.perf_counter()
+    try:
+        if args.command == "asof":
+            if args.date: acc = asyncio.run(rebuild_at(db, args.owner, args.account, args.date, args.batch_size, snapshot_interval=0))
+            else: acc = asyncio.run(rebuild(db, args.owner, args.account, args.tx_id, args.batch_size, snapshot_interval=0))
+            if not acc: raise ReplayError(f"account {args.account} not found")
+            print(f"after transaction {acc.last_tx_id}: balance {money.format(acc.balance)}")
+            for e in acc.list_envelopes(): print(f"  {e.name:<40} {money.format(e.balance, 10)}")
+            return 0
+        if args.command == "verify":
+            found = asyncio.run(verify(db, args.owner, args.account, args.batch_size, args.snapshot_interval))
+        else:
+            found = asyncio.run(repair(db, args.owner, args.account, args.batch_size, args.snapshot_interval))
+    except ReplayError as e:
+        print(str(e))
+        return 1
+    for difference in found: print(f"  {difference}")
+    verb = "repaired" if args.command == "repair" else "differs from its history"
+    print(f"{'account ' + verb if found else 'account matches its history'} ({time.perf_counter() - start:.1f}s)")
+    return 1 if found and args.command == "verify" else 0
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main(sys.argv))
@@ -1,9 +1,12 @@
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, condecimal
+
+# money in major units e.g. 12.34. anything with more than 2 decimal places is rejected rather than rounded
+Amount = condecimal(decimal_places=2)
 
 class NewAccountRequest(BaseModel):    
     name: str
-    opening_balance: float
+    opening_balance: Amount
     can_go_negative: Optional[bool] = True
 
 class NewUserRequest(BaseModel):
@@ -30,44 +33,58 @@ class MoveMoneyRequest(BaseModel):
     from_id: int
     to_id: int
     description: str
-    amount: float
+    amount: Amount
 
 class DepositMoneyRequest(BaseModel):
     account_id: str
     envelope_id: int
     description: str
-    amount: float
+    amount: Amount
 
 class DebitMoneyRequest(BaseModel):
     account_id: str
     envelope_id: int
     description: str
-    amount: float    
+    amount: Amount    
 
 class PaymentSourceRequest(BaseModel):
     envelope_id: int
-    amount: float
+    amount: Amount
 
 class AddPaymentSourceRequest(BaseModel):
     account_id: str
     payer: str
-    amount: float
+    amount: Amount
     payments: List[PaymentSourceRequest]
 
 class UpdatePaymentSourceRequest(BaseModel):
     account_id: str
     payment_source_id: int
     payer: str
-    amount: float
+    amount: Amount
     payments: List[PaymentSourceRequest]
 
 class PayRequest(BaseModel):
     account_id: str
     payment_source_id: int
     payer: str
-    amount: float
+    amount: Amount
     description: str
     payments: List[PaymentSourceRequest]
 
 class UndoRequest(BaseModel):
-    account_id: str
\ No newline at end of file
+    account_id: str
+
+class BatchOperationRequest(BaseModel):
+    op: str # DEPOSIT | DEBIT | MOVE | PAY
+    description: str
+    amount: Amount
+    envelope_id: Optional[int] = None # DEPOSIT, DEBIT
+    from_id: Optional[int] = None # MOVE
+    to_id: Optional[int] = None # MOVE
+    payment_source_id: Optional[int] = None # PAY
+    payer: Optional[str] = None # PAY
+    payments: Optional[List[PaymentSourceRequest]] = None # PAY
+
+class BatchTransactionsRequest(BaseModel):
+    operations: List[BatchOperationRequest]
@@ -0,0 +1,18 @@
+import orjson
+from bson.objectid import ObjectId
+from starlette.responses import Response
+
+# read endpoints build their response bodies from the stored documents and return them in a JsonResponse, which skips
+# fastapi's jsonable_encoder and encodes straight to bytes. datetimes are written as ISO 8601 and ObjectIds as strings
+
+
+class JsonResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=JsonResponse.__other)
+
+    @staticmethod
+    def __other(value):
+        if isinstance(value, ObjectId): return str(value)
+        raise TypeError(f"cannot encode {type(value).__name__} as json")
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from calendar import timegm
+from datetime import datetime, timedelta
+
+
+log = logging.getLogger(__name__)
+
+
+# in-process list of users whose tokens must no longer be trusted i.e. disabled users and users who have logged out.
+# the list is refreshed from the users collection on a timer so that stateless authentication doesn't need a database round-trip per request.
+# a logout older than token_lifetime is left out as every token issued before it has expired
+class RevocationList:
+
+    # tokens for disabled users are rejected regardless of when they were issued
+    __DISABLED = float("inf")
+
+    def __init__(self, db, refresh_seconds: float, token_lifetime: timedelta) -> None:
+        self.__db = db
+        self.__refresh_seconds = refresh_seconds
+        self.__token_lifetime = token_lifetime
+        self.__revoked = {}
+        self.__task = None
+
+
+    # load the list and keep it fresh in a background task
+    async def start(self) -> None:
+        await self.refresh()
+        self.__task = asyncio.ensure_future(self.__run())
+
+
+    def stop(self) -> None:
+        if self.__task: self.__task.cancel()
+        self.__task = None
+
+
+    # rebuild the list from the database and swap it in
+    async def refresh(self) -> None:
+        revoked = {}
+        for doc in await self.__db.get_revoked_users(datetime.utcnow() - self.__token_lifetime):
+            if doc.get("disabled"):
+                revoked[str(doc["_id"])] = self.__DISABLED
+            elif doc.get("tokens_revoked_at"):
+                revoked[str(doc["_id"])] = self.__epoch(doc["tokens_revoked_at"])
+        self.__revoked = revoked
+
+
+    # record a revocation locally straight away rather than waiting for the next refresh
+    def revoke(self, user_id: str, when: datetime) -> None:
+        self.__revoked[user_id] = max(self.__revoked.get(user_id, 0), self.__epoch(when))
+
+
+    # a token is revoked if the user is disabled or the token was issued before the user last logged out. iat holds
+    # fractions of a second, see auth.create_access_token, so logging in again straight after logging out is allowed.
+    # a token issued before that carries whole seconds and is revoked if issued in the same second as the logout
+    def is_revoked(self, user_id: str, issued_at) -> bool:
+        revoked_at = self.__revoked.get(user_id)
+        if revoked_at is None: return False
+        return issued_at is None or issued_at <= revoked_at
+
+
+    # dates are stored and issued as utc so convert without applying the local timezone
+    @staticmethod
+    def __epoch(when: datetime) -> float:
+        return timegm(when.utctimetuple()) + when.microsecond / 1_000_000
+
+
+    async def __run(self) -> None:
+        while True:
+            await asyncio.sleep(self.__refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception:
+                log.exception("revocation list refresh failed")
@@ -0,0 +1,98 @@
+import csv
+import json
+import re
+from datetime import datetime
+from typing import Iterable, Iterator, NamedTuple, Optional
+from domain import money
+
+# parsers for bank statement exports. each one is a generator over the lines of the file so a statement of any size is
+# read in constant memory, yielding one StatementLine per transaction in file order
+
+
+class StatementLine(NamedTuple):
+    number: int # position in the file, used to checkpoint an import
+    date: Optional[datetime]
+    payee: str
+    amount: int # minor units, negative for money leaving the account
+    reference: str
+
+
+def __amount(text: str) -> int:
+    cleaned = re.sub(r"[^0-9.\-]", "", text)
+    if cleaned == "": raise ValueError(f"invalid amount: '{text}'")
+    return money.to_minor(cleaned)
+
+
+def __date(text: str, date_format: str) -> Optional[datetime]:
+    text = text.strip()
+    return datetime.strptime(text, date_format) if text else None
+
+
+# csv exports with a header row. some banks put debits and credits in separate columns rather than one signed amount column
+def read_csv(lines: Iterable[str], date_column="Date", payee_column="Description", amount_column="Amount", debit_column=None, credit_column=None, reference_column=None, date_format="%d/%m/%Y") -> Iterator[StatementLine]:
+    for number, row in enumerate(csv.DictReader(lines)):
+        try:
+            if debit_column or credit_column:
+                debit = row.get(debit_column, "").strip() if debit_column else ""
+                credit = row.get(credit_column, "").strip() if credit_column else ""
+                amount = -abs(__amount(debit)) if debit else __amount(credit)
+            else:
+                amount = __amount(row[amount_column])
+            yield StatementLine(number, __date(row.get(date_column, ""), date_format), row[payee_column].strip(), amount, row.get(reference_column, "") if reference_column else "")
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"line {number + 2}: {e}")
+
+
+__OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)")
+
+# ofx 1.x (sgml, leaf elements without closing tags) and ofx 2.x (xml). only the STMTTRN aggregates are of interest
+def read_ofx(lines: Iterable[str]) -> Iterator[StatementLine]:
+    number = 0
+    current = None
+    for line in lines:
+        for closing, tag, value in __OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and current is not None:
+                    yield __ofx_line(number, current)
+                    number += 1
+                    current = None
+                elif not closing:
+                    current = {}
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def __ofx_line(number: int, fields: dict) -> StatementLine:
+    try:
+        posted = fields.get("DTPOSTED", "")
+        date = datetime.strptime(posted[:8], "%Y%m%d") if posted else None
+        payee = fields.get("NAME") or fields.get("MEMO") or fields.get("PAYEE", "")
+        return StatementLine(number, date, payee, __amount(fields["TRNAMT"]), fields.get("FITID", ""))
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"transaction {number}: {e}")
+
+
+# maps a statement line to an envelope by matching the payee against regular expressions, first match wins.
+# rules files are json: { "default_envelope_id": 0, "rules": [{ "pattern": "TESCO|SAINSBURY", "envelope_id": 1 }] }
+class Rules:
+    def __init__(self, rules: list, default_envelope_id: int = 0) -> None:
+        self.__rules = [(re.compile(r["pattern"], re.IGNORECASE), r["envelope_id"]) for r in rules]
+        self.__default_envelope_id = default_envelope_id
+
+
+    def match(self, payee: str) -> int:
+        for pattern, envelope_id in self.__rules:
+            if pattern.search(payee): return envelope_id
+        return self.__default_envelope_id
+
+
+    @staticmethod
+    def from_doc(data):
+        return Rules(data.get("rules", []), data.get("default_envelope_id", 0))
+
+
+    @staticmethod
+    def load(path: str):
+        with open(path) as f:
+            return Rules.from_doc(json.load(f))
@@ -0,0 +1,52 @@
+from domain import money
+
+# response bodies, made straight from stored documents without building domain objects. money is held in minor units
+# in the domain and the database and shown in major units e.g. 12.34
+
+
+def envelope(doc: dict) -> dict:
+    return { "id": doc["id"], "name": doc["name"], "balance": money.to_major(doc["balance"]) }
+
+
+def pay_source(doc: dict) -> dict:
+    return { "id": doc["id"], "payer": doc["payer"], "amount": money.to_major(doc["amount"]), "envelopes": [{ "id": pe["id"], "amount": money.to_major(pe["amount"]) } for pe in doc["envelopes"]] }
+
+
+# a transaction document as read from the database, or from an account's recent transactions, converted in place as
+# every caller has a document of its own
+def transaction(doc: dict) -> dict:
+    doc["amount"] = money.to_major(doc["amount"])
+    doc["account_balance"] = money.to_major(doc["account_balance"])
+    for pe in doc.get("pay_envelopes") or []: pe["amount"] = money.to_major(pe["amount"])
+    return doc
+
+
+# the fields GET /accounts/{account_id}?fields= can return: the stored field each is read from and how it is shown
+ACCOUNT_FIELDS = {
+    "name": ("name", lambda doc: doc["name"]),
+    "balance": ("balance", lambda doc: money.to_major(doc["balance"])),
+    "last_tx_id": ("last_tx_id", lambda doc: doc["last_tx_id"]),
+    "envelopes": ("envelopes", lambda doc: [envelope(e) for e in doc["envelopes"]]),
+    "paysources": ("payment_sources", lambda doc: [pay_source(p) for p in doc["payment_sources"]])
+}
+DEFAULT_ACCOUNT_FIELDS = ["name", "balance", "envelopes", "paysources"]
+
+
+# a comma separated list of ACCOUNT_FIELDS e.g. "balance,last_tx_id", or the default fields if there isn't one
+def account_fields(fields: str) -> list:
+    if not fields: return DEFAULT_ACCOUNT_FIELDS
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in ACCOUNT_FIELDS]
+    if unknown or not names: raise ValueError(f"unknown fields {unknown}, choose from {list(ACCOUNT_FIELDS)}")
+    return names
+
+
+# the stored fields to read for an account view
+def stored_fields(names: list) -> list:
+    return [ACCOUNT_FIELDS[f][0] for f in names]
+
+
+def account(account_id: str, doc: dict, names: list) -> dict:
+    view = { "account_id": account_id }
+    for f in names: view[f] = ACCOUNT_FIELDS[f][1](doc)
+    return view
@@ -0,0 +1,58 @@
+# compares requests per second for /accounts/deposit when each request looks the user up in the database (AUTH_MODE=lookup)
+# against trusting the signed token claims (AUTH_MODE=stateless). the app runs in-process against the database configured in .env
+#
+#   python -m benchmarks.auth_modes --requests 2000 --concurrency 8
+
+import argparse
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from main import app
+
+
+def signup_and_open_account(client: TestClient):
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    client.post("/users/signup", json={ "full_name": "Benchmark User", "username": username, "email": f"{username}@example.com", "password": "secret" })
+    token = client.post("/token", data={ "grant_type": "password", "username": username, "password": "secret" }).json()["access_token"]
+    headers = { "Authorization": f"Bearer {token}" }
+    account_id = client.post("/accounts/new", json={ "name": "Benchmark Account", "opening_balance": 0 }, headers=headers).json()["AccountId"]
+    return headers, account_id
+
+
+def run(mode: str, headers: dict, account_id: str, requests: int, concurrency: int) -> float:
+    os.environ['AUTH_MODE'] = mode
+    body = { "account_id": account_id, "envelope_id": 0, "description": "benchmark", "amount": 1.00 }
+
+    def worker(count):
+        client = TestClient(app)
+        for _ in range(count):
+            response = client.post("/accounts/deposit", json=body, headers=headers)
+            if response.status_code != 200: raise RuntimeError(f"{mode}: {response.status_code} {response.text}")
+
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, per_worker))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="requests per second for /accounts/deposit by auth mode")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        headers, account_id = signup_and_open_account(client)
+        results = { mode: run(mode, headers, account_id, args.requests, args.concurrency) for mode in ("lookup", "stateless") }
+
+    print(f"{'mode':<12} {'req/s':>10}")
+    for mode, rps in results.items():
+        print(f"{mode:<12} {rps:>10.1f}")
+    print(f"speedup: {results['stateless'] / results['lookup']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
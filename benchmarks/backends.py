@@ -0,0 +1,95 @@
+# load comparison between DB_BACKEND=sync (pymongo on starlette's threadpool) and DB_BACKEND=async (motor on the event loop).
+# starts the app with uvicorn once per backend against the database configured in .env and drives it over http with
+# increasing numbers of concurrent clients, each alternating between reading the account and depositing into it
+#
+#   pip install -r benchmarks/requirements.txt
+#   python -m benchmarks.backends --clients 50 200 1000 --seconds 20
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+import httpx
+
+
+def percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def start_server(backend: str, port: int):
+    env = { **os.environ, "DB_BACKEND": backend }
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.25)
+    server.kill()
+    raise RuntimeError(f"{backend} server did not start")
+
+
+async def setup(client: httpx.AsyncClient):
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    await client.post("/users/signup", json={ "full_name": "Benchmark User", "username": username, "email": f"{username}@example.com", "password": "secret" })
+    token = (await client.post("/token", data={ "grant_type": "password", "username": username, "password": "secret" })).json()["access_token"]
+    headers = { "Authorization": f"Bearer {token}" }
+    account_id = (await client.post("/accounts/new", json={ "name": "Benchmark Account", "opening_balance": 0 }, headers=headers)).json()["AccountId"]
+    return headers, account_id
+
+
+async def drive(base_url: str, clients: int, seconds: float) -> dict:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers, account_id = await setup(client)
+        deposit = { "account_id": account_id, "envelope_id": 0, "description": "benchmark", "amount": 1.00 }
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + seconds
+
+        async def virtual_client(n):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    if n % 2: response = await client.get(f"/accounts/{account_id}", headers=headers)
+                    else: response = await client.post("/accounts/deposit", json=deposit, headers=headers)
+                    if response.status_code != 200: errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                n += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[virtual_client(n) for n in range(clients)])
+        elapsed = time.perf_counter() - start
+    return { "requests": len(latencies), "rps": len(latencies) / elapsed, "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99), "errors": errors }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sync vs async database backend under concurrent load")
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'clients':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for backend in ("sync", "async"):
+        server = start_server(backend, args.port)
+        try:
+            for clients in args.clients:
+                r = asyncio.run(drive(f"http://127.0.0.1:{args.port}", clients, args.seconds))
+                print(f"{backend:<8} {clients:>8} {r['requests']:>9} {r['rps']:>9.1f} {r['p50']*1000:>8.1f} {r['p95']*1000:>8.1f} {r['p99']*1000:>8.1f} {r['errors']:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
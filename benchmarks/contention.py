@@ -0,0 +1,78 @@
+# n writers depositing into the same account at the same time. every deposit that loses the race for the account is
+# reloaded and retried (CAS_MAX_RETRIES, CAS_BACKOFF_MS) and only given up on with a 409. after each run the account is
+# checked for lost updates: the balance must equal the successful deposits and every tx_id must appear exactly once.
+# the app runs in-process against the database configured in .env
+#
+#   pip install -r benchmarks/requirements.txt
+#   python -m benchmarks.contention --writers 1 8 32 --deposits 50
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import httpx
+from benchmarks.backends import percentile, setup
+from main import app, conflicts
+
+# importing the app sets up its logging, which would log every request of the client as well
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def run(client: httpx.AsyncClient, writers: int, deposits: int) -> dict:
+    headers, account_id = await setup(client)
+    body = { "account_id": account_id, "envelope_id": 0, "description": "contention", "amount": 1.00 }
+    latencies = []
+    outcomes = { 200: 0, 409: 0 }
+    before = conflicts.stats()
+
+    async def writer():
+        for _ in range(deposits):
+            start = time.perf_counter()
+            response = await client.post("/accounts/deposit", json=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[writer() for _ in range(writers)])
+    elapsed = time.perf_counter() - start
+    after = conflicts.stats()
+
+    balance = (await client.get(f"/accounts/{account_id}", headers=headers)).json()["balance"]
+    export = await client.get(f"/accounts/{account_id}/transactions/export", headers=headers)
+    tx_ids = [json.loads(line)["tx_id"] for line in export.text.splitlines()]
+    consistent = balance == outcomes[200] and sorted(tx_ids) == list(range(outcomes[200] + 1))
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "ok": outcomes[200],
+        "conflicts": after["conflicts"] - before["conflicts"],
+        "gave_up": outcomes[409],
+        "consistent": consistent
+    }
+
+
+async def main_async(args):
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://contention", timeout=120) as client:
+            print(f"{'writers':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'ok':>6} {'conflicts':>10} {'409s':>6} {'consistent':>11}")
+            for writers in args.writers:
+                r = await run(client, writers, args.deposits)
+                print(f"{writers:>8} {r['requests']:>9} {r['rps']:>9.1f} {r['p50']*1000:>8.1f} {r['p99']*1000:>8.1f} {r['ok']:>6} {r['conflicts']:>10} {r['gave_up']:>6} {str(r['consistent']):>11}")
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="concurrent writers on one account")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--deposits", type=int, default=50, help="deposits made by each writer")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
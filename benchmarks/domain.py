@@ -0,0 +1,155 @@
+# micro-benchmarks for the Account operations every request goes through, run offline against the domain only. each
+# case is timed over several repeats on a freshly built account and the fastest repeat is kept, as µs per operation.
+# cases cover accounts with few and many envelopes, payment sources paying into more and more envelopes, and longer
+# histories to undo and replay.
+# results are saved as json so a change to the domain can be compared against a baseline saved before it
+#
+#   python -m benchmarks.domain run --output baseline.json
+#   python -m benchmarks.domain run --output after.json
+#   python -m benchmarks.domain compare baseline.json after.json --threshold 10
+#
+# compare exits with 1 if any case is more than threshold percent slower than the baseline
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+from domain.transaction import Transaction
+
+# the shapes each operation is measured at
+ENVELOPES = [10, 1000]
+FAN_OUT = [1, 10, 50]
+TRANSACTIONS = [1000, 10000]
+
+
+def account(envelopes: int, pay_sources: int = 0, fan_out: int = 1) -> Account:
+    acc = Account("owner", "Benchmark Account")
+    acc.open("account", "owner", 1000_00)
+    acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, envelopes + 1)])
+    for i in range(pay_sources): acc.add_payment_source(pay_source(i, envelopes, fan_out))
+    return acc
+
+
+def pay_source(id: int, envelopes: int, fan_out: int) -> PaymentSource:
+    return PaymentSource(id, f"Payer {id}", 1000_00, [PaymentSourceEnvelope(1 + j % envelopes, 1_00) for j in range(fan_out)])
+
+
+# a document as it is stored, with a full list of recent transactions
+def document(envelopes: int, pay_sources: int, fan_out: int) -> dict:
+    acc = account(envelopes, pay_sources, fan_out)
+    for i in range(Account.RECENT_TX_LIMIT): acc.deposit(1 + i % envelopes, "deposit", 1_00)
+    return dict(acc.to_doc(), _id="account")
+
+
+# an account and the transactions it made, oldest first
+def history(envelopes: int, transactions: int):
+    acc = account(envelopes)
+    txs = [acc.last_tx]
+    for i in range(transactions - 1):
+        if i % 3 == 0: acc.deposit(1 + i % envelopes, "deposit", 2_00)
+        elif i % 3 == 1: acc.move(1 + (i - 1) % envelopes, 1 + i % envelopes, "move", 1_00)
+        else: acc.debit(1 + i % envelopes, "debit", 50)
+        txs.append(acc.last_tx)
+    return acc, txs
+
+
+def replay(txs, envelopes: int) -> Account:
+    acc = Account("owner", "Benchmark Account")
+    acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, envelopes + 1)])
+    for tx in txs: acc.replay(tx)
+    return acc
+
+
+def undo_all(acc: Account, txs) -> None:
+    for tx in reversed(txs[1:]): acc.undo(tx)
+
+
+# (name, setup, operation, operations per call). setup isn't timed, operation is called with what setup returns
+def cases(ops: int) -> list:
+    found = []
+    for n in ENVELOPES:
+        found += [
+            (f"deposit/envelopes={n}", lambda n=n: account(n), lambda acc, n=n: [acc.deposit(1 + i % n, "deposit", 1_00) for i in range(ops)], ops),
+            (f"debit/envelopes={n}", lambda n=n: account(n), lambda acc, n=n: [acc.debit(1 + i % n, "debit", 1) for i in range(ops)], ops),
+            (f"move/envelopes={n}", lambda n=n: account(n), lambda acc, n=n: [acc.move(0, 1 + i % n, "move", 1) for i in range(ops)], ops),
+            (f"from_doc/envelopes={n}", lambda n=n: document(n, 5, 3), lambda doc: [Account.from_doc(doc) for _ in range(ops // 10)], ops // 10),
+            (f"to_doc/envelopes={n}", lambda n=n: Account.from_doc(document(n, 5, 3)), lambda acc: [acc.to_doc() for _ in range(ops // 10)], ops // 10)
+        ]
+    for f in FAN_OUT:
+        found += [
+            (f"pay/fan_out={f}", lambda f=f: (account(100), pay_source(0, 100, f)), lambda state: [state[0].pay("pay", state[1]) for _ in range(ops)], ops),
+            (f"to_doc/pay_sources=20,fan_out={f}", lambda f=f: account(100, 20, f), lambda acc: [acc.to_doc() for _ in range(ops // 10)], ops // 10)
+        ]
+    for t in TRANSACTIONS:
+        found += [
+            (f"undo/transactions={t}", lambda t=t: history(100, t), lambda state: undo_all(*state), t - 1),
+            (f"replay/transactions={t}", lambda t=t: [Transaction.from_doc(tx.to_doc()) for tx in history(100, t)[1]], lambda txs: replay(txs, 100), t)
+        ]
+    return found
+
+
+def timed(setup, operation, count: int, repeats: int) -> float:
+    best = None
+    for _ in range(repeats):
+        state = setup()
+        # as timeit does, so a collection landing in one repeat doesn't skew it
+        gc.disable()
+        start = time.perf_counter()
+        operation(state)
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best / count * 1_000_000
+
+
+def run(args) -> None:
+    results = { "python": platform.python_version(), "machine": platform.machine(), "cases": {} }
+    for name, setup, operation, count in cases(args.ops):
+        if args.filter and args.filter not in name: continue
+        results["cases"][name] = round(timed(setup, operation, count, args.repeats), 3)
+        print(f"{name:<40} {results['cases'][name]:>10.3f} µs")
+    if args.output:
+        with open(args.output, "w") as f: json.dump(results, f, indent=2)
+        print(f"saved to {args.output}")
+
+
+def compare(args) -> int:
+    with open(args.baseline) as f: baseline = json.load(f)["cases"]
+    with open(args.results) as f: results = json.load(f)["cases"]
+    regressions = 0
+    print(f"{'case':<40} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name in [n for n in baseline if n in results]:
+        change = (results[name] - baseline[name]) / baseline[name] * 100 if baseline[name] else 0
+        slower = change > args.threshold
+        regressions += slower
+        print(f"{name:<40} {baseline[name]:>10.3f} {results[name]:>10.3f} {change:>7.1f}%{'  REGRESSION' if slower else ''}")
+    for name in [n for n in baseline if n not in results]: print(f"{name:<40} missing from {args.results}")
+    print(f"{regressions} case(s) more than {args.threshold}% slower than the baseline")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Account operation micro-benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="time every case and optionally save the results as json")
+    run_parser.add_argument("--output")
+    run_parser.add_argument("--ops", type=int, default=2000)
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--filter", help="only run cases whose name contains this")
+    compare_parser = commands.add_parser("compare", help="flag cases slower than a saved baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="percent slower that counts as a regression")
+    args = parser.parse_args()
+    if args.command == "run": run(args)
+    else: sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# account operations that look envelopes up by id or name, timed on accounts with more and more envelopes. with the
+# envelopes indexed by id and name, and the total allocated to them kept as a running sum, the time per operation
+# should stay flat as the envelope count grows. runs offline against the domain only
+#
+#   python -m benchmarks.envelopes --envelopes 10 1000 10000 --ops 2000
+
+import argparse
+import time
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+
+
+def account(envelopes: int) -> Account:
+    acc = Account("owner", "Benchmark Account")
+    acc.open("account", "owner", 1000_00)
+    acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, envelopes + 1)])
+    acc.add_payment_source(PaymentSource(0, "ACME Ltd.", 100_00, [PaymentSourceEnvelope(1, 10_00)]))
+    return acc
+
+
+# microseconds per call of operation(i) for i in range(ops)
+def timed(operation, ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops): operation(i)
+    return (time.perf_counter() - start) / ops * 1_000_000
+
+
+def run(envelopes: int, ops: int) -> dict:
+    acc = account(envelopes)
+    targets = [PaymentSourceEnvelope(i, 1_00) for i in range(1, min(envelopes, 10) + 1)]
+    doc = dict(acc.to_doc(), _id="account")
+    start = acc.envelope_count
+    results = {
+        "add_envelope": timed(lambda i: acc.add_envelope(Envelope(start + i, f"Extra {i}", 0)), ops),
+        "rename_envelope": timed(lambda i: acc.rename_envelope(1 + i % envelopes, f"Renamed {i}"), ops),
+        "envelope_exists": timed(lambda i: acc.envelope_exists(f"Envelope {envelopes - i % envelopes}"), ops),
+        "add_payment_source": timed(lambda i: acc.add_payment_source(PaymentSource(i + 1, "Payer", 100_00, targets)), ops),
+        "update_payment_source": timed(lambda i: acc.update_payment_source(0, PaymentSource(0, "Payer", 100_00, targets)), ops),
+    }
+    # hydrating is linear in the envelope count however it is done, so it is shown per envelope
+    results["from_doc (per envelope)"] = timed(lambda i: Account.from_doc(doc), max(1, ops // 100)) / (envelopes + 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="account operation time against envelope count")
+    parser.add_argument("--envelopes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+    rows = { n: run(n, args.ops) for n in args.envelopes }
+    names = list(next(iter(rows.values())))
+    print(f"{'µs per op':<26}" + "".join(f"{n:>12}" for n in args.envelopes))
+    for name in names:
+        print(f"{name:<26}" + "".join(f"{rows[n][name]:>12.2f}" for n in args.envelopes))
+
+
+if __name__ == '__main__':
+    main()
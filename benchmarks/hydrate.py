@@ -0,0 +1,81 @@
+# the cost of turning a stored account document into an Account and back, which every request pays at least once.
+# shows µs per call and the memory allocated by each: the number of blocks still held by the result and the peak
+# while building it. runs offline against the domain only
+#
+#   python -m benchmarks.hydrate --envelopes 20 1000 --pay-sources 5 --calls 2000
+
+import argparse
+import time
+import tracemalloc
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+
+
+def document(envelopes: int, pay_sources: int) -> dict:
+    acc = Account("owner", "Benchmark Account")
+    acc.open("account", "owner", 1000_00)
+    acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, envelopes + 1)])
+    for i in range(pay_sources):
+        acc.add_payment_source(PaymentSource(i, f"Payer {i}", 100_00, [PaymentSourceEnvelope(1 + (i + j) % envelopes, 1_00) for j in range(3)]))
+    for i in range(Account.RECENT_TX_LIMIT): acc.deposit(1 + i % envelopes, "deposit", 1_00)
+    return dict(acc.to_doc(), _id="account")
+
+
+def timed(operation, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls): operation()
+    return (time.perf_counter() - start) / calls * 1_000_000
+
+
+# blocks still allocated for the result, and the peak kB allocated while making it
+def allocations(operation):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = operation()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename"))
+    return result, blocks, peak / 1024
+
+
+# build the account from the document then use part of it, returning the account so what it holds is counted
+def loaded(doc: dict, use) -> Account:
+    acc = Account.from_doc(doc)
+    use(acc)
+    return acc
+
+
+def run(envelopes: int, pay_sources: int, calls: int) -> list:
+    doc = document(envelopes, pay_sources)
+    acc = Account.from_doc(doc)
+    cases = [
+        ("from_doc", lambda: Account.from_doc(doc)),
+        ("from_doc + envelopes", lambda: loaded(doc, lambda a: [e.balance for e in a.list_envelopes()])),
+        ("from_doc + last_tx", lambda: loaded(doc, lambda a: a.last_tx)),
+        ("from_doc + everything", lambda: loaded(doc, lambda a: (a.list_pay_sources(), a.recent_transactions))),
+        ("to_doc", lambda: acc.to_doc())
+    ]
+    rows = []
+    for name, operation in cases:
+        _, blocks, peak = allocations(operation)
+        rows.append((name, timed(operation, calls), blocks, peak))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="account document hydration time and allocations")
+    parser.add_argument("--envelopes", type=int, nargs="+", default=[20, 1000])
+    parser.add_argument("--pay-sources", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+    print(f"{'envelopes':>9} {'case':<24} {'µs':>9} {'blocks':>8} {'peak kB':>8}")
+    for envelopes in args.envelopes:
+        for name, us, blocks, peak in run(envelopes, args.pay_sources, args.calls):
+            print(f"{envelopes:>9} {name:<24} {us:>9.1f} {blocks:>8} {peak:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
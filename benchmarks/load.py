@@ -0,0 +1,229 @@
+# load test built from the requests in requests.http. a scenarios file (benchmarks/scenarios.json) names the requests
+# each virtual user makes once to set itself up - sign up, log in, open an account - and weighted scenarios, each a
+# sequence of requests, that every user then picks from at random until time is up. the sample user, token and account
+# id in requests.http are replaced with each virtual user's own. a step can be the title of a request (its first comment
+# line) or { "request": title, "body": { ... } } to change fields of its json body.
+#
+# runs the app in-process with the database backend configured in .env (DB_BACKEND=memory needs no database), or
+# against a running server with --url. in-process with the memory backend nothing waits, so requests run one after
+# another and the latencies are the app's own cost; use --url against a gunicorn worker to see queueing under load.
+# reports throughput and p50/p95/p99 latency per endpoint for each number of users and exits with 1 if any run breaks
+# the scenarios file's slo, so it can answer how many users a worker can take:
+#
+#   pip install -r benchmarks/requirements.txt
+#   python -m benchmarks.load --users 10 50 100 --seconds 20
+#   python -m benchmarks.load --url http://localhost:8000 --users 50 --seconds 60 --p95-ms 200
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import sys
+import time
+import uuid
+import httpx
+from benchmarks.backends import percentile
+
+# the sample values requests.http is written with
+SAMPLE_USERNAME = "joeb"
+SAMPLE_ACCOUNT_ID = "60e9a6037d39bb9f6b3f6015"
+
+
+class HttpRequest:
+    def __init__(self, title: str, method: str, path: str, headers: dict, body: str) -> None:
+        self.title = title
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+    # what latencies are reported under e.g. GET /accounts/{account_id}/envelopes/list
+    @property
+    def endpoint(self) -> str:
+        return f"{self.method} {self.path.split('?')[0].replace(SAMPLE_ACCOUNT_ID, '{account_id}')}"
+
+
+# the requests in a .http file, each block separated by ###, by the title from its first comment line
+def parse_http(text: str) -> dict:
+    requests = {}
+    for block in text.split("###"):
+        lines = block.strip().splitlines()
+        titles = [l.lstrip("# ").strip() for l in lines if l.startswith("#")]
+        start = next((i for i, l in enumerate(lines) if re.match(r"^(GET|POST|PUT|PATCH|DELETE) ", l)), None)
+        if start is None or not titles: continue
+        method, url = lines[start].split()[:2]
+        path = re.sub(r"^https?://[^/]+", "", url)
+        headers = {}
+        i = start + 1
+        while i < len(lines) and lines[i].strip() and ":" in lines[i]:
+            name, value = lines[i].split(":", 1)
+            headers[name.strip()] = value.strip()
+            i += 1
+        body = "\n".join(l for l in lines[i:] if not l.startswith("#")).strip()
+        requests[titles[0]] = HttpRequest(titles[0], method, path, headers, body)
+    return requests
+
+
+# a step is a request title, or a request title with changes to its json body
+def resolve(step, requests: dict):
+    title, changes = (step, None) if isinstance(step, str) else (step["request"], step.get("body"))
+    if title not in requests: raise ValueError(f"no request titled '{title}' in the .http file")
+    return requests[title], changes
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self.__client = client
+        self.username = f"load-{uuid.uuid4().hex[:12]}"
+        self.token = ""
+        self.account_id = SAMPLE_ACCOUNT_ID
+
+
+    # send a request with the sample user, token and account replaced by this user's, returning the response
+    async def send(self, request: HttpRequest, changes: dict = None) -> httpx.Response:
+        path = request.path.replace(SAMPLE_ACCOUNT_ID, self.account_id)
+        headers = { k: v.replace("{{token}}", self.token) for k, v in request.headers.items() }
+        body = request.body.replace(SAMPLE_ACCOUNT_ID, self.account_id).replace(SAMPLE_USERNAME, self.username)
+        if request.headers.get("Content-Type") == "application/x-www-form-urlencoded":
+            return await self.__client.request(request.method, path, headers=headers, content=body.replace("\n", "").encode())
+        if body:
+            content = json.loads(body)
+            if changes: content.update(changes)
+            return await self.__client.request(request.method, path, headers=headers, json=content)
+        return await self.__client.request(request.method, path, headers=headers)
+
+
+    # run the setup requests, keeping the token and account id they return
+    async def setup(self, steps) -> None:
+        for request, changes in steps:
+            response = await self.send(request, changes)
+            if response.status_code != 200: raise RuntimeError(f"setup request '{request.title}' failed with {response.status_code}: {response.text}")
+            content = response.json()
+            if isinstance(content, dict) and "access_token" in content: self.token = content["access_token"]
+            if isinstance(content, dict) and "AccountId" in content: self.account_id = content["AccountId"]
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latencies = {}
+        self.errors = {}
+
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok: self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+    # per endpoint and, under "all", overall: requests, errors, p50, p95 and p99 in ms
+    def summary(self) -> dict:
+        rows = { e: l for e, l in sorted(self.latencies.items()) }
+        rows["all"] = [s for l in self.latencies.values() for s in l]
+        errors = dict(self.errors, all=sum(self.errors.values()))
+        return { e: { "requests": len(l), "errors": errors.get(e, 0), "p50": percentile(l, 50) * 1000, "p95": percentile(l, 95) * 1000, "p99": percentile(l, 99) * 1000 } for e, l in rows.items() }
+
+
+# every user picks a scenario by weight and makes its requests in order, until the time is up
+async def drive(users, scenarios, seconds: float, think_ms: float) -> Results:
+    results = Results()
+    weights = [s["weight"] for s in scenarios]
+    deadline = time.perf_counter() + seconds
+
+    async def virtual_user(user: VirtualUser):
+        while time.perf_counter() < deadline:
+            for request, changes in random.choices(scenarios, weights)[0]["steps"]:
+                start = time.perf_counter()
+                try:
+                    ok = (await user.send(request, changes)).status_code < 300
+                except httpx.HTTPError:
+                    ok = False
+                results.record(request.endpoint, time.perf_counter() - start, ok)
+                if think_ms: await asyncio.sleep(think_ms / 1000)
+
+    await asyncio.gather(*[virtual_user(u) for u in users])
+    return results
+
+
+# the slo checks a summary breaks. latency targets apply to every endpoint, the error rate to all requests together
+def breaches(summary: dict, slo: dict) -> list:
+    found = []
+    for endpoint, row in summary.items():
+        for pct in ("p95", "p99"):
+            limit = slo.get(f"{pct}_ms")
+            if limit is not None and row[pct] > limit: found.append(f"{endpoint} {pct} {row[pct]:.1f}ms > {limit}ms")
+    overall = summary.get("all", { "requests": 0, "errors": 0 })
+    rate = overall["errors"] / overall["requests"] if overall["requests"] else 0
+    if slo.get("error_rate") is not None and rate > slo["error_rate"]: found.append(f"error rate {rate:.2%} > {slo['error_rate']:.2%}")
+    return found
+
+
+def report(users: int, seconds: float, summary: dict) -> None:
+    print(f"\n{users} users, {summary['all']['requests'] / seconds:.1f} req/s")
+    print(f"{'endpoint':<52} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<52} {row['requests']:>9} {row['errors']:>7} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f}")
+
+
+async def run(args, client: httpx.AsyncClient) -> int:
+    with open(args.http) as f: requests = parse_http(f.read())
+    with open(args.scenarios) as f: plan = json.load(f)
+    setup = [resolve(s, requests) for s in plan["setup"]]
+    scenarios = [dict(s, steps=[resolve(step, requests) for step in s["steps"]]) for s in plan["scenarios"]]
+    slo = dict(plan.get("slo", {}))
+    slo.update({ k: v for k, v in { "p95_ms": args.p95_ms, "p99_ms": args.p99_ms, "error_rate": args.error_rate }.items() if v is not None })
+
+    # every level reuses the users set up for the largest. sign up hashes a password so they're set up a few at a time
+    start = time.perf_counter()
+    users = [VirtualUser(client) for _ in range(max(args.users))]
+    for i in range(0, len(users), 8): await asyncio.gather(*[u.setup(setup) for u in users[i:i + 8]])
+    print(f"set up {len(users)} users in {time.perf_counter() - start:.1f}s")
+
+    passed, failed = [], False
+    for count in sorted(args.users):
+        summary = (await drive(users[:count], scenarios, args.seconds, args.think_ms)).summary()
+        report(count, args.seconds, summary)
+        found = breaches(summary, slo)
+        for breach in found: print(f"  SLO BREACH {breach}")
+        if found: failed = True
+        else: passed.append(count)
+    print(f"\nslo {slo}: {'met up to ' + str(max(passed)) + ' users' if passed else 'not met'}")
+    return 1 if failed else 0
+
+
+async def in_process(args) -> int:
+    from main import app
+    # importing the app sets up its logging, which would log every request of the client as well
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=60) as client:
+            return await run(args, client)
+
+
+async def over_http(args) -> int:
+    limits = httpx.Limits(max_connections=max(args.users), max_keepalive_connections=max(args.users))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        return await run(args, client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test from requests.http scenarios")
+    parser.add_argument("--url", help="drive a running server rather than the app in-process")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between each user's requests")
+    parser.add_argument("--http", default="requests.http")
+    parser.add_argument("--scenarios", default="benchmarks/scenarios.json")
+    parser.add_argument("--p95-ms", type=float, help="override the scenarios file's slo")
+    parser.add_argument("--p99-ms", type=float)
+    parser.add_argument("--error-rate", type=float)
+    args = parser.parse_args()
+    if not args.url:
+        from dotenv import load_dotenv
+        load_dotenv()
+    sys.exit(asyncio.run(over_http(args) if args.url else in_process(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# what the prometheus middleware adds to each request. times a request through the middleware around an endpoint that
+# does nothing, against the endpoint alone, and puts the difference next to the time of a real GET /accounts/{id} made
+# in-process against the memory backend. runs offline
+#
+#   python -m benchmarks.metrics_overhead --requests 20000
+
+import argparse
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+from app.metrics import MetricsMiddleware
+
+
+async def endpoint(scope, receive, send):
+    # the router leaves the endpoint it matched in the scope
+    scope["endpoint"] = endpoint
+    await send({ "type": "http.response.start", "status": 200, "headers": [] })
+    await send({ "type": "http.response.body", "body": b"" })
+
+
+async def nothing(message):
+    pass
+
+
+async def timed(app, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app({ "type": "http", "method": "GET", "path": "/accounts/x", "headers": [] }, None, nothing)
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+# µs per GET /accounts/{account_id} through the whole app, middleware included
+async def real_request(requests: int) -> float:
+    os.environ.update(DB_BACKEND="memory", AUTH_MODE="stateless", BCRYPT_ROUNDS="4")
+    from dotenv import load_dotenv
+    load_dotenv()
+    import httpx
+    import logging
+    from main import app
+    # importing the app sets up its logging, which would log every request of the client as well
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            await client.post("/users/signup", json={ "full_name": "Benchmark User", "username": "bench", "email": "bench@example.com", "password": "secret" })
+            token = (await client.post("/token", data={ "username": "bench", "password": "secret" })).json()["access_token"]
+            headers = { "Authorization": f"Bearer {token}" }
+            account_id = (await client.post("/accounts/new", json={ "name": "Benchmark Account", "opening_balance": 100 }, headers=headers)).json()["AccountId"]
+            start = time.perf_counter()
+            for _ in range(requests): await client.get(f"/accounts/{account_id}", headers=headers)
+            return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per request cost of the metrics middleware")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    with_metrics = MetricsMiddleware(endpoint, [SimpleNamespace(endpoint=endpoint, path="/accounts/{account_id}")])
+    bare, measured = asyncio.run(timed(endpoint, args.requests)), asyncio.run(timed(with_metrics, args.requests))
+    real = asyncio.run(real_request(min(args.requests, 2000)))
+    overhead = measured - bare
+    print(f"{'endpoint alone':<40} {bare:>8.2f} µs")
+    print(f"{'endpoint with metrics middleware':<40} {measured:>8.2f} µs")
+    print(f"{'overhead per request':<40} {overhead:>8.2f} µs")
+    print(f"{'GET /accounts/{account_id} in-process':<40} {real:>8.2f} µs  (overhead {overhead / real:.1%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# bytes written to the account document, and so to the oplog, by a payday and by undoing it. compares rewriting the
+# whole envelopes array, which is what saving pay and undo used to do, against setting only the balances that changed.
+# runs offline: the sizes are those of the bson update documents the repository sends, which is what the oplog records
+#
+#   python -m benchmarks.oplog_size --envelopes 10 200 1000 --paid-into 5
+
+import argparse
+import bson
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+
+
+def whole_array(account: Account) -> dict:
+    return { '$set': { "last_tx_id": account.last_tx_id, "balance": account.balance, "envelopes": [e.to_doc() for e in account.list_envelopes()] } }
+
+
+def balances_only(account: Account, changed) -> dict:
+    changes = { "last_tx_id": account.last_tx_id, "balance": account.balance }
+    changes.update({ f"envelopes.{e.id}.balance": e.balance for e in changed })
+    return { '$set': changes }
+
+
+def measure(envelopes: int, paid_into: int) -> dict:
+    acc = Account("owner", "Benchmark Account")
+    acc.open("account", "owner", 1000_00)
+    acc.add_envelopes([Envelope(i, f"Envelope number {i}", 0) for i in range(1, envelopes + 1)])
+    source = PaymentSource(0, "ACME Ltd.", 2500_00, [PaymentSourceEnvelope(i, 100_00) for i in range(1, paid_into + 1)])
+    paid = acc.pay("Pay day!", source)
+    pay = (len(bson.encode(whole_array(acc))), len(bson.encode(balances_only(acc, paid))))
+    undone = acc.undo(acc.last_tx)
+    undo = (len(bson.encode(whole_array(acc))), len(bson.encode(balances_only(acc, undone))))
+    return { "pay": pay, "undo": undo }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="update document size of pay and undo by number of envelopes")
+    parser.add_argument("--envelopes", type=int, nargs="+", default=[10, 200, 1000])
+    parser.add_argument("--paid-into", type=int, default=5, help="envelopes named in the payment source")
+    args = parser.parse_args()
+
+    print(f"{'envelopes':>10} {'op':>5} {'whole array':>12} {'balances':>9} {'saving':>7}")
+    for envelopes in args.envelopes:
+        for op, (before, after) in measure(envelopes, min(args.paid_into, envelopes)).items():
+            print(f"{envelopes:>10} {op:>5} {before:>11}B {after:>8}B {before / after:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# what GET /accounts/{account_id} reads and sends for each choice of ?fields=, on a large account. shows the bson size of
+# the document the database returns for the projection - the bytes that cross the wire from mongo - the size of the
+# response body, and µs per read and render. runs offline against the memory backend
+#
+#   python -m benchmarks.projection --envelopes 1000 --pay-sources 50 --calls 500
+
+import argparse
+import time
+import bson
+from app import views
+from app.memory_db import MemoryDb
+from app.responses import JsonResponse
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+
+
+# an account with its full recent transactions and pay sources that each split across 20 envelopes
+def large_account(envelopes: int, pay_sources: int):
+    db = MemoryDb()
+    acc = Account("owner", "Benchmark Account")
+    account_id = str(db.create_account(acc))
+    acc.open(account_id, "owner", 1000_00)
+    db.open_account(acc)
+    db.add_envelopes(account_id, [Envelope(i, f"Envelope {i}", 0) for i in range(1, envelopes + 1)])
+    for i in range(pay_sources):
+        db.add_payment_source(account_id, PaymentSource(i, f"Payer {i}", 100_00, [PaymentSourceEnvelope(1 + (i + j) % envelopes, 1_00) for j in range(20)]))
+    for i in range(Account.RECENT_TX_LIMIT):
+        acc = Account.from_doc(db.get_account("owner", account_id))
+        db.save_envelope_change(acc, acc.deposit(1 + i % envelopes, "deposit", 1_00))
+    return db, account_id
+
+
+def measure(db, account_id, fields: str, calls: int):
+    names = views.account_fields(fields)
+    projection = { f: 1 for f in views.stored_fields(names) }
+    doc = db.get_account("owner", account_id, projection)
+    body = JsonResponse(views.account(account_id, doc, names)).body
+    start = time.perf_counter()
+    for _ in range(calls): JsonResponse(views.account(account_id, db.get_account("owner", account_id, projection), names))
+    return len(bson.encode(doc)), len(body), (time.perf_counter() - start) / calls * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="account read size and time by ?fields=")
+    parser.add_argument("--envelopes", type=int, default=1000)
+    parser.add_argument("--pay-sources", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+    db, account_id = large_account(args.envelopes, args.pay_sources)
+    whole = len(bson.encode(db.get_account("owner", account_id)))
+    print(f"{args.envelopes} envelopes, {args.pay_sources} pay sources, whole document {whole / 1024:.1f} kB")
+    print(f"{'fields':<40} {'read bytes':>11} {'body bytes':>11} {'µs':>9}")
+    for fields in [None, "envelopes", "paysources", "name,balance", "balance,last_tx_id"]:
+        read, body, us = measure(db, account_id, fields, args.calls)
+        print(f"{fields or '(default)':<40} {read:>11} {body:>11} {us:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
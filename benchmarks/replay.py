@@ -0,0 +1,89 @@
+# rebuilding an account from a long transaction history with app.replay. the history is generated in memory and served
+# a batch at a time through the same repository methods replay uses, so this measures replay itself rather than the
+# database: a full replay, the first rebuild saving snapshots as it goes, and rebuilds afterwards that start from one
+#
+#   python -m benchmarks.replay --transactions 1000000 --batch-size 1000 --snapshot-interval 1000
+
+import argparse
+import asyncio
+import random
+import time
+from app.replay import rebuild
+from domain.account import Account
+from domain.envelope import Envelope
+
+
+class History:
+    def __init__(self, transactions: int, envelopes: int) -> None:
+        acc = Account("owner", "Benchmark Account")
+        acc.open("account", "owner", 1000_00)
+        acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, envelopes + 1)])
+        self.txs = [acc.last_tx.to_doc()]
+        rng = random.Random(42)
+        for _ in range(transactions - 1):
+            choice = rng.random()
+            if choice < 0.4: acc.deposit(rng.randrange(envelopes + 1), "deposit", 10_00)
+            elif choice < 0.8: acc.move(0, rng.randrange(1, envelopes + 1), "move", 1_00) if acc.amount_in_envelope(0) >= 1_00 else acc.deposit(0, "top up", 100_00)
+            else: acc.debit(rng.randrange(envelopes + 1), "debit", 2_50)
+            self.txs.append(acc.last_tx.to_doc())
+        self.doc = dict(acc.to_doc(), _id="account")
+        self.snapshots = {}
+
+
+    async def get_account(self, owner_id, account_id):
+        return self.doc
+
+
+    async def get_snapshot(self, account_id, until_tx_id=None):
+        ids = [tx_id for tx_id in self.snapshots if until_tx_id is None or tx_id <= until_tx_id]
+        return self.snapshots[max(ids)] if ids else None
+
+
+    async def save_snapshot(self, account: Account):
+        self.snapshots[account.last_tx_id] = { "account_id": "account", "tx_id": account.last_tx_id, "account": account.to_doc() }
+
+
+    async def iter_transactions(self, owner_id, account_id, batch_size, after_tx_id=None, until_tx_id=None):
+        end = len(self.txs) if until_tx_id is None else until_tx_id + 1
+        for start in range(after_tx_id + 1 if after_tx_id is not None else 0, end, batch_size):
+            yield self.txs[start:min(start + batch_size, end)]
+
+
+async def timed(history: History, until_tx_id, batch_size: int, snapshot_interval: int):
+    start = time.perf_counter()
+    acc = await rebuild(history, "owner", "account", until_tx_id, batch_size, snapshot_interval)
+    return acc, time.perf_counter() - start
+
+
+async def run(args):
+    start = time.perf_counter()
+    history = History(args.transactions, args.envelopes)
+    print(f"generated {args.transactions} transactions in {time.perf_counter() - start:.1f}s")
+    latest = len(history.txs) - 1
+    cases = [
+        ("full replay", None, 0),
+        ("first rebuild, saving snapshots", None, args.snapshot_interval),
+        ("latest, from snapshot", None, args.snapshot_interval),
+        ("as of midpoint, from snapshot", latest // 2, args.snapshot_interval)
+    ]
+    print(f"{'case':<34} {'replayed':>9} {'seconds':>8} {'tx/s':>11} {'matches':>8}")
+    for name, until_tx_id, interval in cases:
+        before = await history.get_snapshot("account", until_tx_id)
+        acc, seconds = await timed(history, until_tx_id, args.batch_size, interval)
+        replayed = acc.last_tx_id - (before["tx_id"] if before else -1)
+        matches = until_tx_id is not None or (acc.last_tx_id == history.doc["last_tx_id"] and acc.balance == history.doc["balance"])
+        print(f"{name:<34} {replayed:>9} {seconds:>8.3f} {replayed / seconds if seconds else 0:>11.0f} {str(matches):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="account rebuild time from a long transaction history")
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--envelopes", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--snapshot-interval", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
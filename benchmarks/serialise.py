@@ -0,0 +1,71 @@
+# the cost of turning a page of transaction documents into a response body. compares the way the listing endpoints used
+# to do it - each document through Transaction.from_doc and to_doc, then fastapi's jsonable_encoder and JSONResponse -
+# with building the body from the documents directly and encoding it with JsonResponse. runs offline
+#
+#   python -m benchmarks.serialise --rows 1000 --calls 200
+
+import argparse
+import time
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app import views
+from app.responses import JsonResponse
+from domain import money
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+from domain.transaction import Transaction
+
+
+# a page of transaction documents as the database returns them, newest first
+def page(rows: int) -> list:
+    acc = Account("owner", "Benchmark Account")
+    acc.open("account", "owner", 1000_00)
+    acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, 6)])
+    docs = [acc.last_tx.to_doc()]
+    for i in range(rows - 1):
+        if i % 10 == 0: acc.pay("Pay day!", PaymentSource(0, "ACME Ltd.", 100_00, [PaymentSourceEnvelope(1, 20_00), PaymentSourceEnvelope(2, 30_00)]))
+        else: acc.deposit(1 + i % 5, f"deposit {i}", 12_34)
+        docs.append(acc.last_tx.to_doc())
+    return docs[::-1]
+
+
+# the transaction view as it was, copying each document
+def copied_view(doc: dict) -> dict:
+    view = dict(doc, amount=money.to_major(doc["amount"]), account_balance=money.to_major(doc["account_balance"]))
+    if doc.get("pay_envelopes"): view["pay_envelopes"] = [dict(pe, amount=money.to_major(pe["amount"])) for pe in doc["pay_envelopes"]]
+    return view
+
+
+def through_domain(docs: list) -> bytes:
+    body = [copied_view(t.to_doc()) for t in [Transaction.from_doc(d) for d in docs]]
+    return JSONResponse(jsonable_encoder(body)).body
+
+
+def direct(docs: list) -> bytes:
+    return JsonResponse([views.transaction(d) for d in docs]).body
+
+
+# each call gets fresh documents, as each request does, so the copies aren't part of the timing
+def timed(encode, docs: list, calls: int) -> float:
+    copies = [[dict(d, pay_envelopes=[dict(pe) for pe in d["pay_envelopes"]] if d["pay_envelopes"] else None) for d in docs] for _ in range(calls)]
+    start = time.perf_counter()
+    for c in copies: encode(c)
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="transaction page serialisation time")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    docs = page(args.rows)
+    before, after = timed(through_domain, docs, args.calls), timed(direct, docs, args.calls)
+    print(f"{args.rows} rows")
+    print(f"{'through Transaction + jsonable_encoder':<40} {before:>8.2f} ms")
+    print(f"{'documents + JsonResponse':<40} {after:>8.2f} ms  ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
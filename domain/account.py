@@ -1,4 +1,7 @@
 from domain.payment_source_envelope import PaymentSourceEnvelope
+from . import money
+from .atomic_change import AtomicChange
+from .guard import Guard
 from .payment_source import PaymentSource
 from .envelope import Envelope
 from .transaction import Transaction
@@ -8,161 +11,223 @@ class Account:
 
     # constants
     __OVERFLOW_ENVELOPE_ID = 0
-
-    # private
-    __balance = 0
-    __can_go_negative = True
-    __last_tx = None
-    __last_tx_id = -1
-    __pay_sources: List[PaymentSource] = []
+    # how many of the latest transactions the account document carries for undo and recent activity
+    RECENT_TX_LIMIT = 20
 
     # constructor
     def __init__(self, owner_id, name, allow_negative = True) -> None:
+        self.__account_id = None
         self.__owner_id = owner_id
         self.__name = name
-        self.__envelopes = [Envelope(0, "Available", 0)]
+        self.__balance = 0
+        self.__set_envelopes([Envelope(0, "Available", 0)])
         self.__pay_sources = []
+        self.__pay_source_docs = None
         self.__can_go_negative = allow_negative
+        self.__last_tx = None
+        self.__last_tx_id = -1
+        self.__version = -1
+        self.__dirty = set()
+        self.__recent_txs = []
+        self.__recent_tx_docs = None
 
 
     # associate envelope with account
     def add_envelope(self, envelope: Envelope) -> None:
-        envelope_total = sum(e.balance for e in self.__envelopes)
-        if envelope.balance > self.balance - envelope_total: raise ValueError("Not enough money to assign to the passed in envelope")
-        self.__envelopes.append(envelope)
+        if envelope.balance > self.balance - self.__allocated: raise ValueError("Not enough money to assign to the passed in envelope")
+        self.__index(envelope)
 
 
     # associate multiple envelopes with account in one go
     def add_envelopes(self, envelopes: list) -> None:
         envelope_total_req = sum(e.balance for e in envelopes)
         money_in_account = self.balance
-        if money_in_account < envelope_total_req: raise ValueError(str(f"Not enough money to assign to the passed in envelopes. Required: {envelope_total_req:7.2f}, Actual: {self.balance:7.2f}"))
+        if money_in_account < envelope_total_req: raise ValueError(str(f"Not enough money to assign to the passed in envelopes. Required: {money.format(envelope_total_req, 7)}, Actual: {money.format(self.balance, 7)}"))
         for e in envelopes:
             if (e.id == 0): raise ValueError("envelope id 0 is reserved")
-            self.__envelopes.append(e)
+            self.__index(e)
 
 
     # associate envelope with account
     def rename_envelope(self, envelope_id: int, new_name: str) -> None:
         if new_name == "":
             raise ValueError("new_name cannot be blank")
-        if not bool([e for e in self.__envelopes if (e.id == envelope_id)]):
+        envelope = self.__envelopes_by_id.get(envelope_id)
+        if envelope is None:
             raise ValueError(f"No envelope exists with id: {envelope_id}")
-        self.__envelopes[envelope_id].rename(new_name)
+        self.__forget_name(envelope.name)
+        envelope.rename(new_name)
+        self.__envelope_names[new_name] = self.__envelope_names.get(new_name, 0) + 1
 
 
     # add a source of regular income i.e. an employer, in which to pay into envelopes
     def add_payment_source(self, pay_source: PaymentSource) -> None:
         # check that envelopes exist with ids matching those designated as targets for a payment source        
-        valid = all(id in [x.id for x in self.__envelopes] for id in [x.id for x in pay_source.envelopes])
+        valid = all(x.id in self.__envelopes_by_id for x in pay_source.envelopes)
         if not valid:
             raise ValueError("pay_source must only contain ids of existing account envelopes")
-        self.__pay_sources.append(pay_source)
+        self.__sources().append(pay_source)
 
 
     # add a source of regular income i.e. an employer, in which to pay into envelopes
     def update_payment_source(self, pay_source_id: int, pay_source: PaymentSource) -> None:
         # check that envelopes exist with ids matching those designated as targets for a payment source        
-        valid = all(id in [x.id for x in self.__envelopes] for id in [x.id for x in pay_source.envelopes])
+        valid = all(x.id in self.__envelopes_by_id for x in pay_source.envelopes)
         if not valid:
             raise ValueError("pay_source must only contain ids of existing account envelopes")
-        self.__pay_sources[pay_source_id] = pay_source
+        self.__sources()[pay_source_id] = pay_source
 
 
     # record a payment in each envelope
     def pay(self, description, pay_source: PaymentSource) -> None:
         required_total = sum(p.amount for p in pay_source.envelopes)
         if pay_source.amount < required_total : raise ValueError(str(f"Payment amount must equal or exceed the sum total of payment source envelopes"))
-        for e in pay_source.envelopes: self.__envelopes[e.id].pay(e.amount)
+        for e in pay_source.envelopes: self.__adjust(e.id, e.amount)
         total = sum(p.amount for p in pay_source.envelopes)
-        self.__envelopes[self.__OVERFLOW_ENVELOPE_ID].update(pay_source.amount - total)
+        self.__adjust(self.__OVERFLOW_ENVELOPE_ID, pay_source.amount - total)
         self.__balance += pay_source.amount
-        self.__last_tx = Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, -1, -1, "", "PAY", f"{pay_source.payer} - {description}", pay_source.amount, self.__balance, pay_envelopes=[e.to_doc() for e in pay_source.envelopes])
-        return self.__envelopes
+        self.__record(Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, -1, -1, "", "PAY", f"{pay_source.payer} - {description}", pay_source.amount, self.__balance, pay_envelopes=[e.to_doc() for e in pay_source.envelopes]))
+        return self.__touch(self.__OVERFLOW_ENVELOPE_ID, *[e.id for e in pay_source.envelopes]) # changed envelopes
 
     def open(self, account_id, owner_id, amount) -> None:        
         self.__account_id = account_id
         self.__owner_id = owner_id
-        self.__envelopes[0].update(amount)
+        self.__adjust(0, amount)
         self.__balance = amount
-        self.__last_tx = Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, self.__OVERFLOW_ENVELOPE_ID, -1, self.overflow_envelope_name, "DEPOSIT", "Account Opened", amount, amount)
+        self.__record(Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, self.__OVERFLOW_ENVELOPE_ID, -1, self.overflow_envelope_name, "DEPOSIT", "Account Opened", amount, amount))
 
 
-    def deposit(self, envelope_id, description, amount) -> Envelope:
-        self.__envelopes[envelope_id].update(amount)
+    # a statement import passes the date and the bank's reference of the line, see Transaction
+    def deposit(self, envelope_id, description, amount, date=None, reference=None) -> Envelope:
+        self.__adjust(envelope_id, amount)
         self.__balance += amount
-        self.__last_tx = Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, envelope_id, -1, self.__envelopes[envelope_id].name, "DEPOSIT", description, amount, self.__balance)
-        return self.__envelopes[envelope_id]
+        self.__record(Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, envelope_id, -1, self.__envelopes[envelope_id].name, "DEPOSIT", description, amount, self.__balance, date=date, reference=reference))
+        return self.__touch(envelope_id)[0]
 
 
-    def debit(self, envelope_id, description, amount) -> Envelope:
-        if self.__envelopes[envelope_id].balance - amount < 0 and not self.__can_go_negative: raise(ValueError(str(f"Cannot debit more than is available in '{self.__envelopes[envelope_id].name}' when account is not allowed to go negative")))
-        self.__envelopes[envelope_id].update(-amount)
+    def debit(self, envelope_id, description, amount, date=None, reference=None) -> Envelope:
+        if not Account.debit_guard(envelope_id, amount).is_met(self.__lookup): raise(ValueError(str(f"Cannot debit more than is available in '{self.__envelopes[envelope_id].name}' when account is not allowed to go negative")))
+        self.__adjust(envelope_id, -amount)
         self.__balance -= amount
-        self.__last_tx = Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, envelope_id, -1, self.__envelopes[envelope_id].name, "DEBIT", description, -amount, self.__balance)
-        return self.__envelopes[envelope_id]
+        self.__record(Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, envelope_id, -1, self.__envelopes[envelope_id].name, "DEBIT", description, -amount, self.__balance, date=date, reference=reference))
+        return self.__touch(envelope_id)[0]
 
 
     def atm(self, envelope_id, description, amount) -> None:
         if self.__envelopes[envelope_id].balance - amount < 0 and not self.__can_go_negative: raise(ValueError(str(f"Cannot withdraw more than is available in '{self.__envelopes[envelope_id].name}' when account is not allowed to go negative")))
-        self.__envelopes[envelope_id].update(-amount)
+        self.__adjust(envelope_id, -amount)
         self.__balance -= amount
-        self.__last_tx = Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, envelope_id, -1, self.__envelopes[envelope_id].name, "ATM", description, -amount, self.__balance)
+        self.__record(Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, envelope_id, -1, self.__envelopes[envelope_id].name, "ATM", description, -amount, self.__balance))
+        self.__touch(envelope_id)
 
 
     # move money between envelopes
     def move(self, src_id, dest_id, description, amount) -> List[Envelope]:
-        if self.__envelopes[src_id].balance < amount: raise ValueError(str(f"Not enough money in '{self.__envelopes[src_id].name}' envelope"))
-        self.__envelopes[src_id].update(-amount)
-        self.__envelopes[dest_id].update(amount)
-        self.__last_tx = Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, src_id, dest_id, f"{self.__envelopes[src_id].name} -> {self.__envelopes[dest_id].name}", "MOVE", description, amount, self.__balance)
+        if not Account.move_guard(src_id, amount).is_met(self.__lookup): raise ValueError(str(f"Not enough money in '{self.__envelopes[src_id].name}' envelope"))
+        self.__adjust(src_id, -amount)
+        self.__adjust(dest_id, amount)
+        self.__record(Transaction(self.__inc_tx_id(), self.__owner_id, self.__account_id, src_id, dest_id, f"{self.__envelopes[src_id].name} -> {self.__envelopes[dest_id].name}", "MOVE", description, amount, self.__balance))
+        self.__touch(src_id, dest_id)
         return [self.__envelopes[src_id], self.__envelopes[dest_id]] # changed envelopes
 
 
+    # the rules for debit and move as guards, so the checks above and the single round-trip updates below can't disagree
+    @staticmethod
+    def debit_guard(envelope_id, amount) -> Guard:
+        return Guard([[(f"envelopes.{envelope_id}.balance", "$gte", amount), ("can_go_negative", "$eq", True)]])
+
+
+    @staticmethod
+    def move_guard(src_id, amount) -> Guard:
+        return Guard([[(f"envelopes.{src_id}.balance", "$gte", amount)]])
+
+
+    # deposit, debit and move as changes the database can check and apply itself without the account being loaded. their
+    # transactions leave out what only the updated account knows i.e. the tx id, account, envelope names and balance
+    @staticmethod
+    def deposit_change(envelope_id, description, amount) -> AtomicChange:
+        template = Transaction(None, None, None, envelope_id, -1, None, "DEPOSIT", description, amount, None)
+        return AtomicChange(Guard([]), [envelope_id], { "last_tx_id": 1, "balance": amount, f"envelopes.{envelope_id}.balance": amount }, template)
+
+
+    @staticmethod
+    def debit_change(envelope_id, description, amount) -> AtomicChange:
+        template = Transaction(None, None, None, envelope_id, -1, None, "DEBIT", description, -amount, None)
+        return AtomicChange(Account.debit_guard(envelope_id, amount), [envelope_id], { "last_tx_id": 1, "balance": -amount, f"envelopes.{envelope_id}.balance": -amount }, template)
+
+
+    @staticmethod
+    def move_change(src_id, dest_id, description, amount) -> AtomicChange:
+        template = Transaction(None, None, None, src_id, dest_id, None, "MOVE", description, amount, None)
+        increments = { "last_tx_id": 1, f"envelopes.{src_id}.balance": -amount }
+        increments[f"envelopes.{dest_id}.balance"] = increments.get(f"envelopes.{dest_id}.balance", 0) + amount
+        return AtomicChange(Account.move_guard(src_id, amount), [src_id, dest_id], increments, template)
+
+
     # undo the last transaction
     def undo(self, tx: Transaction) -> List[Envelope]:
         if tx.operation == "MOVE":
-            self.__envelopes[tx.envelope_id_src].update(tx.amount)
-            self.__envelopes[tx.envelope_id_dest].update(-tx.amount)
-            self.__last_tx = None
-            self.__last_tx_id = self.__last_tx_id - 1
-            return self.__envelopes        
+            self.__adjust(tx.envelope_id_src, tx.amount)
+            self.__adjust(tx.envelope_id_dest, -tx.amount)
+            self.__forget(tx)
+            return self.__touch(tx.envelope_id_src, tx.envelope_id_dest)
         if tx.operation == "DEBIT" or tx.operation == "ATM":
             self.__balance = self.__balance + abs(tx.amount)
-            self.__envelopes[tx.envelope_id_src].update(abs(tx.amount))
-            self.__last_tx = None
-            self.__last_tx_id = self.__last_tx_id - 1
-            return self.__envelopes            
+            self.__adjust(tx.envelope_id_src, abs(tx.amount))
+            self.__forget(tx)
+            return self.__touch(tx.envelope_id_src)
         if tx.operation == "DEPOSIT":
             self.__balance = self.__balance - abs(tx.amount)
-            self.__envelopes[tx.envelope_id_src].update(-tx.amount)
-            self.__last_tx = None
-            self.__last_tx_id = self.__last_tx_id - 1
-            return self.__envelopes
+            self.__adjust(tx.envelope_id_src, -tx.amount)
+            self.__forget(tx)
+            return self.__touch(tx.envelope_id_src)
         if tx.operation == "PAY":
             # undo the account balance
             self.__balance = self.__balance - tx.amount
             # undo each envelope
             pse = [PaymentSourceEnvelope.from_doc(pe) for pe in tx.pay_envelopes]
             for pe in pse:
-                self.__envelopes[pe.id].update(-pe.amount)
+                self.__adjust(pe.id, -pe.amount)
             # whatever remainder was pushed into the overflow envelope needs to be undone too
             total = sum(p.amount for p in pse)
             diff = tx.amount -total
-            self.__envelopes[self.__OVERFLOW_ENVELOPE_ID].update(-diff)
+            self.__adjust(self.__OVERFLOW_ENVELOPE_ID, -diff)
             # set the transaction state for the account
-            self.__last_tx = None
-            self.__last_tx_id = self.__last_tx_id - 1
+            self.__forget(tx)
             # return changes
-            return self.__envelopes
+            return self.__touch(self.__OVERFLOW_ENVELOPE_ID, *[pe.id for pe in pse])
+
+
+    # apply a transaction that has already been recorded, the reverse of undo, e.g. when rebuilding an account from its
+    # history. the rules were checked when it was made so they aren't checked again
+    def replay(self, tx: Transaction) -> None:
+        if tx.operation == "MOVE":
+            self.__adjust(tx.envelope_id_src, -tx.amount)
+            self.__adjust(tx.envelope_id_dest, tx.amount)
+        elif tx.operation == "DEBIT" or tx.operation == "ATM":
+            self.__balance = self.__balance - abs(tx.amount)
+            self.__adjust(tx.envelope_id_src, -abs(tx.amount))
+        elif tx.operation == "DEPOSIT":
+            self.__balance = self.__balance + tx.amount
+            self.__adjust(tx.envelope_id_src, tx.amount)
+        elif tx.operation == "PAY":
+            pse = [PaymentSourceEnvelope.from_doc(pe) for pe in tx.pay_envelopes]
+            for pe in pse:
+                self.__adjust(pe.id, pe.amount)
+            self.__adjust(self.__OVERFLOW_ENVELOPE_ID, tx.amount - sum(p.amount for p in pse))
+            self.__balance = self.__balance + tx.amount
+        else:
+            raise ValueError(f"cannot replay unknown operation '{tx.operation}' in transaction {tx.id}")
+        self.__last_tx_id = tx.id
+        self.__record(tx)
 
 
     def envelope_exists(self, envelope_name):
-        return bool([e for e in self.__envelopes if (e.name == envelope_name)])
+        return envelope_name in self.__envelope_names
 
 
     # return how much money is in a envelope
-    def amount_in_envelope(self, envelope_id) -> float:
+    def amount_in_envelope(self, envelope_id) -> int:
         return self.__envelopes[envelope_id].balance
 
 
@@ -171,18 +236,98 @@ class Account:
 
 
     def list_pay_sources(self):
-        return self.__pay_sources
+        return self.__sources()
 
 
     # print current state of envelopes
     def print_envelopes(self) -> None:
         print("envelope list:")
         for e in self.__envelopes:
-            print(f"{e.name:<40} {e.balance:7.2f}")
+            print(f"{e.name:<40} {money.format(e.balance, 7)}")
         print("")
         print("")
 
 
+    # replace every envelope, rebuilding the lookups and the allocated total
+    def __set_envelopes(self, envelopes: List[Envelope]) -> None:
+        self.__envelopes = list(envelopes)
+        self.__envelopes_by_id = { e.id: e for e in envelopes }
+        self.__envelope_names = {}
+        for e in envelopes: self.__envelope_names[e.name] = self.__envelope_names.get(e.name, 0) + 1
+        self.__allocated = sum(e.balance for e in envelopes)
+
+
+    # add an envelope to the list, where its position is its id, and to the lookups by id and name
+    def __index(self, envelope: Envelope) -> None:
+        self.__envelopes.append(envelope)
+        self.__envelopes_by_id[envelope.id] = envelope
+        self.__envelope_names[envelope.name] = self.__envelope_names.get(envelope.name, 0) + 1
+        self.__allocated += envelope.balance
+
+
+    # names are counted as more than one envelope can have the same name
+    def __forget_name(self, name: str) -> None:
+        if self.__envelope_names[name] == 1: del self.__envelope_names[name]
+        else: self.__envelope_names[name] -= 1
+
+
+    # change an envelope's balance, keeping the total allocated to envelopes up to date
+    def __adjust(self, envelope_id, amount) -> None:
+        self.__envelopes[envelope_id].update(amount)
+        self.__allocated += amount
+
+
+    # record envelopes whose balance has changed since the account was loaded and return them
+    def __touch(self, *envelope_ids) -> List[Envelope]:
+        ids = list(dict.fromkeys(envelope_ids))
+        self.__dirty.update(ids)
+        return [self.__envelopes[id] for id in ids]
+
+
+    # resolve a guard path against the account's current state
+    def __lookup(self, path: str):
+        field, *rest = path.split(".")
+        if field == "envelopes": return getattr(self.__envelopes[int(rest[0])], rest[1])
+        return getattr(self, field)
+
+
+    # payment sources loaded with the account stay as documents until something uses them
+    def __sources(self) -> List[PaymentSource]:
+        if self.__pay_sources is None:
+            self.__pay_sources = [PaymentSource.from_doc(d) for d in self.__pay_source_docs]
+            self.__pay_source_docs = None
+        return self.__pay_sources
+
+
+    # likewise the recent transactions, the newest of which may already have been built as the last transaction
+    def __recent(self) -> List[Transaction]:
+        if self.__recent_txs is None:
+            docs = self.__recent_tx_docs
+            last = [self.__last_tx] if docs and self.__last_tx is not None and self.__last_tx.id == docs[-1]["tx_id"] else []
+            self.__recent_txs = [Transaction.from_doc(d) for d in docs[:len(docs) - len(last)]] + last
+            self.__recent_tx_docs = None
+        return self.__recent_txs
+
+
+    # make tx the last transaction and keep it in the bounded list of recent ones. recent transactions that haven't been
+    # built yet are only needed as documents to save, so tx joins them as one
+    def __record(self, tx: Transaction) -> None:
+        self.__last_tx = tx
+        if self.__recent_txs is None:
+            self.__recent_tx_docs = (self.__recent_tx_docs + [tx.to_doc()])[-self.RECENT_TX_LIMIT:]
+        else:
+            self.__recent_txs.append(tx)
+            del self.__recent_txs[:-self.RECENT_TX_LIMIT]
+
+
+    # step back over an undone transaction. the one before it becomes the last transaction if it's still in the recent list
+    def __forget(self, tx: Transaction) -> None:
+        recent = self.__recent()
+        self.__last_tx_id = self.__last_tx_id - 1
+        if recent and recent[-1].id == tx.id: recent.pop()
+        self.__last_tx = recent[-1] if recent and recent[-1].id == self.__last_tx_id else None
+
+
     # generate the next transaction id
     def __inc_tx_id(self) -> int:
         self.__last_tx_id += 1
@@ -201,7 +346,7 @@ class Account:
 
     @property
     def pay_source_count(self):
-        return self.__pay_sources.__len__()        
+        return len(self.__pay_source_docs) if self.__pay_sources is None else len(self.__pay_sources)
 
 
     @property
@@ -214,6 +359,12 @@ class Account:
         self.can_go_negative = value
 
 
+    # the sum of every envelope's balance
+    @property
+    def allocated(self) -> int:
+        return self.__allocated
+
+
     # return number of envelopes for this account
     @property
     def envelope_count(self) -> int:
@@ -235,6 +386,8 @@ class Account:
     # get last transaction
     @property
     def last_tx(self) -> Transaction:
+        docs = self.__recent_tx_docs
+        if self.__last_tx is None and docs and docs[-1]["tx_id"] == self.__last_tx_id: self.__last_tx = Transaction.from_doc(docs[-1])
         return self.__last_tx
 
 
@@ -244,9 +397,27 @@ class Account:
         return self.__last_tx_id
 
 
-    # current balance of the account
+    # the latest transactions, newest first. only the last RECENT_TX_LIMIT are kept, the transactions collection holds the full history
+    @property
+    def recent_transactions(self) -> List[Transaction]:
+        return self.__recent()[::-1]
+
+
+    # the last transaction id the account had when it was loaded. saves only succeed if it is still the stored value
+    @property
+    def version(self) -> int:
+        return self.__version
+
+
+    # every envelope whose balance has changed since the account was loaded, so only those need saving
+    @property
+    def dirty_envelopes(self) -> List[Envelope]:
+        return [self.__envelopes[id] for id in sorted(self.__dirty)]
+
+
+    # current balance of the account in minor units
     @property
-    def balance(self) -> float:
+    def balance(self) -> int:
         return self.__balance
 
 
@@ -259,7 +430,8 @@ class Account:
             "last_tx_id": self.__last_tx_id,
             "can_go_negative": self.__can_go_negative,
             "envelopes": [e.to_doc() for e in self.__envelopes],
-            "payment_sources": [p.to_doc() for p in self.__pay_sources]
+            "payment_sources": list(self.__pay_source_docs) if self.__pay_sources is None else [p.to_doc() for p in self.__pay_sources],
+            "recent_txs": list(self.__recent_tx_docs) if self.__recent_txs is None else [t.to_doc() for t in self.__recent_txs]
         }
 
 
@@ -272,7 +444,13 @@ class Account:
         acc.__name =  data["name"]
         acc.__balance = data["balance"]
         acc.__last_tx_id = data["last_tx_id"]
+        acc.__version = data["last_tx_id"]
         acc.__can_go_negative = data["can_go_negative"]        
-        acc.__envelopes = [Envelope(d["id"], d["name"], d["balance"]) for d in data["envelopes"]]
-        acc.__pay_sources = [PaymentSource(d["id"], d["payer"], d["amount"], d["envelopes"]) for d in data["payment_sources"]]
+        acc.__set_envelopes([Envelope(d["id"], d["name"], d["balance"]) for d in data["envelopes"]])
+        # payment sources and recent transactions are only built when used, most requests need neither
+        acc.__pay_sources = None
+        acc.__pay_source_docs = data["payment_sources"]
+        # accounts saved before recent transactions were embedded don't have any
+        acc.__recent_txs = None
+        acc.__recent_tx_docs = data.get("recent_txs", [])
         return acc
\ No newline at end of file
@@ -0,0 +1,53 @@
+from typing import List
+from domain.guard import Guard
+from domain.transaction import Transaction
+
+# a single envelope operation expressed so the database can check and apply it in one conditional update: the guard
+# and the existence of the envelopes become the query filter and the balance changes become $inc. the transaction is
+# given as a template holding everything the caller knows; its id, the envelope names and the account balance are
+# filled in from the updated account that comes back
+
+class AtomicChange:
+    def __init__(self, guard: Guard, envelope_ids: List[int], increments: dict, template: Transaction) -> None:
+        self.__guard = guard
+        self.__envelope_ids = envelope_ids
+        self.__increments = increments
+        self.__template = template
+        # the envelopes the transaction is named after, source then destination if there is one
+        self.__named = [template.envelope_id_src] + ([template.envelope_id_dest] if template.envelope_id_dest >= 0 else [])
+
+    @property
+    def increments(self) -> dict:
+        return self.__increments
+
+    # filter on the guard plus the envelopes existing, so a missing envelope is not created by $inc
+    def to_filter(self) -> dict:
+        query = { f"envelopes.{id}": { "$exists": True } for id in self.__envelope_ids }
+        query.update(self.__guard.to_filter())
+        return query
+
+    # add the increments in place, so only the changed balances are written
+    def to_update(self) -> dict:
+        return { "$inc": self.__increments }
+
+    # return what the transaction is built from rather than the whole account
+    def projection(self) -> dict:
+        return { "owner_id": 1, "last_tx_id": 1, "balance": 1, "envelopes.name": 1 }
+
+    # the transaction built from the updated account, as projected or as a whole document
+    def transaction(self, doc: dict) -> Transaction:
+        t = self.__template
+        envelope = " -> ".join(doc["envelopes"][id]["name"] for id in self.__named)
+        return Transaction(doc["last_tx_id"], doc["owner_id"], str(doc["_id"]), t.envelope_id_src, t.envelope_id_dest, envelope, t.operation, t.description, t.amount, doc["balance"])
+
+    # the same check and update applied to a document in memory
+    def matches(self, doc: dict) -> bool:
+        if not all(0 <= id < len(doc["envelopes"]) for id in self.__envelope_ids): return False
+        return self.__guard.is_met(Guard.document_lookup(doc))
+
+    def apply_to(self, doc: dict) -> None:
+        lookup = Guard.document_lookup(doc)
+        for path, amount in self.__increments.items():
+            *parents, field = path.split(".")
+            target = lookup(".".join(parents)) if parents else doc
+            target[field] = target[field] + amount
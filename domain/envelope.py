@@ -1,4 +1,7 @@
 class Envelope:
+    # fixed attributes rather than a __dict__ each, accounts are rebuilt with all of their envelopes on every request
+    __slots__ = ("__id", "__name", "__balance")
+
     def __init__(self, id, name, balance) -> None:
         self.__id = id
         self.__name = name
@@ -30,7 +33,7 @@ class Envelope:
         return {
             "id" : self.__id,
             "name": self.__name,
-            "balance": round(self.__balance, 2)
+            "balance": self.__balance
         }
 
     # convert from json to Envelope
@@ -0,0 +1,40 @@
+from typing import Callable, List, Tuple
+
+# a business rule written as predicates on the fields of a stored account so that the same rule can be checked in
+# memory by Account and handed to the database as a query filter. a guard is met when every clause is met and a clause
+# is met when any one of its (path, operator, value) predicates holds. paths use the stored document's dotted names
+# e.g. "envelopes.3.balance"
+
+Predicate = Tuple[str, str, object]
+
+class Guard:
+    def __init__(self, clauses: List[List[Predicate]]) -> None:
+        self.__clauses = clauses
+
+    # lookup returns the current value of a path
+    def is_met(self, lookup: Callable[[str], object]) -> bool:
+        return all(any(Guard.__holds(lookup(path), op, value) for path, op, value in clause) for clause in self.__clauses)
+
+    # the same rule as a mongo query filter
+    def to_filter(self) -> dict:
+        terms = []
+        for clause in self.__clauses:
+            alternatives = [{ path: { op: value } } for path, op, value in clause]
+            terms.append(alternatives[0] if len(alternatives) == 1 else { "$or": alternatives })
+        return { "$and": terms } if terms else {}
+
+    @staticmethod
+    def __holds(actual, op, value) -> bool:
+        if op == "$eq": return actual == value
+        if op == "$gte": return actual >= value
+        raise ValueError(f"unsupported guard operator {op}")
+
+    # look paths up in a stored account document
+    @staticmethod
+    def document_lookup(doc: dict) -> Callable[[str], object]:
+        def lookup(path):
+            value = doc
+            for part in path.split("."):
+                value = value[int(part)] if isinstance(value, list) else value[part]
+            return value
+        return lookup
@@ -0,0 +1,32 @@
+from decimal import Decimal, InvalidOperation
+
+# money is an integer number of minor units (pence, cents) everywhere in the domain and the database, so balances and
+# sums are exact and the database can $inc and $sum them without any rounding. amounts are only converted to and from
+# major units e.g. 12.34 at the edges: requests, responses, statements and messages
+
+MINOR_UNITS = 100
+
+
+# exact conversion from major units given as a Decimal, str, int or float. more than two decimal places is an error
+# rather than being rounded away
+def to_minor(value) -> int:
+    try:
+        minor = (value if isinstance(value, Decimal) else Decimal(str(value).strip())) * MINOR_UNITS
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: '{value}'")
+    if not minor.is_finite() or minor != minor.to_integral_value(): raise ValueError(f"invalid amount: '{value}', money has at most 2 decimal places")
+    return int(minor)
+
+
+# major units for json responses. the nearest float to a whole number of minor units always prints with at most 2 decimal places
+def to_major(minor: int) -> float:
+    return minor / MINOR_UNITS
+
+
+def to_decimal(minor: int) -> Decimal:
+    return Decimal(minor).scaleb(-2)
+
+
+# e.g. format(-1234, 7) -> " -12.34"
+def format(minor: int, width: int = 0) -> str:
+    return f"{to_decimal(minor):{width}.2f}"
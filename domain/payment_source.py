@@ -2,6 +2,8 @@ from domain.payment_source_envelope import PaymentSourceEnvelope
 from typing import List
 
 class PaymentSource:
+    __slots__ = ("__id", "__payer", "__amount", "__payment_source_envelopes")
+
     def __init__(self, id, payer, amount, payment_source_envelopes: List[PaymentSourceEnvelope]):
         self.__id = id
         self.__payer = payer
@@ -1,4 +1,6 @@
 class PaymentSourceEnvelope:
+    __slots__ = ("__id", "__amount")
+
     def __init__(self, id, amount) -> None:
         self.__id = id
         self.__amount = amount
@@ -1,10 +1,14 @@
 from datetime import datetime
 from typing import List
 from domain.payment_source_envelope import PaymentSourceEnvelope
+from domain import money
 
 class Transaction:
-    def __init__(self, tx_id, owner_id, account_id, envelope_id_src, envelope_id_dest, envelope, op, description, amount, account_balance, pay_envelopes: List[PaymentSourceEnvelope]=None) -> None:
-        self.__date = datetime.now()
+    __slots__ = ("__date", "__tx_id", "__owner_id", "__account_id", "__envelope_id_src", "__envelope_id_dest", "__envelope", "__op", "__description", "__amount", "__account_balance", "__pay_envelopes", "__reference")
+
+    # date and reference are given when the transaction comes from a bank statement, the date it was made and the bank's id for it
+    def __init__(self, tx_id, owner_id, account_id, envelope_id_src, envelope_id_dest, envelope, op, description, amount, account_balance, pay_envelopes: List[PaymentSourceEnvelope]=None, date: datetime=None, reference: str=None) -> None:
+        self.__date = date or datetime.now()
         self.__tx_id = tx_id
         self.__owner_id = owner_id
         self.__account_id = account_id
@@ -16,6 +20,7 @@ class Transaction:
         self.__amount = amount
         self.__account_balance = account_balance
         self.__pay_envelopes = pay_envelopes
+        self.__reference = reference
 
     # allow correction of this transactions's description and amount
     def correct(self, description, amount):
@@ -62,9 +67,13 @@ class Transaction:
     def pay_envelopes(self):
         return self.__pay_envelopes
 
+    @property
+    def reference(self):
+        return self.__reference
+
     # textual representation of a transaction
     def to_string(self):
-        return f"{self.__tx_id:<15} {self.__date.strftime('%M-%D-%Y %I:%M:%S'):<25} {self.__op:<20} {self.__description:<50} {self.__envelope:<40} {self.__amount:7.2f}  {self.__account_balance:7.2f}"
+        return f"{self.__tx_id:<15} {self.__date.strftime('%M-%D-%Y %I:%M:%S'):<25} {self.__op:<20} {self.__description:<50} {self.__envelope:<40} {money.format(self.__amount, 7)}  {money.format(self.__account_balance, 7)}"
 
     # convert from Transaction to json
     def to_doc(self):
@@ -80,10 +89,14 @@ class Transaction:
             "description": self.__description,
             "amount": self.__amount,
             "account_balance": self.__account_balance,
-            "pay_envelopes": self.__pay_envelopes
+            "pay_envelopes": self.__pay_envelopes,
+            "reference": self.__reference
         }
     
     # convert from json to Transaction
     @staticmethod
     def from_doc(data):
-        return Transaction(data["tx_id"], data["owner_id"], data["account_id"], data["envelope_id_src"], data["envelope_id_dest"], data["envelope"], data["op"], data["description"], data["amount"], data["account_balance"], data["pay_envelopes"])
+        tx = Transaction(data["tx_id"], data["owner_id"], data["account_id"], data["envelope_id_src"], data["envelope_id_dest"], data["envelope"], data["op"], data["description"], data["amount"], data["account_balance"], data["pay_envelopes"], reference=data.get("reference"))
+        # keep the date the transaction was made rather than when it was read back
+        if "date" in data: tx.__date = data["date"]
+        return tx
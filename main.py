@@ -1,15 +1,38 @@
 from dotenv import load_dotenv
 load_dotenv()  # take environment variables from .env.
 
+# before anything else logs, see app/logs.py
+import app.logs as logs
+logs.configure()
+
+import logging
 import os
 import app.auth as auth
-from datetime import timedelta
-from fastapi import Depends, HTTPException, FastAPI, status
+import app.consistency as consistency
+import app.export as export
+import app.metrics as metrics
+import app.migrations as migrations
+import app.paging as paging
+import app.replay as replay
+import app.views as views
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import Depends, HTTPException, FastAPI, Query, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from pymongo.errors import ConnectionFailure
+from starlette.concurrency import run_in_threadpool
 from app.requests import NewUserRequest, NewAccountRequest, AddEnvelopesRequest, AddEnvelopeRequest, MoveMoneyRequest, DepositMoneyRequest, DebitMoneyRequest
 from app.requests import AddPaymentSourceRequest, UpdatePaymentSourceRequest, PayRequest, RenameEnvelopesRequest, UndoRequest
+from app.requests import BatchOperationRequest, BatchTransactionsRequest
 from app.models import Token, User, UserInDB
+from app.responses import JsonResponse
 from app.db import db
+from app.db_monitor import monitor
+from app.hashing import HashingPoolFull
+from app.concurrency import ConcurrencyError, ConflictRetry
+from domain import money
 from domain.account import Account
 from domain.envelope import Envelope
 from domain.payment_source import PaymentSource
@@ -17,183 +40,410 @@ from domain.payment_source_envelope import PaymentSourceEnvelope
 from domain.transaction import Transaction
 
 app = FastAPI()
+log = logging.getLogger(__name__)
+
+# with DB_READ_PREFERENCE set, GET endpoints read from secondaries. responses to writes carry an X-Read-After token that,
+# sent back on later requests, makes their reads wait for the write to reach the secondary. see app/consistency.py
+if consistency.routed(): app.add_middleware(consistency.ReadAfterMiddleware)
+
+# counts and times every request by route for GET /metrics, which reports the password hashing pool as well
+app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+REGISTRY.register(metrics.HashingCollector(auth.hasher.stats))
+
+# gives every request an id that its log records carry, added last so that it wraps the others
+app.add_middleware(logs.RequestIdMiddleware)
+
+# writes that lose a race for an account are reloaded and re-applied up to CAS_MAX_RETRIES times before giving up with a 409
+conflicts = ConflictRetry(int(os.environ.get('CAS_MAX_RETRIES', 5)), float(os.environ.get('CAS_BACKOFF_MS', 5)))
+
+# the mongo client's pool, commands and transactions, and the saves retried above, reported on GET /metrics
+REGISTRY.register(metrics.DatabaseCollector(monitor.stats, conflicts.stats))
+
+
+# create the indexes the queries depend on before serving requests. can be disabled and run as a deployment step instead: python -m app.migrations apply.
+# the in-memory backend has no schema to migrate
+@app.on_event("startup")
+async def apply_migrations():
+    if os.environ.get('DB_MIGRATE_ON_STARTUP', 'true') == 'true' and os.environ.get('DB_BACKEND', 'sync') != 'memory':
+        await run_in_threadpool(migrations.apply_from_environment)
+
+
+@app.on_event("startup")
+async def start_revocation_list():
+    await auth.revocations.start()
+
+
+@app.on_event("shutdown")
+def stop_revocation_list():
+    auth.revocations.stop()
+
+
+@app.on_event("shutdown")
+def stop_hashing_pool():
+    auth.hasher.shutdown()
+
+
+# write out the log records still queued
+@app.on_event("shutdown")
+def stop_logging():
+    logs.stop()
+
+
+# too many logins/signups are already waiting on bcrypt so shed the load rather than queue indefinitely
+@app.exception_handler(HashingPoolFull)
+def hashing_pool_full(request: Request, exc: HashingPoolFull):
+    return JSONResponse(status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={ "detail": "Too many requests, please try again shortly" }, headers={ "Retry-After": "1" })
+
+
+# no pooled connection came free within DB_WAIT_QUEUE_TIMEOUT_MS, or the database can't be reached. fail fast rather
+# than hold the request
+@app.exception_handler(ConnectionFailure)
+def database_unavailable(request: Request, exc: ConnectionFailure):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={ "detail": "Database unavailable, please try again shortly" }, headers={ "Retry-After": "1" })
+
+
+# the account kept changing underneath the request however many times it was retried
+@app.exception_handler(ConcurrencyError)
+def concurrency_conflict(request: Request, exc: ConcurrencyError):
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={ "detail": str(exc) })
+
+
+# ACCOUNT_FAST_PATH=true lets the database check and apply deposit, debit and move in one conditional update. when it
+# doesn't match, the normal path runs and reports why e.g. account not found or not enough money in the envelope
+def __fast_path() -> bool:
+    return os.environ.get('ACCOUNT_FAST_PATH', 'false') == 'true'
+
+
+# requests give money in major units e.g. 12.34, the domain works in minor units
+def __payment_source(id, payer, amount, payments) -> PaymentSource:
+    return PaymentSource(id, payer, money.to_minor(amount), [PaymentSourceEnvelope(x.envelope_id, money.to_minor(x.amount)) for x in payments])
+
+
+# apply an operation to a loaded account, counting it if the domain refuses it e.g. not enough money in the envelope
+def __apply(op: str, operation):
+    try:
+        return operation()
+    except ValueError as e:
+        metrics.rejected(op)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def __load_account(owner_id, account_id) -> Account:
+    doc = await db.get_account(owner_id, account_id)
+    if not doc: raise HTTPException(status_code=404, detail="Account not found")
+    return Account.from_doc(doc)
 
 
 # domain endpoints - most requests follow a similar pattern e.g. load the account, invoke the domain method to sense check what is allowed, then update the database
 
 @app.post("/accounts/new")
-def create_new_account(req: NewAccountRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+async def create_new_account(req: NewAccountRequest, token: UserInDB = Depends(auth.get_current_active_user)):
     acc = Account(token.user_id, req.name, req.can_go_negative)
-    result = db.create_account(acc)
+    result = await db.create_account(acc)
     account_id = result.__str__()
-    acc.open(account_id, token.user_id, req.opening_balance)
-    db.open_account(acc)
-    return { "AccountId": account_id, "Account": acc.name, "Status": "Opened", "Balance": acc.balance }
+    acc.open(account_id, token.user_id, money.to_minor(req.opening_balance))
+    await db.open_account(acc)
+    return { "AccountId": account_id, "Account": acc.name, "Status": "Opened", "Balance": money.to_major(acc.balance) }
       
 
 @app.post("/accounts/envelopes/add")
-def add_envelopes_to_account(req: AddEnvelopesRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
+async def add_envelopes_to_account(req: AddEnvelopesRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await db.get_account(token.user_id, req.account_id)
     if not doc: raise HTTPException(status_code=404, detail="Account not found")
     acc = Account.from_doc(doc)
     envelope_list = [Envelope(i+1, b, 0) for i, b in enumerate(req.envelopes)]
     acc.add_envelopes(envelope_list)
-    success = db.add_envelopes(req.account_id, envelope_list)
+    success = await db.add_envelopes(req.account_id, envelope_list)
     return success
 
 
 @app.post("/accounts/envelopes/addsingle")
-def add_single_envelope_to_account(req: AddEnvelopeRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
+async def add_single_envelope_to_account(req: AddEnvelopeRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await db.get_account(token.user_id, req.account_id)
     if not doc: raise HTTPException(status_code=404, detail="Account not found")
     acc = Account.from_doc(doc)
     env = Envelope(acc.last_envelope.id+1, req.envelope, 0)
     acc.add_envelope(env)
-    success = db.add_envelope(req.account_id, env)
+    success = await db.add_envelope(req.account_id, env)
     return success
 
 
 @app.post("/accounts/envelopes/rename")
-def rename_envelope(req: RenameEnvelopesRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
+async def rename_envelope(req: RenameEnvelopesRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await db.get_account(token.user_id, req.account_id)
     if not doc: raise HTTPException(status_code=404, detail="Account not found")
     acc = Account.from_doc(doc)
     acc.rename_envelope(req.envelope_id, req.new_name)
-    success = db.rename_envelope(req.account_id, req.envelope_id, req.new_name)
+    success = await db.rename_envelope(req.account_id, req.envelope_id, req.new_name)
     return success    
 
 
 @app.post("/accounts/payers/add")
-def add_payment_source_to_account(req: AddPaymentSourceRequest, token: UserInDB = Depends(auth.get_current_active_user)):    
-    doc = db.get_account(token.user_id, req.account_id)
+async def add_payment_source_to_account(req: AddPaymentSourceRequest, token: UserInDB = Depends(auth.get_current_active_user)):    
+    doc = await db.get_account(token.user_id, req.account_id)
     if not doc: raise HTTPException(status_code=404, detail="Account not found")
     acc = Account.from_doc(doc)
     id = acc.pay_source_count
-    source = PaymentSource(id, req.payer, req.amount, [PaymentSourceEnvelope(x.envelope_id, x.amount) for x in req.payments])
+    source = __payment_source(id, req.payer, req.amount, req.payments)
     acc.add_payment_source(source)
-    return db.add_payment_source(req.account_id, source)
+    return await db.add_payment_source(req.account_id, source)
 
 
 @app.post("/accounts/payers/update")
-def add_payment_source_to_account(req: UpdatePaymentSourceRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
+async def add_payment_source_to_account(req: UpdatePaymentSourceRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await db.get_account(token.user_id, req.account_id)
     if not doc: raise HTTPException(status_code=404, detail="Account not found")
     acc = Account.from_doc(doc)
-    source = PaymentSource(req.payment_source_id, req.payer, req.amount, [PaymentSourceEnvelope(x.envelope_id, x.amount) for x in req.payments])
+    source = __payment_source(req.payment_source_id, req.payer, req.amount, req.payments)
     acc.update_payment_source(req.payment_source_id, source)
-    return db.replace_payment_source(req.account_id, req.payment_source_id, source)    
+    return await db.replace_payment_source(req.account_id, req.payment_source_id, source)    
 
 
 @app.post("/accounts/movemoney")
-def move_money(req: MoveMoneyRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
-    changes = acc.move(req.from_id, req.to_id, req.description, req.amount)
-    success = db.save_envelope_changes(acc, changes[0], changes[1])
-    return success
+async def move_money(req: MoveMoneyRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    if __fast_path() and await conflicts.run(lambda: db.apply_change(token.user_id, req.account_id, Account.move_change(req.from_id, req.to_id, req.description, money.to_minor(req.amount)))):
+        metrics.applied("move")
+        return True
+    async def attempt():
+        acc = await __load_account(token.user_id, req.account_id)
+        changes = __apply("move", lambda: acc.move(req.from_id, req.to_id, req.description, money.to_minor(req.amount)))
+        return await db.save_envelope_changes(acc, changes[0], changes[1])
+    result = await conflicts.run(attempt)
+    metrics.applied("move")
+    return result
 
 
 @app.post("/accounts/deposit")
-def deposit(req: DepositMoneyRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
-    changed_envelope = acc.deposit(req.envelope_id, req.description, req.amount)
-    success = db.save_envelope_change(acc, changed_envelope)
-    return success
+async def deposit(req: DepositMoneyRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    if __fast_path() and await conflicts.run(lambda: db.apply_change(token.user_id, req.account_id, Account.deposit_change(req.envelope_id, req.description, money.to_minor(req.amount)))):
+        metrics.applied("deposit")
+        return True
+    async def attempt():
+        acc = await __load_account(token.user_id, req.account_id)
+        changed_envelope = __apply("deposit", lambda: acc.deposit(req.envelope_id, req.description, money.to_minor(req.amount)))
+        return await db.save_envelope_change(acc, changed_envelope)
+    result = await conflicts.run(attempt)
+    metrics.applied("deposit")
+    return result
 
 
 @app.post("/accounts/debit")
-def debit(req: DebitMoneyRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, req.account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
-    changed_envelope = acc.debit(req.envelope_id, req.description, req.amount)
-    success = db.save_envelope_change(acc, changed_envelope)
-    return success
+async def debit(req: DebitMoneyRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    if __fast_path() and await conflicts.run(lambda: db.apply_change(token.user_id, req.account_id, Account.debit_change(req.envelope_id, req.description, money.to_minor(req.amount)))):
+        metrics.applied("debit")
+        return True
+    async def attempt():
+        acc = await __load_account(token.user_id, req.account_id)
+        changed_envelope = __apply("debit", lambda: acc.debit(req.envelope_id, req.description, money.to_minor(req.amount)))
+        return await db.save_envelope_change(acc, changed_envelope)
+    result = await conflicts.run(attempt)
+    metrics.applied("debit")
+    return result
     
 
 @app.post("/accounts/pay")
-def add_payment_source_to_account(req: PayRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    source = PaymentSource(req.payment_source_id, req.payer, req.amount, [PaymentSourceEnvelope(x.envelope_id, x.amount) for x in req.payments])
-    doc = db.get_account(token.user_id, req.account_id)
+async def add_payment_source_to_account(req: PayRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    source = __payment_source(req.payment_source_id, req.payer, req.amount, req.payments)
+    async def attempt():
+        acc = await __load_account(token.user_id, req.account_id)
+        try:
+            envelopes = acc.pay(req.description, source)
+        except Exception as e:
+            metrics.rejected("pay")
+            raise HTTPException(status_code=400, detail=str(e))
+        return await db.save_all_envelopes(acc, envelopes)
+    result = await conflicts.run(attempt)
+    metrics.applied("pay")
+    return result
+
+
+# the fields each batch operation needs besides description and amount, and which of them are envelope ids
+__BATCH_FIELDS = { "DEPOSIT": ["envelope_id"], "DEBIT": ["envelope_id"], "MOVE": ["from_id", "to_id"], "PAY": ["payment_source_id", "payer"] }
+__BATCH_ENVELOPES = { "DEPOSIT": ["envelope_id"], "DEBIT": ["envelope_id"], "MOVE": ["from_id", "to_id"], "PAY": [] }
+
+
+# a malformed operation is the request's fault rather than a refusal by the domain, so it is rejected before any is applied
+def __check_fields(i, op: BatchOperationRequest):
+    if op.op not in __BATCH_FIELDS: raise HTTPException(status_code=400, detail=f"Operation {i} ({op.op}) rejected: unknown operation, expected DEPOSIT, DEBIT, MOVE or PAY")
+    missing = [f for f in __BATCH_FIELDS[op.op] if getattr(op, f) is None]
+    if missing: raise HTTPException(status_code=400, detail=f"Operation {i} ({op.op}) rejected: missing {', '.join(missing)}")
+
+
+# envelopes are looked up by position so a negative id would pick one from the end rather than fail
+def __check_envelopes(i, op: BatchOperationRequest, acc: Account):
+    ids = [getattr(op, f) for f in __BATCH_ENVELOPES[op.op]] + [p.envelope_id for p in op.payments or []]
+    unknown = [id for id in ids if not 0 <= id < acc.envelope_count]
+    if unknown: raise HTTPException(status_code=400, detail=f"Operation {i} ({op.op}) rejected: no envelope exists with id {unknown[0]}")
+
+
+# apply one operation of a batch through the same domain methods the single operation endpoints use
+def __apply_operation(acc: Account, op: BatchOperationRequest):
+    if op.op == "DEPOSIT":
+        return [acc.deposit(op.envelope_id, op.description, money.to_minor(op.amount))]
+    if op.op == "DEBIT":
+        return [acc.debit(op.envelope_id, op.description, money.to_minor(op.amount))]
+    if op.op == "MOVE":
+        return acc.move(op.from_id, op.to_id, op.description, money.to_minor(op.amount))
+    if op.op == "PAY":
+        source = __payment_source(op.payment_source_id, op.payer, op.amount, op.payments or [])
+        return acc.pay(op.description, source)
+    raise ValueError(f"unknown operation '{op.op}', expected DEPOSIT, DEBIT, MOVE or PAY")
+
+
+# apply an ordered list of operations to one account in a single load and a single commit. validation is all-or-nothing:
+# if any operation is rejected by the domain nothing is written
+@app.post("/accounts/{account_id}/transactions/batch")
+async def batch_transactions(account_id: str, req: BatchTransactionsRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    if not req.operations: raise HTTPException(status_code=400, detail="No operations supplied")
+    if len(req.operations) > int(os.environ.get('BATCH_MAX_OPERATIONS', 1000)): raise HTTPException(status_code=400, detail="Too many operations in one batch")
+    for i, op in enumerate(req.operations): __check_fields(i, op)
+    async def attempt():
+        acc = await __load_account(token.user_id, account_id)
+        txs = []
+        for i, op in enumerate(req.operations):
+            __check_envelopes(i, op, acc)
+            try:
+                __apply_operation(acc, op)
+            except ValueError as e:
+                metrics.rejected(op.op.lower())
+                raise HTTPException(status_code=400, detail=f"Operation {i} ({op.op}) rejected: {e}")
+            txs.append(acc.last_tx)
+        success = await db.save_batch(acc, acc.dirty_envelopes, txs)
+        return { "success": success, "applied": len(txs), "last_tx_id": acc.last_tx_id, "balance": money.to_major(acc.balance) }
+    result = await conflicts.run(attempt)
+    metrics.applied_all([op.op.lower() for op in req.operations])
+    return result
+
+
+@app.post("/accounts/transactions/undo")
+async def undo(req: UndoRequest, token: UserInDB = Depends(auth.get_current_active_user)):
+    async def attempt():
+        acc = await __load_account(token.user_id, req.account_id)
+        # the last transaction comes embedded in the account unless it has been undone past its recent transactions
+        tx = acc.last_tx
+        if not tx:
+            doc = await db.get_last_transaction(token.user_id, req.account_id)
+            if not doc: raise HTTPException(status_code=404, detail="Transaction not found")
+            tx = Transaction.from_doc(doc)
+            # another transaction landed between reading the account and the last transaction
+            if acc.version != tx.id: raise ConcurrencyError("account has changed since it was loaded")
+        if tx.id == 0: raise HTTPException(status_code=400, detail="Cannot undo opening transaction. Delete the account instead.")
+        try:
+            envelopes = acc.undo(tx)
+        except Exception as e:
+            metrics.rejected("undo")
+            raise HTTPException(status_code=400, detail=str(e))
+        return await db.save_all_changes_after_undo(acc, envelopes)
+    result = await conflicts.run(attempt)
+    metrics.applied("undo")
+    return result
+
+
+# read endpoints fetch just the fields they show and build the response from them, rather than loading the whole account.
+# they read with secondary_ok so they can be served by a secondary
+async def __read_account(owner_id, account_id, *fields) -> dict:
+    doc = await db.get_account(owner_id, account_id, { f: 1 for f in fields }, secondary_ok=True)
     if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
+    return doc
+
+
+# fields=balance,last_tx_id etc. returns only those fields and only reads them from the database, see views.ACCOUNT_FIELDS
+@app.get("/accounts/{account_id}")
+async def get_account(account_id: str, fields: Optional[str] = None, token: UserInDB = Depends(auth.get_current_active_user)):
     try:
-        envelopes = acc.pay(req.description, source)
-        return db.save_all_envelopes(acc, envelopes)
-    except Exception as e:
+        names = views.account_fields(fields)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    doc = await __read_account(token.user_id, account_id, *views.stored_fields(names))
+    return JsonResponse(views.account(account_id, doc, names))
 
 
-@app.post("/accounts/transactions/undo")
-def undo(req: UndoRequest, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_last_transaction(token.user_id, req.account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Transaction not found")
-    tx = Transaction.from_doc(doc)
-    if tx.id == 0: raise HTTPException(status_code=400, detail="Cannot undo opening transaction. Delete the account instead.")
-    acc = Account.from_doc(db.get_account(token.user_id, req.account_id))
+# the account as it was after a transaction or at a date, rebuilt from its history starting at the nearest snapshot
+@app.get("/accounts/{account_id}/asof")
+async def get_account_as_of(account_id: str, tx_id: Optional[int] = Query(None, ge=0), date: Optional[datetime] = None, token: UserInDB = Depends(auth.get_current_active_user)):
+    if (tx_id is None) == (date is None): raise HTTPException(status_code=400, detail="Pass either tx_id or date")
+    # a read never writes, so no snapshots are saved here. saves take one every SNAPSHOT_INTERVAL transactions
+    batch_size = int(os.environ.get('REPLAY_BATCH_SIZE', 1000))
     try:
-        envelopes = acc.undo(tx)
-        return db.save_all_changes_after_undo(acc, envelopes)
-    except Exception as e:
+        if date: acc = await replay.rebuild_at(db, token.user_id, account_id, date, batch_size, snapshot_interval=0)
+        else: acc = await replay.rebuild(db, token.user_id, account_id, tx_id, batch_size, snapshot_interval=0)
+    except replay.ReplayError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if not acc: raise HTTPException(status_code=404, detail="Account not found")
+    return JsonResponse({ "account_id" : account_id, "name": acc.name, "balance": money.to_major(acc.balance), "last_tx_id": acc.last_tx_id, "envelopes": [views.envelope(e.to_doc()) for e in acc.list_envelopes()] })
 
 
-@app.get("/accounts/{account_id}")
-def get_account(account_id: str, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
-    return { "account_id" : account_id, "name": acc.name, "balance": acc.balance, "envelopes": [e.to_doc() for e in acc.list_envelopes()], "paysources": [{ "id": p.id, "payer": p.payer, "amount": p.amount, "envelopes": p.envelopes } for p in acc.list_pay_sources()] }
+@app.get("/accounts/{account_id}/transactions")
+async def list_transactions(account_id: str, size: int = Query(20, ge=1, le=500), cursor: Optional[str] = None, token: UserInDB = Depends(auth.get_current_active_user)):
+    try:
+        before = paging.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # fetch one extra to find out whether there is another page without a count
+    docs = await db.list_transactions(token.user_id, account_id, before, size + 1, secondary_ok=True)
+    page = docs[:size]
+    next_cursor = paging.encode_cursor(page[-1]["tx_id"]) if len(docs) > size else None
+    return JsonResponse({ "transactions": [views.transaction(d) for d in page], "next": next_cursor })
+
+
+# the latest transactions newest first, read from the account document alone rather than the transactions collection
+@app.get("/accounts/{account_id}/transactions/recent")
+async def recent_transactions(account_id: str, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await __read_account(token.user_id, account_id, "recent_txs")
+    # accounts saved before recent transactions were embedded don't have any
+    return JsonResponse([views.transaction(d) for d in reversed(doc.get("recent_txs", []))])
+
+
+# the whole history oldest first, streamed from the cursor in batches of EXPORT_BATCH_SIZE so memory stays flat however many transactions there are
+@app.get("/accounts/{account_id}/transactions/export")
+async def export_transactions(account_id: str, format: str = Query("ndjson", regex="^(ndjson|csv)$"), token: UserInDB = Depends(auth.get_current_active_user)):
+    await __read_account(token.user_id, account_id, "_id")
+    batches = db.iter_transactions(token.user_id, account_id, int(os.environ.get('EXPORT_BATCH_SIZE', 1000)), secondary_ok=True)
+    if format == "csv":
+        return StreamingResponse(export.csv_rows(batches), media_type="text/csv", headers={ "Content-Disposition": f'attachment; filename="{account_id}.csv"' })
+    return StreamingResponse(export.ndjson(batches), media_type="application/x-ndjson", headers={ "Content-Disposition": f'attachment; filename="{account_id}.ndjson"' })
 
 
+# the original page/size listing, oldest first. transaction ids are sequential so each page is a seek rather than a skip
 @app.get("/accounts/{account_id}/transactions/{page}/{size}")
-def get_transactions(account_id: str, page: int, size: int, token: UserInDB = Depends(auth.get_current_active_user)):    
-    docs = db.get_transactions(token.user_id, account_id, page, size)
-    if not docs: raise HTTPException(status_code=404, detail="Transactions not found") 
-    # return docs # error - not subscriptable
-    # return [Transaction.from_doc(d) for d in docs] # returns field names as properties e.g. __Transaction__tx_id    
-    return [t.to_doc() for t in [Transaction.from_doc(d) for d in docs]] # convert retrieved results to Transaction then back to doc gives desired result
+async def get_transactions(account_id: str, page: int, size: int, token: UserInDB = Depends(auth.get_current_active_user)):
+    docs = await db.get_transactions(token.user_id, account_id, page, size, secondary_ok=True) if page >= 0 and size >= 1 else []
+    if not docs: raise HTTPException(status_code=404, detail="Transactions not found")
+    return JsonResponse([views.transaction(d) for d in docs])
 
 
 @app.get("/accounts/{account_id}/envelopes/list")
-def get_envelopes(account_id: str, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
-    return [e.to_doc() for e in acc.list_envelopes()]
+async def get_envelopes(account_id: str, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await __read_account(token.user_id, account_id, "envelopes")
+    return JsonResponse([views.envelope(e) for e in doc["envelopes"]])
 
 
 @app.get("/accounts/{account_id}/paysources/list")
-def get_paysources(account_id: str, token: UserInDB = Depends(auth.get_current_active_user)):
-    doc = db.get_account(token.user_id, account_id)
-    if not doc: raise HTTPException(status_code=404, detail="Account not found")
-    acc = Account.from_doc(doc)
-    return [{ "id": p.id, "payer": p.payer, "amount": p.amount, "envelopes": p.envelopes } for p in acc.list_pay_sources()]
+async def get_paysources(account_id: str, token: UserInDB = Depends(auth.get_current_active_user)):
+    doc = await __read_account(token.user_id, account_id, "payment_sources")
+    return JsonResponse([views.pay_source(p) for p in doc["payment_sources"]])
 
 
 # user endpoints
 
 @app.get("/users/me")
-def read_users_me(current_user: User = Depends(auth.get_current_active_user)):
+async def read_users_me(current_user: User = Depends(auth.get_current_active_user)):
     return { "username": current_user.username, "email": current_user.email, "full_name": current_user.full_name, "disabled": current_user.disabled }
 
 
 @app.get("/users/exists/{username}")
-def check_if_user_exists(username):
-    print("/users/checkusername")
-    result = db.get_user(username)
+async def check_if_user_exists(username):
+    log.debug("check username", extra={ "username": username })
+    result = await db.get_user(username, secondary_ok=True)
     return result is not None
 
 
 @app.post("/users/signup")
-def create_new_user(req: NewUserRequest):
-    exists = db.get_user(req.username)
+async def create_new_user(req: NewUserRequest):
+    exists = await db.get_user(req.username)
     if exists:
         raise HTTPException(status_code=400, detail="Username taken")
-    hashed = auth.get_password_hash(req.password)
+    hashed = await auth.get_password_hash(req.password)
     user = UserInDB(**{
         "username": req.username,
         "full_name": req.full_name,
@@ -202,16 +452,29 @@ def create_new_user(req: NewUserRequest):
         "disabled": False
     })
     # insert and return the generated object id
-    result = db.insert_user(user)
+    result = await db.insert_user(user)
     return result.__str__()
     
 
 # token endpoint
 
 @app.post("/token", response_model=Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
     if not user: raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password", headers={"WWW-Authenticate": "Bearer"},)
     access_token_expires = timedelta(minutes=float(os.environ['JWT_EXPIRES']))
-    access_token = auth.create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
+    access_token = auth.create_access_token(data=auth.token_claims(user), expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+# request counts, latency histograms by route, account operation counts, the hashing pool and the database client in
+# the prometheus text format
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/users/logout")
+async def logout(current_user: UserInDB = Depends(auth.get_current_active_user)):
+    await auth.revoke_tokens(current_user)
+    return True
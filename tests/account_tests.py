@@ -11,11 +11,11 @@ class AccountTestFixture(unittest.TestCase):
         # given
         acc = Account("12345", "MyBankName")
         # when
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         # then
         self.assertEqual(1, acc.envelope_count)
-        self.assertEqual(100.00, acc.amount_in_envelope(0))
-        self.assertEqual(100.00, acc.balance)
+        self.assertEqual(100_00, acc.amount_in_envelope(0))
+        self.assertEqual(100_00, acc.balance)
         self.assertEqual("Account Opened", acc.last_tx.description)
         self.assertIn("DEPOSIT              Account Opened                                     Available                                 100.00   100.00", acc.last_tx.to_string())
 
@@ -23,10 +23,10 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_cannot_add_envelopes_with_default_amounts_that_total_more_than_account_balance(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         # when
         with self.assertRaises(ValueError) as ctx:
-            acc.add_envelopes([Envelope(1, "Shopping", 101.00)])
+            acc.add_envelopes([Envelope(1, "Shopping", 101_00)])
         # then
         self.assertEqual("Not enough money to assign to the passed in envelopes. Required:  101.00, Actual:  100.00", str(ctx.exception))
 
@@ -34,7 +34,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_cannot_add_envelope_with_id_of_0(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         # when
         with self.assertRaises(ValueError) as ctx:
             acc.add_envelopes([Envelope(0, "illegal", 0)])
@@ -45,7 +45,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_add_envelopes(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         # when
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # then
@@ -55,7 +55,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_add_single_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         acc.add_envelope(Envelope(2, "Fuel", 0))
@@ -66,7 +66,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_list_envelopes(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         envelopes = acc.list_envelopes()
@@ -79,7 +79,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_rename_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         acc.rename_envelope(1, "Groceries")
@@ -90,7 +90,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_rename_the_special_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         acc.rename_envelope(0, "Spare")
@@ -101,7 +101,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_cannot_rename_envelope_to_an_empty_string(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         with self.assertRaises(ValueError) as ctx:
@@ -113,7 +113,7 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_cannot_rename_envelope_that_does_not_exist(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         with self.assertRaises(ValueError) as ctx:
@@ -125,39 +125,39 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_deposit_amount_into_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
-        acc.deposit(1, "for shopping", 50.00)
+        acc.deposit(1, "for shopping", 50_00)
         # then
-        self.assertEqual(100.00, acc.amount_in_envelope(0))
-        self.assertEqual(50.00, acc.amount_in_envelope(1))
-        self.assertEqual(150.00, acc.balance)
+        self.assertEqual(100_00, acc.amount_in_envelope(0))
+        self.assertEqual(50_00, acc.amount_in_envelope(1))
+        self.assertEqual(150_00, acc.balance)
         self.assertIn("DEPOSIT              for shopping                                       Shopping                                   50.00   150.00", acc.last_tx.to_string())
 
 
     def test_account_can_move_money_from_one_envelope_to_another(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
-        acc.move(0, 1, "for shopping", 70.00)
+        acc.move(0, 1, "for shopping", 70_00)
         # then
-        self.assertEqual(30.00, acc.amount_in_envelope(0))
-        self.assertEqual(70.00, acc.amount_in_envelope(1))
-        self.assertEqual(100.00, acc.balance)
+        self.assertEqual(30_00, acc.amount_in_envelope(0))
+        self.assertEqual(70_00, acc.amount_in_envelope(1))
+        self.assertEqual(100_00, acc.balance)
         self.assertIn("MOVE                 for shopping                                       Available -> Shopping                      70.00   100.00", acc.last_tx.to_string())
 
 
     def test_account_cannot_move_more_money_between_envelopes_than_is_available_in_source_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         with self.assertRaises(ValueError) as ctx:
-            acc.move(0, 1, "for shopping", 101.00)
+            acc.move(0, 1, "for shopping", 101_00)
         # then
         self.assertEqual(f"Not enough money in '{acc.overflow_envelope_name}' envelope", str(ctx.exception))
         
@@ -165,37 +165,37 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_debit_amount_from_envelope_with_funds(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
-        acc.debit(0, "paid bills", 100.00)
+        acc.debit(0, "paid bills", 100_00)
         # then
-        self.assertEqual(0.00, acc.amount_in_envelope(0))
-        self.assertEqual(0.00, acc.balance)
+        self.assertEqual(0, acc.amount_in_envelope(0))
+        self.assertEqual(0, acc.balance)
         self.assertIn("DEBIT                paid bills                                         Available                                -100.00     0.00", acc.last_tx.to_string())
 
 
     def test_account_can_debit_amount_from_envelope_with_more_funds_than_available_when_account_allowed_to_go_negative(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
-        acc.debit(0, "paid bills", 100.01)
+        acc.debit(0, "paid bills", 100_01)
         # then
-        self.assertEqual(-0.01, round(acc.amount_in_envelope(0),2))
-        self.assertEqual(-0.01, round(acc.balance, 2))
+        self.assertEqual(-1, acc.amount_in_envelope(0))
+        self.assertEqual(-1, acc.balance)
         self.assertIn("DEBIT                paid bills                                         Available                                -100.01    -0.01", acc.last_tx.to_string())
 
 
     def test_account_cannot_debit_amount_from_envelope_with_not_enough_funds_when_account_not_allowed_to_go_negative(self):
         # given
         acc = Account("12345", "MyBankName", False)
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         with self.assertRaises(ValueError) as ctx:
-            acc.debit(0, "paid bills", 100.01)
+            acc.debit(0, "paid bills", 100_01)
         # then
         self.assertEqual("Cannot debit more than is available in 'Available' when account is not allowed to go negative", str(ctx.exception))
 
@@ -203,23 +203,23 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_withdraw_amount_from_envelope_with_more_funds_than_available_when_account_allowed_to_go_negative(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         # when
-        acc.atm(0, "paid bills", 100.01)
+        acc.atm(0, "paid bills", 100_01)
         # then
-        self.assertEqual(-0.01, round(acc.amount_in_envelope(0),2))
-        self.assertEqual(-0.01, round(acc.balance, 2))
+        self.assertEqual(-1, acc.amount_in_envelope(0))
+        self.assertEqual(-1, acc.balance)
         self.assertIn("ATM                  paid bills                                         Available                                -100.01    -0.01", acc.last_tx.to_string())
 
 
     def test_account_cannot_withdraw_amount_from_envelope_with_not_enough_funds_when_account_not_allowed_to_go_negative(self):
         # given
         acc = Account("12345", "MyBankName", False)
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
         # when
         with self.assertRaises(ValueError) as ctx:
-            acc.atm(0, "paid bills", 100.01)
+            acc.atm(0, "paid bills", 100_01)
         # then
         self.assertEqual("Cannot withdraw more than is available in 'Available' when account is not allowed to go negative", str(ctx.exception))
 
@@ -227,14 +227,14 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_debit_amount_from_envelope_then_undo(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
-        acc.debit(0, "paid bills", 100.00)
+        acc.debit(0, "paid bills", 100_00)
         # when
         acc.undo(acc.last_tx)        
         # then
-        self.assertEqual(100.00, acc.amount_in_envelope(0))
-        self.assertEqual(100.00, acc.balance)
+        self.assertEqual(100_00, acc.amount_in_envelope(0))
+        self.assertEqual(100_00, acc.balance)
 
 
     def test_account_can_deposit_amount_into_envelope_then_undo(self):
@@ -242,7 +242,7 @@ class AccountTestFixture(unittest.TestCase):
         acc = Account("12345", "MyBankName")
         acc.open("ABC1", "12345", 0)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
-        acc.deposit(0, "some cash", 100.00)
+        acc.deposit(0, "some cash", 100_00)
         # when
         acc.undo(acc.last_tx)
         # then
@@ -252,68 +252,68 @@ class AccountTestFixture(unittest.TestCase):
     def test_account_can_move_amount_between_envelopes_then_undo(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 100.00)
+        acc.open("ABC1", "12345", 100_00)
         acc.add_envelopes([Envelope(1, "Shopping", 0)])
-        acc.move(0, 1, "for shopping", 70.00)
+        acc.move(0, 1, "for shopping", 70_00)
         # when
         acc.undo(acc.last_tx)
         # then
-        self.assertEqual(100.00, acc.amount_in_envelope(0))
+        self.assertEqual(100_00, acc.amount_in_envelope(0))
         self.assertEqual(0, acc.amount_in_envelope(1))
 
 
     def test_account_can_specify_payment_source_and_amounts_to_pay_into_each_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 0.00)
+        acc.open("ABC1", "12345", 0)
         acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0), Envelope(3, "Gas/Electric", 0)])
         # when
-        acc.add_payment_source(PaymentSource(0, "Umbrella Corporation", 1000.00, [PaymentSourceEnvelope(1, 600), PaymentSourceEnvelope(2, 200), PaymentSourceEnvelope(3, 150)]))
+        acc.add_payment_source(PaymentSource(0, "Umbrella Corporation", 1000_00, [PaymentSourceEnvelope(1, 600), PaymentSourceEnvelope(2, 200), PaymentSourceEnvelope(3, 150)]))
         # then
         self.assertEqual(acc.pay_source_count, 1)
 
     def test_account_can_specify_second_payment_source_and_amounts_to_pay_into_each_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 0.00)
+        acc.open("ABC1", "12345", 0)
         acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0), Envelope(3, "Gas/Electric", 0), Envelope(4, "Loan", 0)])
         # when
-        acc.add_payment_source(PaymentSource(0, "Umbrella Corporation", 1000.00, [PaymentSourceEnvelope(1, 600), PaymentSourceEnvelope(2, 200), PaymentSourceEnvelope(3, 150)]))
-        acc.add_payment_source(PaymentSource(0, "Massive Dynamic", 500.00, [PaymentSourceEnvelope(4, 250)]))
+        acc.add_payment_source(PaymentSource(0, "Umbrella Corporation", 1000_00, [PaymentSourceEnvelope(1, 600), PaymentSourceEnvelope(2, 200), PaymentSourceEnvelope(3, 150)]))
+        acc.add_payment_source(PaymentSource(0, "Massive Dynamic", 500_00, [PaymentSourceEnvelope(4, 250)]))
         # then
         self.assertEqual(acc.pay_source_count, 2)
 
     def test_account_does_not_allow_payment_source_to_specify_envelopes_that_it_does_not_contain(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 0.00)
+        acc.open("ABC1", "12345", 0)
         acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0), Envelope(3, "Gas/Electric", 0)])
         # when
         with self.assertRaises(ValueError) as ctx:
-            acc.add_payment_source(PaymentSource(0, "Umbrella Corporation", 1000.00, [PaymentSourceEnvelope(99, 600)]))
+            acc.add_payment_source(PaymentSource(0, "Umbrella Corporation", 1000_00, [PaymentSourceEnvelope(99, 600)]))
         # then
         self.assertEqual("pay_source must only contain ids of existing account envelopes", str(ctx.exception))
 
     def test_account_can_pay_and_distribute_money_into_designated_envelopes__and_assigns_remainder_to_available_envelope(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 0.00)
+        acc.open("ABC1", "12345", 0)
         acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0)])
-        payment_source = PaymentSource(0, "ACME Ltd.", 1100.00, [PaymentSourceEnvelope(1, 700.00), PaymentSourceEnvelope(2, 300.00)])
+        payment_source = PaymentSource(0, "ACME Ltd.", 1100_00, [PaymentSourceEnvelope(1, 700_00), PaymentSourceEnvelope(2, 300_00)])
         # when
         acc.pay("Pay day!", payment_source)
         # then
-        self.assertEqual(100.00, acc.amount_in_envelope(0))
-        self.assertEqual(700.00, acc.amount_in_envelope(1))
-        self.assertEqual(300.00, acc.amount_in_envelope(2))
+        self.assertEqual(100_00, acc.amount_in_envelope(0))
+        self.assertEqual(700_00, acc.amount_in_envelope(1))
+        self.assertEqual(300_00, acc.amount_in_envelope(2))
         self.assertIn("PAY                  ACME Ltd. - Pay day!                                                                        1100.00  1100.00", acc.last_tx.to_string())
 
     def test_account_does_not_accept_pay_that_totals_less_than_declared_envelope_values(self):
         # given
         acc = Account("12345", "MyBankName")
-        acc.open("ABC1", "12345", 0.00)
+        acc.open("ABC1", "12345", 0)
         acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0)])
-        payment_source = PaymentSource(0, "ACME Ltd.", 900.00, [PaymentSourceEnvelope(1, 700.00), PaymentSourceEnvelope(2, 300.00)])
+        payment_source = PaymentSource(0, "ACME Ltd.", 900_00, [PaymentSourceEnvelope(1, 700_00), PaymentSourceEnvelope(2, 300_00)])
         # when
         with self.assertRaises(ValueError) as ctx:
             acc.pay("Pay day!", payment_source)
@@ -321,5 +321,154 @@ class AccountTestFixture(unittest.TestCase):
         self.assertIn("Payment amount must equal or exceed the sum total of payment source envelopes", str(ctx.exception))
 
 
+    def test_account_pay_returns_only_the_envelopes_it_changed(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 0)
+        acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0), Envelope(3, "Holiday", 0)])
+        payment_source = PaymentSource(0, "ACME Ltd.", 1100_00, [PaymentSourceEnvelope(2, 300_00)])
+        # when
+        changed = acc.pay("Pay day!", payment_source)
+        # then
+        self.assertEqual([0, 2], [e.id for e in changed])
+        self.assertEqual([800_00, 300_00], [e.balance for e in changed])
+
+
+    def test_account_undo_returns_only_the_envelopes_it_changed(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0), Envelope(3, "Holiday", 0)])
+        acc.move(0, 3, "saving up", 40_00)
+        # when
+        changed = acc.undo(acc.last_tx)
+        # then
+        self.assertEqual([0, 3], [e.id for e in changed])
+
+
+    def test_account_move_to_the_same_envelope_returns_it_as_source_and_destination(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0)])
+        # when
+        changed = acc.move(0, 0, "nowhere", 40_00)
+        # then
+        self.assertEqual([0, 0], [e.id for e in changed])
+        self.assertEqual([100_00, 100_00], [e.balance for e in changed])
+        self.assertEqual([0], [e.id for e in acc.dirty_envelopes])
+
+
+    def test_account_tracks_every_envelope_changed_since_it_was_loaded(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0), Envelope(3, "Holiday", 0)])
+        # when
+        acc.deposit(3, "gift", 10_00)
+        acc.move(0, 1, "food", 20_00)
+        acc.debit(3, "flights", 5_00)
+        # then
+        self.assertEqual([0, 1, 3], [e.id for e in acc.dirty_envelopes])
+
+
+    def test_account_keeps_only_the_most_recent_transactions_newest_first(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        # when
+        for i in range(Account.RECENT_TX_LIMIT + 5): acc.deposit(0, f"deposit {i}", 1_00)
+        # then
+        self.assertEqual(Account.RECENT_TX_LIMIT, len(acc.recent_transactions))
+        self.assertEqual(acc.last_tx_id, acc.recent_transactions[0].id)
+        self.assertEqual(acc.last_tx_id - Account.RECENT_TX_LIMIT + 1, acc.recent_transactions[-1].id)
+
+
+    def test_account_loaded_from_doc_has_its_last_transaction_for_undo(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0)])
+        acc.move(0, 1, "food", 40_00)
+        doc = acc.to_doc()
+        doc["_id"] = "ABC1"
+        # when
+        loaded = Account.from_doc(doc)
+        loaded.undo(loaded.last_tx)
+        # then
+        self.assertEqual(100_00, loaded.amount_in_envelope(0))
+        self.assertEqual(0, loaded.last_tx.id)
+        self.assertEqual("Account Opened", loaded.last_tx.description)
+        self.assertEqual([0], [t.id for t in loaded.recent_transactions])
+
+
+    def test_account_without_recent_transactions_has_no_last_transaction_when_loaded(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        doc = acc.to_doc()
+        doc["_id"] = "ABC1"
+        del doc["recent_txs"]
+        # when
+        loaded = Account.from_doc(doc)
+        # then
+        self.assertIsNone(loaded.last_tx)
+        self.assertEqual([], loaded.recent_transactions)
+
+
+    def test_account_finds_envelopes_by_their_current_name(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Shopping", 0)])
+        # when
+        acc.rename_envelope(1, "Food")
+        # then
+        self.assertTrue(acc.envelope_exists("Food"))
+        self.assertTrue(acc.envelope_exists("Shopping"))
+        acc.rename_envelope(2, "Fuel")
+        self.assertFalse(acc.envelope_exists("Shopping"))
+
+
+    def test_account_keeps_the_total_allocated_to_envelopes_as_money_moves(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0)])
+        # when
+        acc.deposit(1, "gift", 10_00)
+        acc.move(0, 2, "saving", 30_00)
+        acc.pay("Pay day!", PaymentSource(0, "ACME Ltd.", 500_00, [PaymentSourceEnvelope(2, 100_00)]))
+        acc.debit(1, "food", 5_50)
+        acc.undo(acc.last_tx)
+        doc = acc.to_doc()
+        doc["_id"] = "ABC1"
+        # then
+        self.assertEqual(sum(e.balance for e in acc.list_envelopes()), acc.allocated)
+        self.assertEqual(acc.allocated, Account.from_doc(doc).allocated)
+
+
+    def test_account_loaded_from_a_document_saves_and_lists_what_it_has_not_used(self):
+        # given
+        acc = Account("12345", "MyBankName")
+        acc.open("ABC1", "12345", 100_00)
+        acc.add_envelopes([Envelope(1, "Shopping", 0)])
+        acc.add_payment_source(PaymentSource(0, "ACME Ltd.", 500_00, [PaymentSourceEnvelope(1, 100_00)]))
+        acc.deposit(1, "gift", 10_00)
+        doc = acc.to_doc()
+        doc["_id"] = "ABC1"
+        # when
+        loaded = Account.from_doc(doc)
+        saved = loaded.to_doc()
+        loaded.debit(1, "food", 5_00)
+        # then
+        self.assertEqual(doc["payment_sources"], saved["payment_sources"])
+        self.assertEqual(doc["recent_txs"], saved["recent_txs"])
+        self.assertEqual(1, loaded.pay_source_count)
+        self.assertEqual([2, 1, 0], [t.id for t in loaded.recent_transactions])
+        self.assertIs(loaded.last_tx, loaded.recent_transactions[0])
+        self.assertEqual(100_00, loaded.list_pay_sources()[0].envelopes[0].amount)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,192 @@
+import copy
+import os
+import unittest
+
+import pymongo
+from bson.objectid import ObjectId
+from app import queries
+from domain.account import Account
+from domain.envelope import Envelope
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+class AtomicChangeTestFixture(unittest.TestCase):
+
+    def __account(self, can_go_negative, balances):
+        acc = Account("12345", "MyBankName", can_go_negative)
+        acc.open("ABC1", "12345", sum(balances))
+        acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, len(balances))])
+        for i, balance in enumerate(balances[1:], start=1): acc.move(0, i, "setup", balance)
+        doc = acc.to_doc()
+        doc["_id"] = "ABC1"
+        return doc
+
+
+    # run an operation through Account and through its AtomicChange applied to the stored document and compare the outcome
+    def __assert_paths_agree(self, doc, operation, change):
+        acc = Account.from_doc(copy.deepcopy(doc))
+        try:
+            operation(acc)
+            expected = acc.to_doc()
+        except (ValueError, IndexError):
+            expected = None
+        fast = copy.deepcopy(doc)
+        if change.matches(fast):
+            change.apply_to(fast)
+            tx = change.transaction(fast)
+            self.assertIsNotNone(expected, "fast path accepted what the domain rejected")
+            self.assertEqual(expected["last_tx_id"], fast["last_tx_id"])
+            self.assertEqual(expected["balance"], fast["balance"])
+            self.assertEqual([e["balance"] for e in expected["envelopes"]], [e["balance"] for e in fast["envelopes"]])
+            self.assertEqual(acc.last_tx.to_doc()["envelope"], tx.to_doc()["envelope"])
+            self.assertEqual(acc.last_tx.amount, tx.amount)
+        else:
+            self.assertIsNone(expected, "fast path rejected what the domain accepted")
+
+
+    def test_debit_is_accepted_and_rejected_the_same_by_both_paths(self):
+        for can_go_negative in (True, False):
+            for amount in (0, 9_99, 10_00, 10_01, 250_00):
+                for envelope_id in (0, 1, 2, 3):
+                    with self.subTest(can_go_negative=can_go_negative, amount=amount, envelope_id=envelope_id):
+                        # given
+                        doc = self.__account(can_go_negative, [10_00, 10_00, 0])
+                        # when / then
+                        self.__assert_paths_agree(doc, lambda acc: acc.debit(envelope_id, "test", amount), Account.debit_change(envelope_id, "test", amount))
+
+
+    def test_move_is_accepted_and_rejected_the_same_by_both_paths(self):
+        for amount in (0, 4_99, 5_00, 5_01):
+            for src_id, dest_id in ((0, 1), (1, 0), (2, 1), (1, 1), (0, 2)):
+                with self.subTest(amount=amount, src_id=src_id, dest_id=dest_id):
+                    # given
+                    doc = self.__account(False, [5_00, 5_00, 0])
+                    # when / then
+                    self.__assert_paths_agree(doc, lambda acc: acc.move(src_id, dest_id, "test", amount), Account.move_change(src_id, dest_id, "test", amount))
+
+
+    def test_deposit_gives_the_same_result_by_both_paths(self):
+        for envelope_id in (0, 2, 3):
+            with self.subTest(envelope_id=envelope_id):
+                # given
+                doc = self.__account(True, [1_10, 2_20, 3_30])
+                # when / then
+                self.__assert_paths_agree(doc, lambda acc: acc.deposit(envelope_id, "test", 10), Account.deposit_change(envelope_id, "test", 10))
+
+
+    def test_the_update_adds_to_only_the_changed_balances(self):
+        # given
+        change = Account.move_change(1, 2, "test", 12_50)
+        # when
+        update = change.to_update()
+        # then
+        self.assertEqual({ "$inc": { "last_tx_id": 1, "envelopes.1.balance": -12_50, "envelopes.2.balance": 12_50 } }, update)
+
+
+    def test_debit_guard_becomes_a_query_filter(self):
+        # given
+        change = Account.debit_change(2, "test", 12_50)
+        # when
+        query = change.to_filter()
+        # then
+        self.assertEqual({ "envelopes.2": { "$exists": True }, "$and": [{ "$or": [{ "envelopes.2.balance": { "$gte": 12_50 } }, { "can_go_negative": { "$eq": True } }] }] }, query)
+        self.assertEqual({ "last_tx_id": 1, "balance": -12_50, "envelopes.2.balance": -12_50 }, change.increments)
+
+
+
+# the same comparison made with the filter and updates the repository really sends, run by a mongod given in
+# TEST_DB_CONNECTION_STRING or else by mongomock, and skipped when there is neither
+@unittest.skipUnless(os.environ.get("TEST_DB_CONNECTION_STRING") or mongomock, "needs TEST_DB_CONNECTION_STRING or mongomock")
+class AtomicChangeDatabaseTestFixture(unittest.TestCase):
+
+    def setUp(self):
+        connection = os.environ.get("TEST_DB_CONNECTION_STRING")
+        client = pymongo.MongoClient(connection) if connection else mongomock.MongoClient()
+        self.accounts = client["nvelopes_tests"]["accounts"]
+        self.accounts.drop()
+
+
+    def __account(self, can_go_negative, balances):
+        acc = Account("12345", "MyBankName", can_go_negative)
+        acc.open(str(ObjectId()), "12345", sum(balances))
+        acc.add_envelopes([Envelope(i, f"Envelope {i}", 0) for i in range(1, len(balances))])
+        for i, balance in enumerate(balances[1:], start=1): acc.move(0, i, "setup", balance)
+        doc = acc.to_doc()
+        doc["_id"] = ObjectId(acc.id)
+        self.accounts.insert_one(doc)
+        return doc
+
+
+    # the fast path as apply_change sends it: the conditional $inc, then the $push of the transaction built from its result
+    def __fast(self, doc, change):
+        updated = self.accounts.find_one_and_update(queries.change_filter("12345", str(doc["_id"]), change), change.to_update(), projection=change.projection(), return_document=pymongo.ReturnDocument.AFTER)
+        if updated is None: return None
+        tx = change.transaction(updated)
+        self.accounts.update_one({ "_id": updated["_id"] }, { "$push": queries.recent([tx]) })
+        return tx
+
+
+    # the normal path: load, apply in the domain, save the changes filtered on the version read
+    def __slow(self, doc, operation):
+        acc = Account.from_doc(self.accounts.find_one({ "_id": doc["_id"] }))
+        try:
+            operation(acc)
+        except ValueError:
+            return None
+        result = self.accounts.update_one(queries.versioned(acc), queries.account_save(acc, acc.dirty_envelopes, [acc.last_tx]))
+        queries.check_version(result)
+        return acc.last_tx
+
+
+    # the stored account without what differs between two copies of it
+    def __stored(self, doc):
+        stored = self.accounts.find_one({ "_id": doc["_id"] }, { "_id": 0 })
+        for tx in stored["recent_txs"]: del tx["date"], tx["account_id"]
+        return stored
+
+
+    def __assert_paths_agree(self, balances, can_go_negative, operation, change):
+        # given
+        fast_doc = self.__account(can_go_negative, balances)
+        slow_doc = copy.deepcopy(fast_doc)
+        slow_doc["_id"] = ObjectId()
+        self.accounts.insert_one(slow_doc)
+        before = self.__stored(fast_doc)
+        # when
+        fast_tx = self.__fast(fast_doc, change)
+        slow_tx = self.__slow(slow_doc, operation)
+        # then
+        self.assertEqual(slow_tx is None, fast_tx is None)
+        if fast_tx is None: self.assertEqual(before, self.__stored(fast_doc), "a refused change wrote to the account")
+        self.assertEqual(self.__stored(slow_doc), self.__stored(fast_doc))
+
+
+    def test_debit_refused_by_the_guard_leaves_the_account_as_it_was(self):
+        self.__assert_paths_agree([10_00, 10_00, 0], False, lambda acc: acc.debit(2, "test", 10_01), Account.debit_change(2, "test", 10_01))
+
+
+    def test_debit_within_the_balance_is_applied_the_same(self):
+        self.__assert_paths_agree([10_00, 10_00, 0], False, lambda acc: acc.debit(1, "test", 9_99), Account.debit_change(1, "test", 9_99))
+
+
+    def test_debit_below_zero_is_applied_the_same_when_the_account_can_go_negative(self):
+        self.__assert_paths_agree([10_00, 10_00, 0], True, lambda acc: acc.debit(2, "test", 25_00), Account.debit_change(2, "test", 25_00))
+
+
+    def test_move_is_applied_the_same(self):
+        self.__assert_paths_agree([5_00, 5_00, 0], False, lambda acc: acc.move(1, 2, "test", 4_99), Account.move_change(1, 2, "test", 4_99))
+
+
+    def test_move_refused_by_the_guard_leaves_the_account_as_it_was(self):
+        self.__assert_paths_agree([5_00, 5_00, 0], False, lambda acc: acc.move(2, 1, "test", 1), Account.move_change(2, 1, "test", 1))
+
+
+    def test_deposit_is_applied_the_same(self):
+        self.__assert_paths_agree([1_10, 2_20, 3_30], True, lambda acc: acc.deposit(2, "test", 10), Account.deposit_change(2, "test", 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+
+from app.concurrency import ConcurrencyError, ConflictRetry
+from domain.account import Account
+
+class ConcurrencyTestFixture(unittest.TestCase):
+
+    def test_account_version_is_the_last_tx_id_it_was_loaded_with(self):
+        # given
+        acc = Account.from_doc({ "_id": "ABC1", "owner_id": "12345", "name": "MyBankName", "balance": 100_00, "last_tx_id": 7, "can_go_negative": True, "envelopes": [{ "id": 0, "name": "Available", "balance": 100_00 }], "payment_sources": [] })
+        # when
+        acc.deposit(0, "salary", 10_00)
+        # then
+        self.assertEqual(7, acc.version)
+        self.assertEqual(8, acc.last_tx_id)
+
+
+    def test_operation_is_run_again_until_it_stops_conflicting(self):
+        # given
+        retry = ConflictRetry(3, 0)
+        calls = []
+        async def operation():
+            calls.append(1)
+            if len(calls) < 3: raise ConcurrencyError("account has changed since it was loaded")
+            return "saved"
+        # when
+        result = asyncio.run(retry.run(operation))
+        # then
+        self.assertEqual("saved", result)
+        self.assertEqual(2, retry.stats()["conflicts"])
+
+
+    def test_gives_up_once_the_retries_are_exhausted(self):
+        # given
+        retry = ConflictRetry(2, 0)
+        async def operation():
+            raise ConcurrencyError("account has changed since it was loaded")
+        # when
+        with self.assertRaises(ConcurrencyError) as ctx:
+            asyncio.run(retry.run(operation))
+        # then
+        self.assertIn("gave up after 3 attempts", str(ctx.exception))
+        self.assertEqual(1, retry.stats()["exhausted"])
+
+
+    def test_other_errors_are_not_retried(self):
+        # given
+        retry = ConflictRetry(5, 0)
+        calls = []
+        async def operation():
+            calls.append(1)
+            raise ValueError("Not enough money in 'Available' envelope")
+        # when
+        with self.assertRaises(ValueError):
+            asyncio.run(retry.run(operation))
+        # then
+        self.assertEqual(1, len(calls))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+
+from bson.timestamp import Timestamp
+from app import consistency
+
+class ConsistencyTestFixture(unittest.TestCase):
+
+    def test_token_round_trips_and_a_bad_one_is_rejected(self):
+        # when
+        token = consistency.encode_token(Timestamp(1626000000, 7))
+        # then
+        self.assertEqual(Timestamp(1626000000, 7), consistency.decode_token(token))
+        with self.assertRaises(ValueError):
+            consistency.decode_token("not-a-token")
+
+
+    def test_response_carries_the_latest_write_and_reads_wait_for_it(self):
+        # given a request that sent a token and then wrote twice
+        seen = []
+        async def endpoint(scope, receive, send):
+            seen.append(consistency.read_after())
+            consistency.wrote(Timestamp(1626000002, 1))
+            consistency.wrote(Timestamp(1626000001, 5))
+            await send({ "type": "http.response.start", "status": 200, "headers": [] })
+        sent = []
+        async def send(message): sent.append(message)
+        headers = [(b"x-read-after", consistency.encode_token(Timestamp(1626000000, 3)).encode())]
+        # when
+        asyncio.run(consistency.ReadAfterMiddleware(endpoint)({ "type": "http", "headers": headers }, None, send))
+        # then
+        self.assertEqual([Timestamp(1626000000, 3)], seen)
+        token = dict(sent[0]["headers"])[b"x-read-after"].decode()
+        self.assertEqual(Timestamp(1626000002, 1), consistency.decode_token(token))
+        self.assertIsNone(consistency.read_after())
+
+
+    def test_a_request_that_only_reads_gets_no_token(self):
+        # given
+        async def endpoint(scope, receive, send):
+            await send({ "type": "http.response.start", "status": 200, "headers": [] })
+        sent = []
+        async def send(message): sent.append(message)
+        # when
+        asyncio.run(consistency.ReadAfterMiddleware(endpoint)({ "type": "http", "headers": [(b"x-read-after", b"garbage")] }, None, send))
+        # then
+        self.assertEqual([], sent[0]["headers"])
+
+
+if __name__ == '__main__':
+    unittest.main()
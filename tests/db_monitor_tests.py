@@ -0,0 +1,55 @@
+import unittest
+
+from types import SimpleNamespace
+from app.db_monitor import DbMonitor
+
+class DbMonitorTestFixture(unittest.TestCase):
+
+    ADDRESS = ("mongo1", 27017)
+
+    def __command(self, monitor, request_id, name, command, micros, ok=True):
+        monitor.started(SimpleNamespace(command=command, command_name=name, request_id=request_id))
+        event = SimpleNamespace(command_name=name, request_id=request_id, duration_micros=micros)
+        if ok: monitor.succeeded(event)
+        else: monitor.failed(event)
+
+
+    def test_connections_are_counted_while_checked_out(self):
+        # given
+        monitor = DbMonitor()
+        for _ in range(2): monitor.connection_created(SimpleNamespace(address=self.ADDRESS))
+        # when
+        for _ in range(2):
+            monitor.connection_check_out_started(SimpleNamespace(address=self.ADDRESS))
+            monitor.connection_checked_out(SimpleNamespace(address=self.ADDRESS))
+        monitor.connection_checked_in(SimpleNamespace(address=self.ADDRESS))
+        monitor.connection_check_out_started(SimpleNamespace(address=self.ADDRESS))
+        monitor.connection_check_out_failed(SimpleNamespace(address=self.ADDRESS, reason="timeout"))
+        # then
+        pool = monitor.stats()["pool"]
+        self.assertEqual({ "mongo1:27017": { "open": 2, "in_use": 1 } }, pool["servers"])
+        self.assertEqual(2, pool["in_use_max"])
+        self.assertEqual(3, pool["checkout_wait"]["count"])
+        self.assertEqual({ "timeout": 1 }, pool["checkout_failures"])
+
+
+    def test_commands_are_timed_by_collection_and_transactions_counted(self):
+        # given
+        monitor = DbMonitor()
+        session = { "id": b"session-1" }
+        # when a transaction's commit is retried once before it succeeds
+        self.__command(monitor, 1, "update", { "update": "accounts", "lsid": session, "txnNumber": 4, "startTransaction": True }, 2000)
+        self.__command(monitor, 2, "insert", { "insert": "transactions", "lsid": session, "txnNumber": 4 }, 1000)
+        self.__command(monitor, 3, "commitTransaction", { "lsid": session, "txnNumber": 4 }, 5000, ok=False)
+        self.__command(monitor, 4, "commitTransaction", { "lsid": session, "txnNumber": 4 }, 3000)
+        self.__command(monitor, 5, "update", { "update": "accounts", "lsid": session, "txnNumber": 5, "startTransaction": True }, 4000)
+        self.__command(monitor, 6, "abortTransaction", { "lsid": session, "txnNumber": 5 }, 1000)
+        # then
+        stats = monitor.stats()
+        self.assertEqual({ "count": 2, "failures": 0, "seconds_avg": 0.003, "seconds_max": 0.004 }, stats["commands"]["update accounts"])
+        self.assertEqual(2, stats["commands"]["commitTransaction"]["count"])
+        self.assertEqual({ "started": 2, "committed": 1, "commit_failures": 1, "commit_retries": 1, "aborted": 1 }, stats["transactions"])
+
+
+if __name__ == '__main__':
+    unittest.main()
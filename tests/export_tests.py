@@ -0,0 +1,63 @@
+import asyncio
+import csv
+import io
+import json
+import unittest
+
+from datetime import datetime
+from app import export
+
+class ExportTestFixture(unittest.TestCase):
+
+    def __doc(self, tx_id, op, amount, balance, pay_envelopes=None):
+        return { "tx_id": tx_id, "owner_id": "12345", "account_id": "ABC1", "envelope_id_src": 0, "envelope_id_dest": -1, "envelope": "Available", "op": op, "description": f"tx {tx_id}", "amount": amount, "account_balance": balance, "date": datetime(2021, 7, 10, 12, 0, tx_id), "pay_envelopes": pay_envelopes }
+
+
+    # the documents as the cursor yields them, in batches
+    def __batches(self, *batches):
+        async def gen():
+            for batch in batches: yield [dict(d) for d in batch]
+        return gen()
+
+
+    def __body(self, chunks) -> list:
+        async def collect():
+            return [c async for c in chunks]
+        return asyncio.run(collect())
+
+
+    def test_ndjson_writes_one_transaction_per_line_in_major_units(self):
+        # given
+        batches = self.__batches([self.__doc(0, "DEPOSIT", 100_00, 100_00)], [self.__doc(1, "PAY", 50_00, 150_00, [{ "id": 1, "amount": 20_00 }])])
+        # when
+        chunks = self.__body(export.ndjson(batches))
+        # then
+        self.assertEqual(2, len(chunks))
+        lines = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual([0, 1], [t["tx_id"] for t in lines])
+        self.assertEqual([100.0, 50.0], [t["amount"] for t in lines])
+        self.assertEqual(20.0, lines[1]["pay_envelopes"][0]["amount"])
+        self.assertEqual("2021-07-10T12:00:01", lines[1]["date"])
+
+
+    def test_csv_writes_a_header_then_a_row_per_transaction(self):
+        # given
+        batches = self.__batches([self.__doc(0, "DEPOSIT", 100_00, 100_00), self.__doc(1, "PAY", 50_00, 150_00, [{ "id": 1, "amount": 20_00 }])])
+        # when
+        rows = list(csv.reader(io.StringIO("".join(self.__body(export.csv_rows(batches))))))
+        # then
+        self.assertEqual(export.CSV_COLUMNS, rows[0])
+        self.assertEqual(["0", "2021-07-10T12:00:00", "DEPOSIT", "tx 0", "Available", "0", "-1", "100.0", "100.0", ""], rows[1])
+        self.assertEqual('[{"id":1,"amount":20.0}]', rows[2][-1])
+        self.assertEqual(3, len(rows))
+
+
+    def test_csv_of_an_empty_history_is_just_the_header(self):
+        # when
+        body = "".join(self.__body(export.csv_rows(self.__batches())))
+        # then
+        self.assertEqual(",".join(export.CSV_COLUMNS) + "\r\n", body)
+
+
+if __name__ == '__main__':
+    unittest.main()
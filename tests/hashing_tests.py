@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from passlib.context import CryptContext
+from app.hashing import HashingPool, HashingPoolFull
+
+class HashingTestFixture(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = HashingPool(1, 0, 4)
+
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+
+    def test_a_hash_made_at_another_cost_is_rehashed_at_the_configured_one(self):
+        # given
+        hashed = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=5).hash("secret")
+        # when
+        valid, new_hash = asyncio.run(self.pool.verify("secret", hashed))
+        # then
+        self.assertTrue(valid)
+        self.assertTrue(new_hash.startswith("$2b$04$"))
+
+
+    def test_a_hash_made_at_the_configured_cost_is_kept(self):
+        # given
+        hashed = asyncio.run(self.pool.hash("secret"))
+        # when
+        valid, new_hash = asyncio.run(self.pool.verify("secret", hashed))
+        wrong, _ = asyncio.run(self.pool.verify("guess", hashed))
+        # then
+        self.assertTrue(valid)
+        self.assertIsNone(new_hash)
+        self.assertFalse(wrong)
+
+
+    def test_work_beyond_the_pool_and_its_queue_is_rejected(self):
+        # given
+        async def two_at_once():
+            return await asyncio.gather(self.pool.hash("first"), self.pool.hash("second"), return_exceptions=True)
+        # when
+        first, second = asyncio.run(two_at_once())
+        # then
+        self.assertTrue(first.startswith("$2b$04$"))
+        self.assertIsInstance(second, HashingPoolFull)
+        self.assertEqual(1, self.pool.stats()["rejected"])
+        self.assertEqual(0, self.pool.stats()["in_flight"])
+
+
+    def test_a_hash_that_fails_is_counted_without_a_latency(self):
+        # when
+        with self.assertRaises(ValueError):
+            asyncio.run(self.pool.verify("secret", "not a bcrypt hash"))
+        # then
+        stats = self.pool.stats()
+        self.assertEqual((0, 1, 0), (stats["completed"], stats["failed"], stats["in_flight"]))
+        self.assertEqual(0.0, stats["hash_seconds_avg"])
+
+
+if __name__ == '__main__':
+    unittest.main()
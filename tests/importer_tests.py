@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from datetime import datetime
+from app.importer import import_statement
+from app.memory_db import MemoryDb
+from app.statements import Rules, StatementLine
+from domain.account import Account
+from domain.envelope import Envelope
+
+# the calls an import makes, awaitable like the app's database
+class AsyncMemoryDb:
+    def __init__(self, db: MemoryDb) -> None:
+        self.db = db
+
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class ImporterTestFixture(unittest.TestCase):
+
+    def setUp(self):
+        self.db = MemoryDb()
+        acc = Account("12345", "MyBankName")
+        self.account_id = str(self.db.create_account(acc))
+        acc.open(self.account_id, "12345", 100_00)
+        self.db.open_account(acc)
+        self.db.add_envelopes(self.account_id, [Envelope(1, "Shopping", 0)])
+        self.rules = Rules([{ "pattern": "TESCO", "envelope_id": 1 }])
+
+
+    def __import(self, import_id, lines):
+        return asyncio.run(import_statement(AsyncMemoryDb(self.db), "12345", self.account_id, lines, self.rules, import_id))
+
+
+    def test_transactions_keep_the_statement_date_and_reference(self):
+        # given
+        lines = [StatementLine(0, datetime(2021, 7, 1), "TESCO", -10_00, "FIT1"), StatementLine(1, datetime(2021, 7, 2), "ACME", 250_00, "FIT2")]
+        # when
+        result = self.__import("first", lines)
+        # then
+        self.assertEqual(2, result["imported"])
+        txs = self.db.list_transactions("12345", self.account_id, None, 10)
+        self.assertEqual([(datetime(2021, 7, 2), "FIT2"), (datetime(2021, 7, 1), "FIT1")], [(t["date"], t["reference"]) for t in txs[:2]])
+
+
+    def test_lines_already_on_the_account_are_skipped_whatever_statement_they_came_from(self):
+        # given
+        self.__import("first", [StatementLine(0, datetime(2021, 7, 1), "TESCO", -10_00, "FIT1"), StatementLine(1, datetime(2021, 7, 2), "ACME", 250_00, "FIT2")])
+        # when an overlapping statement is imported, which repeats a line of its own too
+        overlapping = [StatementLine(0, datetime(2021, 7, 2), "ACME", 250_00, "FIT2"), StatementLine(1, datetime(2021, 7, 3), "TESCO", -5_00, "FIT3"), StatementLine(2, datetime(2021, 7, 3), "TESCO", -5_00, "FIT3")]
+        result = self.__import("second", overlapping)
+        # then
+        self.assertEqual((1, 2), (result["imported"], result["skipped"]))
+        doc = self.db.get_account("12345", self.account_id)
+        self.assertEqual(3, doc["last_tx_id"])
+        self.assertEqual(335_00, doc["balance"])
+
+
+    def test_lines_without_a_reference_are_always_imported(self):
+        # given
+        lines = [StatementLine(0, None, "TESCO", -10_00, ""), StatementLine(1, None, "TESCO", -10_00, "")]
+        # when
+        result = self.__import("first", lines)
+        # then
+        self.assertEqual(2, result["imported"])
+        self.assertEqual([None, None], [t["reference"] for t in self.db.list_transactions("12345", self.account_id, None, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
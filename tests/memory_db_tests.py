@@ -0,0 +1,147 @@
+import unittest
+
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from app.concurrency import ConcurrencyError
+from app.memory_db import MemoryDb
+from app.models import UserInDB
+from domain.account import Account
+from domain.envelope import Envelope
+
+class MemoryDbTestFixture(unittest.TestCase):
+
+    # an opened account saved to a new database, with the account as loaded back from it
+    def __opened(self):
+        db = MemoryDb()
+        acc = Account("12345", "MyBankName")
+        account_id = str(db.create_account(acc))
+        acc.open(account_id, "12345", 100_00)
+        db.open_account(acc)
+        db.add_envelopes(account_id, [Envelope(1, "Shopping", 0)])
+        return db, account_id, Account.from_doc(db.get_account("12345", account_id))
+
+
+    def test_saved_changes_are_read_back(self):
+        # given
+        db, account_id, acc = self.__opened()
+        changed = acc.move(0, 1, "food", 40_00)
+        # when
+        db.save_envelope_changes(acc, changed[0], changed[1])
+        # then
+        doc = db.get_account("12345", account_id)
+        self.assertEqual(1, doc["last_tx_id"])
+        self.assertEqual([60_00, 40_00], [e["balance"] for e in doc["envelopes"]])
+        self.assertEqual([0, 1], [t["tx_id"] for t in doc["recent_txs"]])
+        self.assertEqual([1, 0], [t["tx_id"] for t in db.list_transactions("12345", account_id, None, 10)])
+        self.assertIsNone(db.get_account("someone else", account_id))
+
+
+    def test_save_against_an_old_version_is_a_conflict_and_changes_nothing(self):
+        # given
+        db, account_id, acc = self.__opened()
+        stale = Account.from_doc(db.get_account("12345", account_id))
+        db.save_envelope_change(acc, acc.deposit(1, "gift", 10_00))
+        # when
+        with self.assertRaises(ConcurrencyError):
+            db.save_envelope_change(stale, stale.deposit(0, "salary", 20_00))
+        # then
+        doc = db.get_account("12345", account_id)
+        self.assertEqual(110_00, doc["balance"])
+        self.assertEqual(1, len(db.list_transactions("12345", account_id, 1, 10)))
+
+
+    def test_a_write_that_fails_part_way_is_rolled_back(self):
+        # given
+        db, account_id, acc = self.__opened()
+        acc.deposit(1, "gift", 10_00)
+        acc.deposit(1, "gift", 10_00)
+        txs = [t for t in reversed(acc.recent_transactions[:2])]
+        # when a transaction id is reused after the balances and the first transaction have been written
+        with self.assertRaises(DuplicateKeyError):
+            db.save_batch(acc, acc.dirty_envelopes, txs + [txs[0]])
+        # then
+        doc = db.get_account("12345", account_id)
+        self.assertEqual(0, doc["last_tx_id"])
+        self.assertEqual([100_00, 0], [e["balance"] for e in doc["envelopes"]])
+        self.assertEqual(1, len(doc["recent_txs"]))
+        self.assertEqual(0, db.get_last_transaction("12345", account_id)["tx_id"])
+
+
+    def test_a_batch_is_saved_in_one_write(self):
+        # given
+        db, account_id, acc = self.__opened()
+        acc.deposit(1, "gift", 10_00)
+        acc.move(0, 1, "food", 40_00)
+        acc.debit(1, "shopping", 25_00)
+        txs = list(reversed(acc.recent_transactions[:3]))
+        # when
+        db.save_batch(acc, acc.dirty_envelopes, txs)
+        # then
+        doc = db.get_account("12345", account_id)
+        self.assertEqual(3, doc["last_tx_id"])
+        self.assertEqual(85_00, doc["balance"])
+        self.assertEqual([60_00, 25_00], [e["balance"] for e in doc["envelopes"]])
+        self.assertEqual([3, 2, 1, 0], [t["tx_id"] for t in db.list_transactions("12345", account_id, None, 10)])
+
+
+    def test_a_batch_against_an_old_version_saves_none_of_its_operations(self):
+        # given
+        db, account_id, acc = self.__opened()
+        stale = Account.from_doc(db.get_account("12345", account_id))
+        db.save_envelope_change(acc, acc.deposit(1, "gift", 10_00))
+        stale.deposit(1, "gift", 10_00)
+        stale.move(0, 1, "food", 40_00)
+        # when
+        with self.assertRaises(ConcurrencyError):
+            db.save_batch(stale, stale.dirty_envelopes, list(reversed(stale.recent_transactions[:2])))
+        # then
+        doc = db.get_account("12345", account_id)
+        self.assertEqual(1, doc["last_tx_id"])
+        self.assertEqual([100_00, 10_00], [e["balance"] for e in doc["envelopes"]])
+        self.assertEqual([1, 0], [t["tx_id"] for t in db.list_transactions("12345", account_id, None, 10)])
+
+
+    def test_atomic_change_checks_the_guard_against_the_stored_account(self):
+        # given
+        db, account_id, acc = self.__opened()
+        # when
+        moved = db.apply_change("12345", account_id, Account.move_change(0, 1, "food", 60_00))
+        refused = db.apply_change("12345", account_id, Account.move_change(0, 1, "food", 60_00))
+        # then
+        self.assertEqual("Available -> Shopping", moved.to_doc()["envelope"])
+        self.assertIsNone(refused)
+        doc = db.get_account("12345", account_id)
+        self.assertEqual([40_00, 60_00], [e["balance"] for e in doc["envelopes"]])
+        self.assertEqual(1, doc["recent_txs"][-1]["tx_id"])
+
+
+    def test_undo_removes_the_transaction_and_snapshots_after_it(self):
+        # given
+        db, account_id, acc = self.__opened()
+        db.save_envelope_change(acc, acc.deposit(1, "gift", 10_00))
+        acc = Account.from_doc(db.get_account("12345", account_id))
+        db.save_snapshot(acc)
+        # when
+        db.save_all_changes_after_undo(acc, acc.undo(acc.last_tx))
+        # then
+        self.assertIsNone(db.get_snapshot(account_id))
+        self.assertEqual(0, db.get_last_transaction("12345", account_id)["tx_id"])
+        self.assertEqual([[0]], [[t["tx_id"] for t in batch] for batch in db.iter_transactions("12345", account_id, 10)])
+
+
+
+    def test_revoked_users_leave_out_logouts_older_than_a_token_can_be(self):
+        # given
+        db = MemoryDb()
+        now = datetime.utcnow()
+        ids = [db.insert_user(UserInDB(username=f"u{i}", hashed_password="x", disabled=i == 0)) for i in range(3)]
+        db.revoke_user_tokens(ids[1], now - timedelta(hours=1))
+        db.revoke_user_tokens(ids[2], now - timedelta(minutes=1))
+        # when
+        revoked = db.get_revoked_users(now - timedelta(minutes=30))
+        # then
+        self.assertEqual([ids[0], ids[2]], [u["_id"] for u in revoked])
+
+
+if __name__ == '__main__':
+    unittest.main()
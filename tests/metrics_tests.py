@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+
+from types import SimpleNamespace
+from prometheus_client import REGISTRY, CollectorRegistry
+from app.metrics import DatabaseCollector, HashingCollector, MetricsMiddleware
+
+class MetricsTestFixture(unittest.TestCase):
+
+    def __count(self, route, status):
+        return REGISTRY.get_sample_value("http_requests_total", { "method": "GET", "route": route, "status": status }) or 0
+
+
+    def __request(self, middleware, path):
+        async def send(message): pass
+        try:
+            asyncio.run(middleware({ "type": "http", "method": "GET", "path": path, "headers": [] }, None, send))
+        except RuntimeError:
+            pass
+
+
+    def test_requests_are_counted_by_route_template_and_status(self):
+        # given
+        async def get_account(scope, receive, send):
+            scope["endpoint"] = get_account
+            await send({ "type": "http.response.start", "status": 200, "headers": [] })
+        middleware = MetricsMiddleware(get_account, [SimpleNamespace(endpoint=get_account, path="/tests/{account_id}")])
+        before = self.__count("/tests/{account_id}", "200")
+        # when
+        self.__request(middleware, "/tests/1")
+        self.__request(middleware, "/tests/2")
+        # then
+        self.assertEqual(before + 2, self.__count("/tests/{account_id}", "200"))
+
+
+    def test_a_request_that_raises_is_counted_as_a_500_and_unmatched_paths_together(self):
+        # given
+        async def broken(scope, receive, send):
+            raise RuntimeError("boom")
+        middleware = MetricsMiddleware(broken, [])
+        before = self.__count("unmatched", "500")
+        # when
+        self.__request(middleware, "/anything")
+        # then
+        self.assertEqual(before + 1, self.__count("unmatched", "500"))
+
+
+    def test_the_hashing_pool_stats_are_read_when_scraped(self):
+        # given
+        stats = { "pool_size": 2, "queue_limit": 10, "bcrypt_rounds": 12, "in_flight": 3, "queue_depth": 1, "completed": 4, "failed": 1, "rejected": 2, "hash_seconds_avg": 0.25, "hash_seconds_max": 0.5, "total_seconds_avg": 0.5, "total_seconds_max": 1.0 }
+        registry = CollectorRegistry()
+        registry.register(HashingCollector(lambda: stats))
+        # when
+        stats = dict(stats, completed=8, rejected=3)
+        # then
+        self.assertEqual((8, 2.0), (registry.get_sample_value("password_hash_seconds_count"), registry.get_sample_value("password_hash_seconds_sum")))
+        self.assertEqual(3, registry.get_sample_value("password_hash_rejected_total"))
+        self.assertEqual(1, registry.get_sample_value("password_hash_queue_depth"))
+
+
+    def test_the_database_stats_are_reported_without_server_addresses(self):
+        # given
+        timing = { "count": 2, "failures": 1, "seconds_avg": 0.003, "seconds_max": 0.004 }
+        stats = { "pool": { "options": {}, "open": 3, "in_use": 1, "in_use_max": 2, "servers": { "mongo1:27017": { "open": 3, "in_use": 1 } }, "checkout_wait": timing, "checkout_failures": { "timeout": 1 } }, "commands": { "update accounts": timing }, "transactions": { "started": 2, "committed": 1, "commit_failures": 1, "commit_retries": 1, "aborted": 0 } }
+        registry = CollectorRegistry()
+        registry.register(DatabaseCollector(lambda: stats, lambda: { "max_retries": 5, "backoff_ms": 5, "attempts": 7, "conflicts": 2, "exhausted": 0 }))
+        # when
+        samples = [s for m in registry.collect() for s in m.samples]
+        # then
+        self.assertEqual(3, registry.get_sample_value("mongo_pool_connections_open"))
+        self.assertEqual(1, registry.get_sample_value("mongo_pool_checkout_failures_total", { "reason": "timeout" }))
+        self.assertEqual(2, registry.get_sample_value("mongo_command_seconds_count", { "command": "update accounts" }))
+        self.assertEqual(1, registry.get_sample_value("mongo_transactions_total", { "event": "commit_retries" }))
+        self.assertEqual(2, registry.get_sample_value("account_save_conflicts_total"))
+        self.assertFalse([s for s in samples if "mongo1" in str(s.labels)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import copy
+import os
+import unittest
+
+import pymongo
+from unittest.mock import patch
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from app import migrations
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# just enough of a collection for recording schema versions and creating indexes
+class FakeCollection:
+    def __init__(self) -> None:
+        self.docs = []
+        self.indexes = { "_id_": { "key": [("_id", 1)] } }
+
+
+    def find_one(self, query):
+        return next((d for d in self.docs if all(d.get(k) == v for k, v in query.items())), None)
+
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None:
+            doc = dict(query)
+            self.docs.append(doc)
+        for field, value in update.get("$max", {}).items(): doc[field] = max(doc.get(field, value), value)
+        doc.update(update.get("$set", {}))
+
+
+    def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+    def index_information(self):
+        return self.indexes
+
+
+    def create_indexes(self, models):
+        for m in models:
+            self.indexes[m.document["name"]] = { "key": list(m.document["key"].items()), "unique": m.document.get("unique", False) }
+
+
+class FakeDatabase:
+    def __init__(self) -> None:
+        self.collections = {}
+
+
+    def get_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+class MigrationsTestFixture(unittest.TestCase):
+
+    def __migrations(self, runs):
+        return [(version, f"migration {version}", lambda database, version=version: runs.append(version)) for version in (1, 2, 3)]
+
+
+    def test_apply_runs_pending_migrations_in_order_and_records_the_version(self):
+        # given
+        database, runs = FakeDatabase(), []
+        # when
+        with patch.object(migrations, "MIGRATIONS", self.__migrations(runs)):
+            applied = migrations.apply(database)
+        # then
+        self.assertEqual([1, 2, 3], applied)
+        self.assertEqual([1, 2, 3], runs)
+        self.assertEqual(3, migrations.current_version(database))
+        self.assertEqual([1, 2, 3], [d["version"] for d in database.get_collection("schema_versions").docs if "description" in d])
+
+
+    def test_apply_is_idempotent_and_only_runs_newer_migrations(self):
+        # given
+        database, runs = FakeDatabase(), []
+        database.get_collection("schema_versions").update_one({ "_id": "schema" }, { "$max": { "version": 1 } }, upsert=True)
+        # when
+        with patch.object(migrations, "MIGRATIONS", self.__migrations(runs)):
+            first = migrations.apply(database)
+            second = migrations.apply(database)
+        # then
+        self.assertEqual([2, 3], first)
+        self.assertEqual([], second)
+        self.assertEqual([2, 3], runs)
+
+
+    def test_ensure_indexes_creates_only_key_patterns_that_are_missing(self):
+        # given
+        database = FakeDatabase()
+        database.get_collection("users").indexes["renamed"] = { "key": [("username", ASCENDING)], "unique": True }
+        indexes = { "users": [IndexModel([("username", ASCENDING)], name="username_unique", unique=True)], "transactions": [IndexModel([("account_id", ASCENDING), ("tx_id", DESCENDING)], name="account_tx")] }
+        # when
+        created = migrations.ensure_indexes(database, indexes)
+        again = migrations.ensure_indexes(database, indexes)
+        # then
+        self.assertEqual(["transactions.account_tx"], created)
+        self.assertEqual([], again)
+
+
+
+# the migrations that rewrite documents, run against a mongod given in TEST_DB_CONNECTION_STRING or else mongomock, and
+# skipped when there is neither. each runs twice as several workers may apply it at the same time
+@unittest.skipUnless(os.environ.get("TEST_DB_CONNECTION_STRING") or mongomock, "needs TEST_DB_CONNECTION_STRING or mongomock")
+class MigrationDocumentsTestFixture(unittest.TestCase):
+
+    def setUp(self):
+        connection = os.environ.get("TEST_DB_CONNECTION_STRING")
+        self.client = pymongo.MongoClient(connection) if connection else mongomock.MongoClient()
+        self.client.drop_database("nvelopes_tests")
+        self.database = self.client["nvelopes_tests"]
+
+
+    def __migrate(self, version):
+        migration = next(m for v, _, m in migrations.MIGRATIONS if v == version)
+        migration(self.database)
+        once = { name: self.__docs(name) for name in ("accounts", "transactions", "snapshots") }
+        migration(self.database)
+        self.assertEqual(once, { name: self.__docs(name) for name in ("accounts", "transactions", "snapshots") }, "running the migration again changed documents")
+
+
+    def __docs(self, name):
+        return list(self.database.get_collection(name).find({}, sort=[("_id", ASCENDING)]))
+
+
+    # a transaction as written when amounts were stored in major units
+    def __tx(self, account_id, tx_id, amount, balance, pay_envelopes=None):
+        return { "account_id": account_id, "owner_id": "12345", "tx_id": tx_id, "op": "DEPOSIT", "description": f"tx {tx_id}", "amount": amount, "account_balance": balance, "pay_envelopes": pay_envelopes }
+
+
+    def test_migration_2_embeds_the_newest_transactions_in_accounts_without_them(self):
+        # given
+        accounts = self.database.get_collection("accounts")
+        seeded, untouched, empty = [accounts.insert_one(doc).inserted_id for doc in ({ "owner_id": "12345" }, { "owner_id": "12345", "recent_txs": [] }, { "owner_id": "12345" })]
+        history = [self.__tx(str(seeded), i, 0.1 * i, 1.05 * i) for i in range(25)]
+        self.database.get_collection("transactions").insert_many(copy.deepcopy(history + [self.__tx(str(untouched), 0, 12.34, 12.34)]))
+        # when
+        self.__migrate(2)
+        # then
+        for tx in history: tx.pop("_id", None)
+        self.assertEqual(history[-20:], accounts.find_one({ "_id": seeded })["recent_txs"])
+        self.assertEqual([], accounts.find_one({ "_id": untouched })["recent_txs"])
+        self.assertEqual([], accounts.find_one({ "_id": empty })["recent_txs"])
+
+
+    @unittest.skipUnless(os.environ.get("TEST_DB_CONNECTION_STRING"), "mongomock doesn't evaluate the $type expression migration 4 uses")
+    def test_migration_4_converts_major_unit_doubles_to_minor_unit_integers(self):
+        # given
+        transactions = self.database.get_collection("transactions")
+        transactions.insert_many([self.__tx("a", 0, 12.34, 100.1, [{ "id": 1, "amount": 0.29 }]), self.__tx("a", 1, 5.0, 1.15), self.__tx("a", 2, 1234, 10000)])
+        self.database.get_collection("accounts").insert_one({
+            "owner_id": "12345", "balance": 2.675,
+            "envelopes": [{ "id": 0, "name": "Available", "balance": 0.07 }, { "id": 1, "name": "Shopping", "balance": 20 }],
+            "payment_sources": [{ "payer": "ACME Ltd.", "amount": 1000.5, "envelopes": [{ "id": 1, "amount": 0.57 }] }],
+            "recent_txs": [self.__tx("a", 0, 12.34, 100.1, [{ "id": 1, "amount": 0.29 }]), self.__tx("a", 1, 5.0, 1.15)]
+        })
+        self.database.get_collection("snapshots").insert_one({ "account_id": "a", "tx_id": 0, "account": { "balance": 12.34 } })
+        # when
+        self.__migrate(4)
+        # then
+        self.assertEqual([(1234, 10010, [29]), (500, 115, None), (1234, 10000, None)], [(t["amount"], t["account_balance"], t["pay_envelopes"] and [p["amount"] for p in t["pay_envelopes"]]) for t in self.__docs("transactions")])
+        account = self.__docs("accounts")[0]
+        self.assertEqual(268, account["balance"])
+        self.assertEqual([7, 2000], [e["balance"] for e in account["envelopes"]])
+        self.assertEqual((100050, [57]), (account["payment_sources"][0]["amount"], [e["amount"] for e in account["payment_sources"][0]["envelopes"]]))
+        self.assertEqual([(1234, 10010, [29]), (500, 115, None)], [(t["amount"], t["account_balance"], t["pay_envelopes"] and [p["amount"] for p in t["pay_envelopes"]]) for t in account["recent_txs"]])
+        self.assertTrue(all(isinstance(v, int) for v in (account["balance"], account["envelopes"][0]["balance"], account["recent_txs"][0]["amount"])))
+        self.assertEqual([], self.__docs("snapshots"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from decimal import Decimal
+
+from domain import money
+
+class MoneyTestFixture(unittest.TestCase):
+
+    def test_major_units_convert_exactly_to_minor_units(self):
+        # given
+        amounts = [Decimal("19.99"), "0.10", 0.29, 1005.0, 100, "-12.50"]
+        # when
+        result = [money.to_minor(a) for a in amounts]
+        # then
+        self.assertEqual([1999, 10, 29, 100500, 10000, -1250], result)
+
+
+    def test_more_than_two_decimal_places_is_rejected_rather_than_rounded(self):
+        # when
+        with self.assertRaises(ValueError) as ctx:
+            money.to_minor("10.005")
+        # then
+        self.assertEqual("invalid amount: '10.005', money has at most 2 decimal places", str(ctx.exception))
+
+
+    def test_text_that_is_not_an_amount_is_rejected(self):
+        # when
+        with self.assertRaises(ValueError) as ctx:
+            money.to_minor("1.2.3")
+        # then
+        self.assertEqual("invalid amount: '1.2.3'", str(ctx.exception))
+
+
+    def test_minor_units_are_shown_in_major_units(self):
+        # then
+        self.assertEqual(12.34, money.to_major(1234))
+        self.assertEqual(0.3, money.to_major(10 + 20))
+        self.assertEqual(Decimal("-0.01"), money.to_decimal(-1))
+        self.assertEqual("  -12.34", money.format(-1234, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
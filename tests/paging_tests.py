@@ -0,0 +1,66 @@
+import base64
+import unittest
+
+from app import paging
+from app.memory_db import MemoryDb
+from domain.account import Account
+from domain.envelope import Envelope
+
+class PagingTestFixture(unittest.TestCase):
+
+    # an account with transactions 0 (opened) to 5 saved to a new database
+    def __history(self):
+        db = MemoryDb()
+        acc = Account("12345", "MyBankName")
+        account_id = str(db.create_account(acc))
+        acc.open(account_id, "12345", 100_00)
+        db.open_account(acc)
+        db.add_envelopes(account_id, [Envelope(1, "Shopping", 0)])
+        acc = Account.from_doc(db.get_account("12345", account_id))
+        for i in range(5):
+            db.save_envelope_change(acc, acc.deposit(1, f"deposit {i}", 1_00))
+            acc = Account.from_doc(db.get_account("12345", account_id))
+        return db, account_id
+
+
+    def test_a_cursor_decodes_to_the_transaction_id_it_was_made_from(self):
+        # when
+        cursor = paging.encode_cursor(1234)
+        # then
+        self.assertNotIn("=", cursor)
+        self.assertEqual(1234, paging.decode_cursor(cursor))
+
+
+    def test_a_cursor_that_was_not_made_by_the_app_is_invalid(self):
+        # given
+        cursors = ["not a cursor!", base64.urlsafe_b64encode(b'{"tx":"12"}').decode(), base64.urlsafe_b64encode(b'{"page":1}').decode(), base64.urlsafe_b64encode(b'[1]').decode()]
+        # then
+        for cursor in cursors:
+            with self.assertRaises(ValueError, msg=cursor) as ctx:
+                paging.decode_cursor(cursor)
+            self.assertEqual("invalid cursor", str(ctx.exception))
+
+
+    def test_pages_seek_newest_first_from_the_cursor(self):
+        # given
+        db, account_id = self.__history()
+        # when
+        first = db.list_transactions("12345", account_id, None, 2)
+        second = db.list_transactions("12345", account_id, paging.decode_cursor(paging.encode_cursor(first[-1]["tx_id"])), 2)
+        # then
+        self.assertEqual([5, 4], [t["tx_id"] for t in first])
+        self.assertEqual([3, 2], [t["tx_id"] for t in second])
+
+
+    def test_page_and_size_list_oldest_first(self):
+        # given
+        db, account_id = self.__history()
+        # then
+        self.assertEqual([0, 1, 2, 3], [t["tx_id"] for t in db.get_transactions("12345", account_id, 0, 4)])
+        self.assertEqual([4, 5], [t["tx_id"] for t in db.get_transactions("12345", account_id, 1, 4)])
+        self.assertEqual([], db.get_transactions("12345", account_id, 2, 4))
+        self.assertEqual([], db.get_transactions("someone else", account_id, 0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import asyncio
+import unittest
+
+from app.memory_db import MemoryDb
+from app.replay import differences, rebuild, starting_point
+from domain.account import Account
+from domain.envelope import Envelope
+from domain.payment_source import PaymentSource
+from domain.payment_source_envelope import PaymentSourceEnvelope
+from domain.transaction import Transaction
+
+# the calls rebuild makes, awaitable like the app's database
+class AsyncMemoryDb:
+    def __init__(self, db: MemoryDb) -> None:
+        self.db = db
+        self.snapshots_saved = 0
+        self.replayed_after = []
+
+
+    async def get_account(self, owner_id, account_id):
+        return self.db.get_account(owner_id, account_id)
+
+
+    async def get_snapshot(self, account_id, until_tx_id=None):
+        return self.db.get_snapshot(account_id, until_tx_id)
+
+
+    async def iter_transactions(self, owner_id, account_id, batch_size, after_tx_id=None, until_tx_id=None):
+        self.replayed_after.append(after_tx_id)
+        for batch in self.db.iter_transactions(owner_id, account_id, batch_size, after_tx_id, until_tx_id): yield batch
+
+
+    async def save_snapshot(self, account):
+        self.snapshots_saved += 1
+        return self.db.save_snapshot(account)
+
+
+class ReplayTestFixture(unittest.TestCase):
+
+    # an account with some history, returned with the stored document and every transaction it made
+    def __history(self):
+        acc = Account("12345", "MyBankName", False)
+        acc.open("ABC1", "12345", 100_00)
+        history = [acc.last_tx.to_doc()]
+        acc.add_envelopes([Envelope(1, "Shopping", 0), Envelope(2, "Savings", 0)])
+        operations = [
+            lambda: acc.move(0, 1, "food", 40_00),
+            lambda: acc.deposit(2, "gift", 25_50),
+            lambda: acc.pay("Pay day!", PaymentSource(0, "ACME Ltd.", 1000_00, [PaymentSourceEnvelope(1, 200_00), PaymentSourceEnvelope(2, 300_00)])),
+            lambda: acc.debit(1, "groceries", 60_25),
+            lambda: acc.atm(0, "cash", 20_00),
+            lambda: acc.move(2, 0, "oops", 10_00)
+        ]
+        for operation in operations:
+            operation()
+            history.append(acc.last_tx.to_doc())
+        doc = acc.to_doc()
+        doc["_id"] = "ABC1"
+        return acc, doc, history
+
+
+    def test_replaying_the_whole_history_rebuilds_the_account(self):
+        # given
+        acc, doc, history = self.__history()
+        rebuilt = starting_point(doc)
+        # when
+        for d in history: rebuilt.replay(Transaction.from_doc(d))
+        # then
+        self.assertEqual(acc.last_tx_id, rebuilt.last_tx_id)
+        self.assertEqual(acc.balance, rebuilt.balance)
+        self.assertEqual([e.to_doc() for e in acc.list_envelopes()], [e.to_doc() for e in rebuilt.list_envelopes()])
+        self.assertEqual([t.id for t in acc.recent_transactions], [t.id for t in rebuilt.recent_transactions])
+        self.assertEqual([], differences(doc, rebuilt))
+
+
+    def test_replaying_from_a_snapshot_only_needs_the_transactions_after_it(self):
+        # given
+        acc, doc, history = self.__history()
+        partial = starting_point(doc)
+        for d in history[:4]: partial.replay(Transaction.from_doc(d))
+        snapshot = { "account_id": "ABC1", "tx_id": partial.last_tx_id, "account": partial.to_doc() }
+        # when
+        rebuilt = starting_point(doc, snapshot)
+        for d in history[4:]: rebuilt.replay(Transaction.from_doc(d))
+        # then
+        self.assertEqual(3, snapshot["tx_id"])
+        self.assertEqual([], differences(doc, rebuilt))
+
+
+    def test_replay_is_the_reverse_of_undo(self):
+        # given
+        acc, doc, history = self.__history()
+        before = [e.balance for e in acc.list_envelopes()]
+        pay = Transaction.from_doc(history[3])
+        # when
+        acc.undo(acc.last_tx)
+        acc.undo(Transaction.from_doc(history[5]))
+        acc.undo(Transaction.from_doc(history[4]))
+        acc.undo(pay)
+        for d in history[3:]: acc.replay(Transaction.from_doc(d))
+        # then
+        self.assertEqual(before, [e.balance for e in acc.list_envelopes()])
+        self.assertEqual(6, acc.last_tx_id)
+
+
+    def test_differences_reports_a_corrupted_account_document(self):
+        # given
+        acc, doc, history = self.__history()
+        doc["balance"] = 0
+        doc["envelopes"][1]["balance"] = 999_99
+        rebuilt = starting_point(doc)
+        # when
+        for d in history: rebuilt.replay(Transaction.from_doc(d))
+        found = differences(doc, rebuilt)
+        # then
+        self.assertEqual(2, len(found))
+        self.assertIn("balance is 0.00, history says 1045.25", found[0])
+        self.assertIn("envelope 1 (Shopping) is 999.99, history says 179.75", found[1])
+
+
+    def test_snapshots_are_only_saved_when_an_interval_is_given(self):
+        # given
+        db = MemoryDb()
+        acc = Account("12345", "MyBankName")
+        account_id = str(db.create_account(acc))
+        acc.open(account_id, "12345", 100_00)
+        db.open_account(acc)
+        for i in range(4):
+            acc = Account.from_doc(db.get_account("12345", account_id))
+            db.save_envelope_change(acc, acc.deposit(0, f"deposit {i}", 1_00))
+        reading, verifying = AsyncMemoryDb(db), AsyncMemoryDb(db)
+        # when
+        rebuilt = asyncio.run(rebuild(reading, "12345", account_id, 3, snapshot_interval=0))
+        asyncio.run(rebuild(verifying, "12345", account_id, None, snapshot_interval=2))
+        # then
+        self.assertEqual(103_00, rebuilt.balance)
+        self.assertEqual(0, reading.snapshots_saved)
+        self.assertEqual(3, verifying.snapshots_saved)
+        self.assertEqual(4, db.get_snapshot(account_id)["tx_id"])
+
+
+
+    def test_saves_take_snapshots_so_reading_an_account_as_it_was_starts_from_the_nearest(self):
+        # given
+        db = MemoryDb(snapshot_interval=3)
+        acc = Account("12345", "MyBankName")
+        account_id = str(db.create_account(acc))
+        acc.open(account_id, "12345", 100_00)
+        db.open_account(acc)
+        for i in range(7):
+            # through both the normal save and the fast path
+            if i % 2: db.apply_change("12345", account_id, Account.deposit_change(0, f"deposit {i}", 1_00))
+            else:
+                acc = Account.from_doc(db.get_account("12345", account_id))
+                db.save_envelope_change(acc, acc.deposit(0, f"deposit {i}", 1_00))
+        reading = AsyncMemoryDb(db)
+        # when
+        rebuilt = asyncio.run(rebuild(reading, "12345", account_id, 5, snapshot_interval=0))
+        # then
+        self.assertEqual(6, db.get_snapshot(account_id)["tx_id"])
+        self.assertEqual(3, db.get_snapshot(account_id, 5)["tx_id"])
+        self.assertEqual([3], reading.replayed_after)
+        self.assertEqual(5, rebuilt.last_tx_id)
+        self.assertEqual(105_00, rebuilt.balance)
+        self.assertEqual(0, reading.snapshots_saved)
+
+
+if __name__ == '__main__':
+    unittest.main()
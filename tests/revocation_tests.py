@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from calendar import timegm
+from datetime import datetime, timedelta
+from app.revocation import RevocationList
+
+# the users collection as get_revoked_users returns it
+class RevokedUsers:
+    def __init__(self, docs: list) -> None:
+        self.docs = docs
+        self.since = None
+
+
+    async def get_revoked_users(self, since):
+        self.since = since
+        return self.docs
+
+
+class RevocationTestFixture(unittest.TestCase):
+
+    LOGOUT = datetime(2021, 7, 10, 12, 0, 0)
+    LOGOUT_EPOCH = timegm(LOGOUT.utctimetuple())
+
+    def __refreshed(self, docs: list) -> RevocationList:
+        revocations = RevocationList(RevokedUsers(docs), 60, timedelta(minutes=30))
+        asyncio.run(revocations.refresh())
+        return revocations
+
+
+    def test_tokens_issued_up_to_the_logout_second_are_revoked(self):
+        # given
+        revocations = self.__refreshed([{ "_id": "u1", "tokens_revoked_at": self.LOGOUT }])
+        # then
+        self.assertTrue(revocations.is_revoked("u1", self.LOGOUT_EPOCH - 60))
+        self.assertTrue(revocations.is_revoked("u1", self.LOGOUT_EPOCH))
+        self.assertFalse(revocations.is_revoked("u1", self.LOGOUT_EPOCH + 1))
+        self.assertFalse(revocations.is_revoked("u2", self.LOGOUT_EPOCH - 60))
+
+
+    def test_every_token_of_a_disabled_user_is_revoked(self):
+        # given
+        revocations = self.__refreshed([{ "_id": "u1", "disabled": True, "tokens_revoked_at": self.LOGOUT }])
+        # then
+        self.assertTrue(revocations.is_revoked("u1", self.LOGOUT_EPOCH + 3600))
+        self.assertTrue(revocations.is_revoked("u1", None))
+
+
+    def test_refresh_replaces_the_list(self):
+        # given
+        users = RevokedUsers([{ "_id": "u1", "disabled": True }])
+        revocations = RevocationList(users, 60, timedelta(minutes=30))
+        asyncio.run(revocations.refresh())
+        revocations.revoke("u2", self.LOGOUT)
+        # when
+        users.docs = [{ "_id": "u3", "tokens_revoked_at": self.LOGOUT }]
+        asyncio.run(revocations.refresh())
+        # then
+        self.assertFalse(revocations.is_revoked("u1", self.LOGOUT_EPOCH))
+        self.assertFalse(revocations.is_revoked("u2", self.LOGOUT_EPOCH))
+        self.assertTrue(revocations.is_revoked("u3", self.LOGOUT_EPOCH))
+
+
+    def test_a_local_revocation_applies_before_the_next_refresh(self):
+        # given
+        revocations = self.__refreshed([])
+        # when
+        revocations.revoke("u1", self.LOGOUT)
+        # then
+        self.assertTrue(revocations.is_revoked("u1", self.LOGOUT_EPOCH))
+
+
+
+    def test_logging_in_again_straight_after_logging_out_is_allowed(self):
+        # given
+        logout = self.LOGOUT.replace(microsecond=250_000)
+        revocations = self.__refreshed([])
+        # when
+        revocations.revoke("u1", logout)
+        # then
+        self.assertTrue(revocations.is_revoked("u1", self.LOGOUT_EPOCH + 0.249))
+        self.assertFalse(revocations.is_revoked("u1", self.LOGOUT_EPOCH + 0.251))
+        # when the logout is read back from the database
+        revocations = self.__refreshed([{ "_id": "u1", "tokens_revoked_at": logout }])
+        # then
+        self.assertTrue(revocations.is_revoked("u1", self.LOGOUT_EPOCH + 0.249))
+        self.assertFalse(revocations.is_revoked("u1", self.LOGOUT_EPOCH + 0.251))
+
+
+    def test_refresh_only_reads_logouts_that_unexpired_tokens_can_predate(self):
+        # given
+        users = RevokedUsers([])
+        revocations = RevocationList(users, 60, timedelta(minutes=30))
+        # when
+        before = datetime.utcnow()
+        asyncio.run(revocations.refresh())
+        # then
+        self.assertLessEqual(before - timedelta(minutes=30), users.since)
+        self.assertLessEqual(users.since, datetime.utcnow() - timedelta(minutes=30))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime
+
+from app.statements import Rules, read_csv, read_ofx
+
+class StatementTestFixture(unittest.TestCase):
+
+    def test_csv_lines_are_read_with_a_signed_amount_column(self):
+        # given
+        lines = ["Date,Description,Amount", "01/07/2021,TESCO STORES,-12.50", "02/07/2021,ACME SALARY,\"1,500.00\""]
+        # when
+        result = list(read_csv(lines))
+        # then
+        self.assertEqual(2, len(result))
+        self.assertEqual((0, datetime(2021, 7, 1), "TESCO STORES", -12_50), result[0][:4])
+        self.assertEqual((1, datetime(2021, 7, 2), "ACME SALARY", 1500_00), result[1][:4])
+
+
+    def test_csv_lines_are_read_with_separate_debit_and_credit_columns(self):
+        # given
+        lines = ["Posted,Payee,Paid out,Paid in", "2021-07-01,SHELL,40.00,", "2021-07-02,REFUND,,5.00"]
+        # when
+        result = list(read_csv(lines, "Posted", "Payee", debit_column="Paid out", credit_column="Paid in", date_format="%Y-%m-%d"))
+        # then
+        self.assertEqual(-40_00, result[0].amount)
+        self.assertEqual(5_00, result[1].amount)
+
+
+    def test_csv_reports_the_file_line_of_a_bad_amount(self):
+        # given
+        lines = ["Date,Description,Amount", "01/07/2021,TESCO,-1.00", "01/07/2021,SHELL,n/a"]
+        # when
+        with self.assertRaises(ValueError) as ctx:
+            list(read_csv(lines))
+        # then
+        self.assertEqual("line 3: invalid amount: 'n/a'", str(ctx.exception))
+
+
+    def test_ofx_sgml_transactions_are_read_without_closing_tags(self):
+        # given
+        lines = ["OFXHEADER:100", "<OFX><BANKTRANLIST>", "<STMTTRN>", "<TRNTYPE>DEBIT", "<DTPOSTED>20210701120000", "<TRNAMT>-9.99", "<FITID>A1", "<NAME>NETFLIX", "</STMTTRN>", "<STMTTRN><TRNAMT>100.00<DTPOSTED>20210702<FITID>A2<MEMO>INTEREST</STMTTRN>", "</BANKTRANLIST></OFX>"]
+        # when
+        result = list(read_ofx(lines))
+        # then
+        self.assertEqual((0, datetime(2021, 7, 1), "NETFLIX", -9_99, "A1"), tuple(result[0]))
+        self.assertEqual((1, datetime(2021, 7, 2), "INTEREST", 100_00, "A2"), tuple(result[1]))
+
+
+    def test_ofx_xml_transactions_are_read(self):
+        # given
+        lines = ["<?xml version=\"1.0\"?>", "<OFX><STMTTRN><DTPOSTED>20210703</DTPOSTED><TRNAMT>-2.50</TRNAMT><FITID>B1</FITID><NAME>COFFEE</NAME></STMTTRN></OFX>"]
+        # when
+        result = list(read_ofx(lines))
+        # then
+        self.assertEqual(1, len(result))
+        self.assertEqual(("COFFEE", -2_50, "B1"), (result[0].payee, result[0].amount, result[0].reference))
+
+
+    def test_rules_match_the_first_pattern_and_fall_back_to_the_default_envelope(self):
+        # given
+        rules = Rules.from_doc({ "default_envelope_id": 3, "rules": [{ "pattern": "tesco|sainsbury", "envelope_id": 1 }, { "pattern": "^shell", "envelope_id": 2 }] })
+        # when
+        matches = [rules.match(p) for p in ["TESCO STORES 123", "SHELL PETROL", "PAYPAL *SHELL"]]
+        # then
+        self.assertEqual([1, 2, 3], matches)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from app import views
+
+class ViewsTestFixture(unittest.TestCase):
+
+    def __doc(self):
+        return { "_id": "ABC1", "name": "MyBankName", "balance": 100_00, "last_tx_id": 7,
+                 "envelopes": [{ "id": 0, "name": "Available", "balance": 60_00 }, { "id": 1, "name": "Shopping", "balance": 40_00 }],
+                 "payment_sources": [{ "id": 0, "payer": "ACME Ltd.", "amount": 500_00, "envelopes": [{ "id": 1, "amount": 100_00 }] }] }
+
+
+    def test_account_shows_only_the_fields_asked_for_and_reads_only_those(self):
+        # given
+        names = views.account_fields("balance, last_tx_id,balance")
+        # when
+        view = views.account("ABC1", self.__doc(), names)
+        # then
+        self.assertEqual(["balance", "last_tx_id"], views.stored_fields(names))
+        self.assertEqual({ "account_id": "ABC1", "balance": 100.0, "last_tx_id": 7 }, view)
+
+
+    def test_account_without_fields_shows_the_default_ones(self):
+        # when
+        names = views.account_fields(None)
+        view = views.account("ABC1", self.__doc(), names)
+        # then
+        self.assertEqual(["name", "balance", "envelopes", "payment_sources"], views.stored_fields(names))
+        self.assertEqual([{ "id": 0, "name": "Available", "balance": 60.0 }, { "id": 1, "name": "Shopping", "balance": 40.0 }], view["envelopes"])
+        self.assertEqual([{ "id": 0, "payer": "ACME Ltd.", "amount": 500.0, "envelopes": [{ "id": 1, "amount": 100.0 }] }], view["paysources"])
+
+
+    def test_unknown_fields_are_rejected(self):
+        # when
+        with self.assertRaises(ValueError) as ctx:
+            views.account_fields("balance,password")
+        # then
+        self.assertIn("unknown fields ['password']", str(ctx.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()